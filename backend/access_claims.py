@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g, session
+from sqlalchemy import select
+from models import storage_layer, PersonEntity
+from commit_hooks import defer_until_commit
+
+ACCESS_CLAIM_TTL_SECONDS = 30
+ACCESS_REGISTRY_MAX_ENTRIES = 100000
+UNSET = object()
+
+
+class AccessVersionRegistry:
+    # Latest access_version per user as seen by this process. A session whose
+    # claim carries the same version can be trusted without loading the user.
+    # Entries expire so changes made through other workers are picked up
+    # within ACCESS_CLAIM_TTL_SECONDS, and the least recently used ones are
+    # dropped beyond max_entries; a dropped user is simply read again.
+
+    def __init__(self, max_entries=ACCESS_REGISTRY_MAX_ENTRIES):
+        self.lock = threading.Lock()
+        self.versions = OrderedDict()
+        self.max_entries = max_entries
+
+    def current_version(self, user_id):
+        with self.lock:
+            cached = self.versions.get(user_id)
+            if cached is not None:
+                if time.monotonic() - cached[1] < ACCESS_CLAIM_TTL_SECONDS:
+                    self.versions.move_to_end(user_id)
+                    return cached[0]
+                del self.versions[user_id]
+
+        version = storage_layer.session.execute(
+            select(PersonEntity.access_version).where(PersonEntity.user_id == user_id)
+        ).scalar_one_or_none()
+        self.remember(user_id, version)
+        return version
+
+    def remember(self, user_id, version):
+        with self.lock:
+            self.versions[user_id] = (version, time.monotonic())
+            self.versions.move_to_end(user_id)
+            while len(self.versions) > self.max_entries:
+                self.versions.popitem(last=False)
+
+    def revoke(self, user_id):
+        self.remember(user_id, None)
+
+
+access_registry = AccessVersionRegistry()
+
+
+def issue_access_claim(person):
+    session['user_id'] = person.user_id
+    session['role'] = person.role
+    session['access_version'] = person.access_version or 0
+    access_registry.remember(person.user_id, person.access_version or 0)
+
+
+def current_person():
+    cached = g.get('current_person', UNSET)
+    if cached is UNSET:
+        cached = PersonEntity.query.get(session['user_id']) if 'user_id' in session else None
+        g.current_person = cached
+    return cached
+
+
+def resolve_session_role():
+    cached = g.get('session_role', UNSET)
+    if cached is not UNSET:
+        return cached
+
+    role = None
+    if 'user_id' in session:
+        version = access_registry.current_version(session['user_id'])
+        if version is not None and session.get('role') and session.get('access_version') == version:
+            role = session['role']
+        else:
+            person = current_person()
+            if person is not None:
+                issue_access_claim(person)
+                role = person.role
+
+    g.session_role = role
+    return role
+
+
+def invalidate_access_claims(person):
+    person.access_version = (person.access_version or 0) + 1
+    defer_until_commit(access_registry.remember, person.user_id, person.access_version)
+
+
+def revoke_access_claims(user_id):
+    defer_until_commit(access_registry.revoke, user_id)
@@ -0,0 +1,33 @@
+import threading
+import time
+from sqlalchemy import select
+from models import storage_layer, InteractiveActivity
+
+CATALOG_CACHE_SECONDS = 60
+
+
+class ActivityCatalogCache:
+    # game_id -> points_per_play, reloaded when an activity is created in this
+    # process and at most every CATALOG_CACHE_SECONDS otherwise.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.points_by_game = {}
+        self.loaded_at = None
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def points_table(self):
+        with self.lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= CATALOG_CACHE_SECONDS:
+                rows = storage_layer.session.execute(
+                    select(InteractiveActivity.game_id, InteractiveActivity.points_per_play)
+                ).all()
+                self.points_by_game = {row.game_id: row.points_per_play or 0 for row in rows}
+                self.loaded_at = time.monotonic()
+            return self.points_by_game
+
+
+activity_catalog = ActivityCatalogCache()
@@ -2,6 +2,11 @@ import os
 from flask import Flask
 from flask_cors import CORS
 from models import storage_layer
+from credential_pool import credential_pool
+from response_cache import response_cache
+from live_events import live_hub
+import instrumentation
+import engine_config
 from datetime import timedelta
 
 web_application = Flask(__name__, static_folder='../frontend', static_url_path='')
@@ -15,9 +20,39 @@ web_application.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
     'sqlite:///../gamified_elearning.db'
 )
 web_application.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+web_application.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_config.engine_options(
+    web_application.config['SQLALCHEMY_DATABASE_URI']
+)
+web_application.config['SQLALCHEMY_BINDS'] = engine_config.replica_binds(os.environ.get('DATABASE_REPLICA_URL'))
+web_application.config['REPLICA_STICKY_SECONDS'] = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+web_application.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+web_application.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
 web_application.config['FILE_STORAGE_PATH'] = os.path.join(os.path.dirname(__file__), '../uploads')
 web_application.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+web_application.config['CHUNKED_UPLOAD_MAX_BYTES'] = int(os.environ.get('CHUNKED_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))
+web_application.config['ASSET_OFFLOAD'] = os.environ.get('ASSET_OFFLOAD', '').lower()
+web_application.config['ASSET_OFFLOAD_PREFIX'] = os.environ.get('ASSET_OFFLOAD_PREFIX', '/protected-uploads')
+web_application.config['PLAY_HISTORY_HOT_DAYS'] = int(os.environ.get('PLAY_HISTORY_HOT_DAYS', 90))
+web_application.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+web_application.config['RESPONSE_CACHE_URL'] = os.environ.get('RESPONSE_CACHE_URL')
+web_application.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+web_application.config['LIVE_EVENTS_URL'] = os.environ.get('LIVE_EVENTS_URL')
+web_application.config['STANDINGS_RESEED_SECONDS'] = float(os.environ.get('STANDINGS_RESEED_SECONDS', 60))
+web_application.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+web_application.config['PROFILE_SLOW_REQUESTS_MS'] = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+web_application.config['PROFILE_OUTPUT_DIR'] = os.environ.get('PROFILE_OUTPUT_DIR')
+web_application.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 web_application.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+web_application.config['BCRYPT_ROUNDS'] = int(os.environ.get('BCRYPT_ROUNDS', 12))
+web_application.config['CREDENTIAL_POOL_SIZE'] = int(os.environ.get('CREDENTIAL_POOL_SIZE', os.cpu_count() or 1))
+web_application.config['CREDENTIAL_QUEUE_DEPTH'] = int(os.environ.get(
+    'CREDENTIAL_QUEUE_DEPTH',
+    web_application.config['CREDENTIAL_POOL_SIZE'] * 4
+))
+web_application.config['ROSTER_IMPORT_BCRYPT_ROUNDS'] = int(os.environ.get(
+    'ROSTER_IMPORT_BCRYPT_ROUNDS',
+    web_application.config['BCRYPT_ROUNDS']
+))
 
 os.makedirs(web_application.config['FILE_STORAGE_PATH'], exist_ok=True)
 os.makedirs(os.path.join(web_application.config['FILE_STORAGE_PATH'], 'profiles'), exist_ok=True)
@@ -25,12 +60,40 @@ os.makedirs(os.path.join(web_application.config['FILE_STORAGE_PATH'], 'coursewor
 os.makedirs(os.path.join(web_application.config['FILE_STORAGE_PATH'], 'submissions'), exist_ok=True)
 
 storage_layer.init_app(web_application)
+engine_config.init_app(web_application)
+credential_pool.init_app(web_application)
+response_cache.init_app(web_application)
+live_hub.init_app(web_application)
+instrumentation.init_app(web_application)
 
 from routes import *
+from standings_board import standings_board
+import schema_migrations
+import query_plan_audit
+import highscore_board
+import asset_store
+import job_queue
+import milestone_rules
+import point_buckets
+import play_history
+import platform_stats
+
+schema_migrations.init_app(web_application)
+query_plan_audit.init_app(web_application)
+highscore_board.init_app(web_application)
+asset_store.init_app(web_application)
+job_queue.init_app(web_application)
+milestone_rules.init_app(web_application)
+point_buckets.init_app(web_application)
+play_history.init_app(web_application)
+platform_stats.init_app(web_application)
+standings_board.init_app(web_application)
 
 if __name__ == '__main__':
     with web_application.app_context():
         storage_layer.create_all()
+        schema_migrations.apply_pending_migrations()
+        standings_board.ensure_seeded()
     
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     web_application.run(host='0.0.0.0', port=5000, debug=debug_mode)
\ No newline at end of file
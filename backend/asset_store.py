@@ -0,0 +1,317 @@
+import hashlib
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import click
+from flask import current_app, request, send_file
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+from models import storage_layer, StoredBlob, ChunkedUpload
+from commit_hooks import defer_until_commit, undo_on_rollback
+
+STREAM_CHUNK_BYTES = 256 * 1024
+ASSET_SUBFOLDERS = ('profiles', 'coursework', 'submissions')
+BLOB_URL_PATTERN = re.compile(r'^/uploads/(?P<subfolder>[a-z]+)/(?P<digest>[0-9a-f]{64})/(?P<name>[^/]+)$')
+BLOB_CACHE_SECONDS = 365 * 24 * 3600
+LEGACY_CACHE_SECONDS = 3600
+OFFLOAD_HEADERS = {'x-accel': 'X-Accel-Redirect', 'x-sendfile': 'X-Sendfile'}
+
+
+class UnknownChunkedUpload(Exception):
+    pass
+
+
+class ChunkOffsetMoved(Exception):
+    pass
+
+
+def storage_root():
+    return current_app.config['FILE_STORAGE_PATH']
+
+
+def blob_path(digest):
+    return os.path.join(storage_root(), 'blobs', digest[:2], digest)
+
+
+def thumbnail_dir(digest):
+    return os.path.join(storage_root(), 'thumbnails', digest)
+
+
+def partial_path(upload_id):
+    return os.path.join(storage_root(), 'partial', upload_id)
+
+
+def blob_url(subfolder_name, digest, original_name):
+    return f'/uploads/{subfolder_name}/{digest}/{secure_filename(original_name) or "file"}'
+
+
+def parse_blob_url(asset_url):
+    matched = BLOB_URL_PATTERN.match(asset_url or '')
+    return matched.groupdict() if matched else None
+
+
+def retain_blob(digest, byte_size):
+    claimed = storage_layer.session.execute(
+        update(StoredBlob).where(StoredBlob.digest == digest).values(
+            ref_count=StoredBlob.ref_count + 1, released_at=None
+        ).execution_options(synchronize_session=False)
+    )
+    if claimed.rowcount:
+        return
+
+    try:
+        with storage_layer.session.begin_nested():
+            storage_layer.session.add(StoredBlob(digest=digest, byte_size=byte_size, ref_count=1))
+    except IntegrityError:
+        storage_layer.session.execute(
+            update(StoredBlob).where(StoredBlob.digest == digest).values(
+                ref_count=StoredBlob.ref_count + 1, released_at=None
+            ).execution_options(synchronize_session=False)
+        )
+
+
+def release_asset(asset_url):
+    # Blobs whose count drops to zero stay on disk until prune_released_blobs
+    # runs, so an upload of the same content in the meantime can revive them.
+    parsed = parse_blob_url(asset_url)
+    if parsed is None:
+        return
+    storage_layer.session.execute(
+        update(StoredBlob).where(StoredBlob.digest == parsed['digest'], StoredBlob.ref_count > 0).values(
+            ref_count=StoredBlob.ref_count - 1, released_at=datetime.utcnow()
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def move_into_store(staged_path, digest):
+    destination = blob_path(digest)
+    if os.path.exists(destination):
+        os.remove(staged_path)
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(staged_path, destination)
+
+
+def adopt_into_store(staged_path, digest, byte_size):
+    # The file stays under partial/ until the transaction holding the blob
+    # reference commits, so a rolled back upload never leaves a blob behind.
+    retain_blob(digest, byte_size)
+    if os.path.exists(blob_path(digest)):
+        os.remove(staged_path)
+    else:
+        defer_until_commit(move_into_store, staged_path, digest)
+
+
+def discard_staged_file(staged_path):
+    if os.path.exists(staged_path):
+        os.remove(staged_path)
+
+
+def ingest_stream(source_stream, subfolder_name, original_name):
+    partial_dir = os.path.join(storage_root(), 'partial')
+    os.makedirs(partial_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    byte_size = 0
+
+    descriptor, temp_path = tempfile.mkstemp(dir=partial_dir, prefix='stream_')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            while True:
+                chunk = source_stream.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                temp_file.write(chunk)
+                byte_size += len(chunk)
+        digest = hasher.hexdigest()
+        undo_on_rollback(discard_staged_file, temp_path)
+        adopt_into_store(temp_path, digest, byte_size)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return blob_url(subfolder_name, digest, original_name)
+
+
+def open_chunked_upload(user_id, subfolder_name, original_name, total_size):
+    os.makedirs(os.path.join(storage_root(), 'partial'), exist_ok=True)
+    pending = ChunkedUpload(
+        upload_id=hashlib.sha256(os.urandom(32)).hexdigest(),
+        user_id=user_id,
+        subfolder=subfolder_name,
+        original_name=original_name,
+        total_size=total_size,
+        received_size=0
+    )
+    open(partial_path(pending.upload_id), 'wb').close()
+    storage_layer.session.add(pending)
+    return pending
+
+
+def append_chunk(pending, source_stream):
+    # Returns False if the body would run past the declared size; the bytes
+    # written so far are discarded so the client can resume from received_size.
+    # Raises ChunkOffsetMoved when another request advanced the upload first.
+    offset = pending.received_size
+    with open(partial_path(pending.upload_id), 'r+b') as partial_file:
+        partial_file.seek(offset)
+        written = 0
+        while True:
+            chunk = source_stream.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            if offset + written + len(chunk) > pending.total_size:
+                partial_file.truncate(offset)
+                return False
+            partial_file.write(chunk)
+            written += len(chunk)
+        partial_file.truncate(offset + written)
+
+    advanced = storage_layer.session.execute(
+        update(ChunkedUpload).where(
+            ChunkedUpload.upload_id == pending.upload_id, ChunkedUpload.received_size == offset
+        ).values(received_size=ChunkedUpload.received_size + written)
+    )
+    if not advanced.rowcount:
+        raise ChunkOffsetMoved(pending.upload_id)
+    if pending.received_size == pending.total_size:
+        finish_chunked_upload(pending)
+    return True
+
+
+def finish_chunked_upload(pending):
+    hasher = hashlib.sha256()
+    with open(partial_path(pending.upload_id), 'rb') as partial_file:
+        while True:
+            chunk = partial_file.read(STREAM_CHUNK_BYTES)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    adopt_into_store(partial_path(pending.upload_id), digest, pending.total_size)
+    pending.file_url = blob_url(pending.subfolder, digest, pending.original_name)
+
+
+def claim_chunked_upload(upload_id, user_id, subfolder_name):
+    # The completed upload already holds one reference to its blob; claiming
+    # hands that reference over to the record that stores the returned URL.
+    pending = storage_layer.session.get(ChunkedUpload, upload_id)
+    if (pending is None or pending.user_id != user_id or pending.subfolder != subfolder_name
+            or pending.file_url is None):
+        raise UnknownChunkedUpload(upload_id)
+    storage_layer.session.delete(pending)
+    return pending.file_url
+
+
+def prune_released_blobs(grace_period):
+    cutoff = datetime.utcnow() - grace_period
+    abandoned = storage_layer.session.execute(
+        select(ChunkedUpload).where(ChunkedUpload.created_at < cutoff)
+    ).scalars().all()
+    for pending in abandoned:
+        if pending.file_url:
+            release_asset(pending.file_url)
+        elif os.path.exists(partial_path(pending.upload_id)):
+            os.remove(partial_path(pending.upload_id))
+        storage_layer.session.delete(pending)
+    storage_layer.session.commit()
+
+    released = storage_layer.session.execute(
+        select(StoredBlob.digest).where(StoredBlob.ref_count <= 0, StoredBlob.released_at < cutoff)
+    ).scalars().all()
+    for digest in released:
+        removed = storage_layer.session.execute(
+            delete(StoredBlob).where(StoredBlob.digest == digest, StoredBlob.ref_count <= 0)
+        )
+        storage_layer.session.commit()
+        if removed.rowcount and os.path.exists(blob_path(digest)):
+            os.remove(blob_path(digest))
+            shutil.rmtree(thumbnail_dir(digest), ignore_errors=True)
+
+    return len(abandoned), len(released)
+
+
+class AssetAwareSessionInterface(SecureCookieSessionInterface):
+    # Refreshing the permanent session cookie would add Set-Cookie and
+    # Vary: Cookie to every asset response and defeat shared caching.
+
+    def save_session(self, app, session, response):
+        if request.endpoint == 'deliver_asset' and not session.modified:
+            return
+        super().save_session(app, session, response)
+
+
+def offloaded_response(file_path, mimetype, etag, max_age):
+    offload_mode = current_app.config['ASSET_OFFLOAD']
+    if offload_mode == 'x-accel':
+        relative_path = os.path.relpath(file_path, storage_root()).replace(os.sep, '/')
+        target = current_app.config['ASSET_OFFLOAD_PREFIX'].rstrip('/') + '/' + relative_path
+    else:
+        target = os.path.abspath(file_path)
+
+    response = current_app.response_class(mimetype=mimetype)
+    response.headers[OFFLOAD_HEADERS[offload_mode]] = target
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        del response.headers[OFFLOAD_HEADERS[offload_mode]]
+    return response
+
+
+def send_cached_file(file_path, mimetype, etag, max_age, download_name=None, immutable=False):
+    if current_app.config['ASSET_OFFLOAD']:
+        response = offloaded_response(file_path, mimetype or 'application/octet-stream', etag, max_age)
+    else:
+        response = send_file(file_path, mimetype=mimetype, download_name=download_name,
+                             etag=etag, max_age=max_age, conditional=True)
+    response.cache_control.immutable = immutable or None
+    return response
+
+
+def deliver_stored_asset(asset_path):
+    # Blob URLs name their content, so they can be cached for good and use
+    # the digest as a strong ETag. Files from before the blob store only get
+    # a stat-based ETag and a short lifetime.
+    mimetype = mimetypes.guess_type(asset_path)[0]
+    stored_blob = parse_blob_url('/uploads/' + asset_path)
+    if stored_blob:
+        file_path = blob_path(stored_blob['digest'])
+        if not os.path.isfile(file_path):
+            raise NotFound()
+        return send_cached_file(file_path, mimetype, stored_blob['digest'], BLOB_CACHE_SECONDS,
+                                download_name=stored_blob['name'], immutable=True)
+
+    if asset_path.split('/', 1)[0] not in ASSET_SUBFOLDERS:
+        raise NotFound()
+    file_path = safe_join(storage_root(), asset_path)
+    if file_path is None or not os.path.isfile(file_path):
+        raise NotFound()
+    file_stat = os.stat(file_path)
+    return send_cached_file(file_path, mimetype, f'{int(file_stat.st_mtime)}-{file_stat.st_size}',
+                            LEGACY_CACHE_SECONDS)
+
+
+def init_app(app):
+    if app.config['ASSET_OFFLOAD'] and app.config['ASSET_OFFLOAD'] not in OFFLOAD_HEADERS:
+        raise ValueError("ASSET_OFFLOAD must be 'x-accel' or 'x-sendfile'")
+    app.session_interface = AssetAwareSessionInterface()
+
+    os.makedirs(os.path.join(app.config['FILE_STORAGE_PATH'], 'blobs'), exist_ok=True)
+    os.makedirs(os.path.join(app.config['FILE_STORAGE_PATH'], 'partial'), exist_ok=True)
+
+    @app.cli.command('prune-blobs')
+    @click.option('--grace-hours', default=24, show_default=True, help='Keep released blobs this long.')
+    def prune_blobs_command(grace_hours):
+        """Delete unreferenced blobs and abandoned chunked uploads."""
+        uploads, blobs = prune_released_blobs(timedelta(hours=grace_hours))
+        click.echo(f'Removed {uploads} abandoned upload(s) and {blobs} unreferenced blob(s)')
@@ -0,0 +1,93 @@
+import os
+import re
+import tempfile
+from PIL import Image, ImageOps
+from sqlalchemy import select
+from werkzeug.exceptions import NotFound
+from models import storage_layer, PersonEntity
+from asset_store import parse_blob_url, blob_path, thumbnail_dir, send_cached_file, BLOB_CACHE_SECONDS
+from job_queue import job_handler, enqueue_job
+
+THUMBNAIL_SIZES = (48, 128, 512)
+LEADERBOARD_THUMBNAIL_SIZE = 48
+PROFILE_THUMBNAIL_SIZE = 128
+THUMBNAIL_PATTERN = re.compile(r'^thumbnails/(?P<digest>[0-9a-f]{64})/(?P<size>\d+)\.webp$')
+FAILED_RENDER_MARKER = 'render-failed'
+
+
+def thumbnail_url(asset_url, size):
+    # Only profile pictures in the blob store have derivatives; anything else,
+    # including avatars uploaded before the store existed, keeps its URL.
+    stored_blob = parse_blob_url(asset_url)
+    if stored_blob is None or stored_blob['subfolder'] != 'profiles':
+        return asset_url
+    return f"/uploads/thumbnails/{stored_blob['digest']}/{size}.webp"
+
+
+def render_thumbnails(source_path, target_dir, sizes):
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        with Image.open(source_path) as original:
+            original.draft('RGB', (max(sizes), max(sizes)))
+            upright = ImageOps.exif_transpose(original)
+            if upright.mode not in ('RGB', 'RGBA'):
+                upright = upright.convert('RGBA' if 'transparency' in upright.info else 'RGB')
+            for size in sizes:
+                variant = ImageOps.fit(upright, (size, size), Image.LANCZOS)
+                descriptor, temp_path = tempfile.mkstemp(dir=target_dir, suffix='.tmp')
+                with os.fdopen(descriptor, 'wb') as temp_file:
+                    variant.save(temp_file, 'WEBP', quality=82, method=4)
+                os.replace(temp_path, os.path.join(target_dir, f'{size}.webp'))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Blobs never change, so a source that failed once fails every time.
+        open(os.path.join(target_dir, FAILED_RENDER_MARKER), 'a').close()
+        return False
+    return True
+
+
+def render_failed_before(digest):
+    return os.path.exists(os.path.join(thumbnail_dir(digest), FAILED_RENDER_MARKER))
+
+
+def is_profile_picture(digest):
+    return storage_layer.session.execute(
+        select(PersonEntity.user_id).where(
+            PersonEntity.profile_picture.like(f'/uploads/profiles/{digest}/%')
+        ).limit(1)
+    ).first() is not None
+
+
+@job_handler('thumbnails.render')
+def render_stored_thumbnails(digest):
+    source_path = blob_path(digest)
+    if os.path.isfile(source_path) and not render_failed_before(digest):
+        render_thumbnails(source_path, thumbnail_dir(digest), THUMBNAIL_SIZES)
+
+
+def schedule_thumbnails(asset_url):
+    stored_blob = parse_blob_url(asset_url)
+    if stored_blob is None or stored_blob['subfolder'] != 'profiles':
+        return
+    digest = stored_blob['digest']
+    if all(os.path.exists(os.path.join(thumbnail_dir(digest), f'{size}.webp')) for size in THUMBNAIL_SIZES):
+        return
+    enqueue_job('thumbnails.render', {'digest': digest}, idempotency_key=f'thumbnails:{digest}')
+
+
+def deliver_thumbnail(asset_path):
+    matched = THUMBNAIL_PATTERN.match(asset_path)
+    if matched is None or int(matched['size']) not in THUMBNAIL_SIZES:
+        raise NotFound()
+
+    digest, size = matched['digest'], int(matched['size'])
+    variant_path = os.path.join(thumbnail_dir(digest), f'{size}.webp')
+    if not os.path.isfile(variant_path):
+        # Only avatars get derivatives; coursework and submission blobs, and
+        # sources that could not be decoded before, are never rendered here.
+        source_path = blob_path(digest)
+        if not os.path.isfile(source_path) or render_failed_before(digest) or not is_profile_picture(digest):
+            raise NotFound()
+        if not render_thumbnails(source_path, thumbnail_dir(digest), [size]):
+            raise NotFound()
+
+    return send_cached_file(variant_path, 'image/webp', f'{digest}-{size}', BLOB_CACHE_SECONDS, immutable=True)
@@ -0,0 +1,43 @@
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import storage_layer
+
+PENDING_CALLBACKS_KEY = 'after_commit_callbacks'
+ROLLBACK_CALLBACKS_KEY = 'after_rollback_callbacks'
+
+
+def defer_until_commit(callback, *positional_args):
+    storage_layer.session.info.setdefault(PENDING_CALLBACKS_KEY, []).append((callback, positional_args))
+
+
+def undo_on_rollback(callback, *positional_args):
+    storage_layer.session.info.setdefault(ROLLBACK_CALLBACKS_KEY, []).append((callback, positional_args))
+
+
+def run_callbacks(pending):
+    for callback, positional_args in pending:
+        try:
+            callback(*positional_args)
+        except Exception:
+            current_app.logger.exception('Transaction callback %s failed', getattr(callback, '__qualname__', callback))
+
+
+@event.listens_for(Session, 'after_commit')
+def run_deferred_callbacks(db_session):
+    # The data is already committed, so a failing side effect (a relay
+    # publish, a cache update) is logged and the remaining callbacks still run.
+    # Releasing or rolling back a SAVEPOINT fires these events as well; only
+    # the outermost transaction counts.
+    if db_session.in_nested_transaction():
+        return
+    db_session.info.pop(ROLLBACK_CALLBACKS_KEY, None)
+    run_callbacks(db_session.info.pop(PENDING_CALLBACKS_KEY, []))
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_deferred_callbacks(db_session):
+    if db_session.in_nested_transaction():
+        return
+    db_session.info.pop(PENDING_CALLBACKS_KEY, None)
+    run_callbacks(db_session.info.pop(ROLLBACK_CALLBACKS_KEY, []))
@@ -0,0 +1,144 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+DEFAULT_BCRYPT_ROUNDS = 12
+BULK_HASH_BATCH_SIZE = 25
+
+
+class CredentialPoolSaturated(Exception):
+    pass
+
+
+def hash_credential(raw_credential, rounds):
+    salt_bytes = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(raw_credential.encode('utf-8'), salt_bytes).decode('utf-8')
+
+
+def hash_credentials(raw_credentials, rounds):
+    return [hash_credential(raw_credential, rounds) for raw_credential in raw_credentials]
+
+
+def check_credential(raw_credential, stored_hash):
+    return bcrypt.checkpw(raw_credential.encode('utf-8'), stored_hash.encode('utf-8'))
+
+
+def credential_cost(stored_hash):
+    try:
+        return int(stored_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class CredentialWorkerPool:
+    # bcrypt runs in a bounded process pool so a burst of sign-ins cannot pin
+    # every request thread. Callers beyond the queue depth are rejected
+    # straight away instead of waiting behind the burst. A pool size of 0
+    # hashes on the calling thread.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pool_size = 0
+        self.rounds = DEFAULT_BCRYPT_ROUNDS
+        self.wait_seconds = 10
+        self.slots = threading.BoundedSemaphore(1)
+        self.bulk_slots = threading.BoundedSemaphore(1)
+
+    def init_app(self, app):
+        self.pool_size = app.config.get('CREDENTIAL_POOL_SIZE', os.cpu_count() or 1)
+        queue_depth = app.config.get('CREDENTIAL_QUEUE_DEPTH', self.pool_size * 4)
+        self.rounds = app.config.get('BCRYPT_ROUNDS', DEFAULT_BCRYPT_ROUNDS)
+        self.wait_seconds = app.config.get('CREDENTIAL_WAIT_SECONDS', 10)
+        self.slots = threading.BoundedSemaphore(max(self.pool_size + queue_depth, 1))
+        self.bulk_slots = threading.BoundedSemaphore(max(self.pool_size - 1, 1))
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self.executor
+
+    def _run(self, task, *task_args):
+        if self.pool_size <= 0:
+            return task(*task_args)
+
+        if not self.slots.acquire(blocking=False):
+            raise CredentialPoolSaturated()
+
+        try:
+            pending = self._executor().submit(task, *task_args)
+        except Exception:
+            self.slots.release()
+            raise
+
+        pending.add_done_callback(lambda finished: self.slots.release())
+        try:
+            return pending.result(timeout=self.wait_seconds)
+        except FutureTimeout:
+            raise CredentialPoolSaturated()
+
+    def hash(self, raw_credential):
+        return self._run(hash_credential, raw_credential, self.rounds)
+
+    def _submit_bulk(self, batch, rounds):
+        # Every batch holds a bulk lane slot and a regular admission slot until
+        # it finishes. All imports together therefore keep one worker free,
+        # and sign-ins see a shorter queue (and get the 503) while batches run.
+        self.bulk_slots.acquire()
+        if not self.slots.acquire(timeout=self.wait_seconds):
+            self.bulk_slots.release()
+            raise CredentialPoolSaturated()
+
+        def release(finished):
+            self.slots.release()
+            self.bulk_slots.release()
+
+        try:
+            pending = self._executor().submit(hash_credentials, batch, rounds)
+        except Exception:
+            release(None)
+            raise
+        pending.add_done_callback(release)
+        return pending
+
+    def hash_many(self, raw_credentials, rounds=None):
+        # Bulk hashing goes through a lane of pool_size - 1 workers shared by
+        # all imports, in small batches, so a sign-in arriving mid-import
+        # waits for at most one batch.
+        rounds = rounds or self.rounds
+        if self.pool_size <= 0:
+            return hash_credentials(raw_credentials, rounds)
+
+        batches = [raw_credentials[start:start + BULK_HASH_BATCH_SIZE]
+                   for start in range(0, len(raw_credentials), BULK_HASH_BATCH_SIZE)]
+        in_flight = deque()
+        hashed = []
+        try:
+            for batch in batches:
+                if len(in_flight) >= max(self.pool_size - 1, 1):
+                    hashed += in_flight.popleft().result()
+                in_flight.append(self._submit_bulk(batch, rounds))
+            while in_flight:
+                hashed += in_flight.popleft().result()
+        finally:
+            for pending in in_flight:
+                pending.cancel()
+        return hashed
+
+    def verify(self, raw_credential, stored_hash):
+        return self._run(check_credential, raw_credential, stored_hash)
+
+    def needs_rehash(self, stored_hash):
+        return credential_cost(stored_hash) != self.rounds
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+credential_pool = CredentialWorkerPool()
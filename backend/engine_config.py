@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import time
+from functools import wraps
+import click
+from flask import g, session, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, Select
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+SQLITE_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def environment_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+def engine_options(database_url):
+    # SQLite gets its tuning from pragmas on connect (see init_app); server
+    # databases get a sized, self-healing connection pool.
+    if make_url(database_url).get_backend_name() == 'sqlite':
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': environment_flag('DB_POOL_PRE_PING', 'true')
+    }
+
+
+def replica_binds(replica_url):
+    if not replica_url:
+        return {}
+    return {REPLICA_BIND: {'url': replica_url, **engine_options(replica_url)}}
+
+
+class RoutingSession(Session):
+    # Inside views marked with reads_from_replica, plain SELECTs go to the
+    # replica bind. Any write sends the rest of the session to the primary,
+    # and after a commit the user's reads stay on the primary for
+    # REPLICA_STICKY_SECONDS, so nobody reads around their own writes.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **keyword_args):
+        if bind is None and REPLICA_BIND in self._db.engines:
+            if self._flushing or not isinstance(clause, Select):
+                self.info['read_primary'] = True
+                self.info['wrote_primary'] = True
+            elif replica_reads_allowed(self):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper, clause=clause, bind=bind, **keyword_args)
+
+
+def replica_reads_allowed(db_session):
+    if not has_request_context() or not g.get('replica_reads') or db_session.info.get('read_primary'):
+        return False
+    return session.get('primary_reads_until', 0) < time.time()
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def pin_reads_to_primary(db_session):
+    if db_session.info.pop('wrote_primary', False) and has_request_context():
+        sticky_seconds = current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+        if sticky_seconds:
+            session['primary_reads_until'] = time.time() + sticky_seconds
+
+
+def reads_from_replica(handler_func):
+    @wraps(handler_func)
+    def wrapper_function(*positional_args, **keyword_args):
+        g.replica_reads = True
+        return handler_func(*positional_args, **keyword_args)
+    return wrapper_function
+
+
+def apply_sqlite_pragmas(engine, busy_timeout_ms, synchronous):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers keep reading while a play or grade is being
+        # written; the busy timeout makes writers queue instead of failing.
+        # Foreign keys are enforced so ON DELETE CASCADE behaves as on MySQL.
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def sqlite_path(engine):
+    return engine.url.database if engine.url.get_backend_name() == 'sqlite' else None
+
+
+def init_app(app):
+    storage_layer = app.extensions['sqlalchemy']
+    synchronous = app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS_MODES)}")
+
+    with app.app_context():
+        for engine in storage_layer.engines.values():
+            if engine.url.get_backend_name() == 'sqlite':
+                apply_sqlite_pragmas(engine, app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000), synchronous)
+
+    @app.cli.command('refresh-sqlite-replica')
+    def refresh_sqlite_replica_command():
+        """Copy the SQLite primary into the SQLite replica file (development and tests)."""
+        engines = storage_layer.engines
+        if REPLICA_BIND not in engines:
+            raise click.ClickException('DATABASE_REPLICA_URL is not set')
+        primary_path, replica_path = sqlite_path(engines[None]), sqlite_path(engines[REPLICA_BIND])
+        if not primary_path or not replica_path:
+            raise click.ClickException('Both the primary and the replica must be SQLite files')
+
+        engines[REPLICA_BIND].dispose()
+        source, target = sqlite3.connect(primary_path), sqlite3.connect(replica_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        click.echo(f'Copied {primary_path} to {replica_path}')
@@ -0,0 +1,157 @@
+import threading
+import time
+import click
+from sqlalchemy import select, insert, delete
+from models import storage_layer, PersonEntity, InteractiveActivity, PlaySession, ArchivedPlay, ActivityHighscore
+from commit_hooks import defer_until_commit
+
+HIGHSCORE_DEPTH = 10
+FLOOR_CACHE_SECONDS = 60
+
+
+class HighscoreFloorCache:
+    # Lowest score currently on each game's top-K table. Plays that cannot
+    # beat it skip the table entirely; a short expiry covers rows removed by
+    # other workers or by cascading deletes.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.floors = {}
+
+    def lookup(self, game_id):
+        with self.lock:
+            cached = self.floors.get(game_id)
+        if cached is None or time.monotonic() - cached[2] >= FLOOR_CACHE_SECONDS:
+            return None
+        return cached[0], cached[1]
+
+    def remember(self, game_id, entry_count, floor_score):
+        with self.lock:
+            self.floors[game_id] = (entry_count, floor_score, time.monotonic())
+
+    def forget(self, game_id=None):
+        with self.lock:
+            if game_id is None:
+                self.floors.clear()
+            else:
+                self.floors.pop(game_id, None)
+
+
+highscore_floors = HighscoreFloorCache()
+
+
+def current_highscores(game_id):
+    return storage_layer.session.execute(
+        select(ActivityHighscore.score_id, ActivityHighscore.score)
+        .where(ActivityHighscore.game_id == game_id)
+        .order_by(ActivityHighscore.score.desc(), ActivityHighscore.score_id)
+    ).all()
+
+
+def known_floor(game_id):
+    floor = highscore_floors.lookup(game_id)
+    if floor is None:
+        standing = current_highscores(game_id)
+        floor = (len(standing), standing[-1].score if standing else None)
+        highscore_floors.remember(game_id, *floor)
+    return floor
+
+
+def could_place(game_id, score):
+    entry_count, floor_score = known_floor(game_id)
+    return entry_count < HIGHSCORE_DEPTH or score > floor_score
+
+
+def offer_highscores(plays, username=None):
+    # plays need score_id, game_id, user_id, score and played_at; all of them
+    # belong to the same user.
+    contenders_by_game = {}
+    for play in plays:
+        if could_place(play.game_id, play.score):
+            contenders_by_game.setdefault(play.game_id, []).append(play)
+
+    if not contenders_by_game:
+        return 0
+
+    if username is None:
+        first_play = next(iter(contenders_by_game.values()))[0]
+        username = storage_layer.session.execute(
+            select(PersonEntity.username).where(PersonEntity.user_id == first_play.user_id)
+        ).scalar_one()
+
+    placed = 0
+    for game_id, contenders in contenders_by_game.items():
+        standing = current_highscores(game_id)
+        present = {row.score_id for row in standing}
+        contenders = [play for play in contenders if play.score_id not in present]
+
+        ranked = sorted(
+            [(row.score, row.score_id, None) for row in standing] +
+            [(play.score, play.score_id, play) for play in contenders],
+            key=lambda entry: (-entry[0], entry[1])
+        )
+        kept = ranked[:HIGHSCORE_DEPTH]
+        entrants = [entry[2] for entry in kept if entry[2] is not None]
+        overflow = [entry[1] for entry in ranked[HIGHSCORE_DEPTH:] if entry[2] is None]
+
+        if entrants:
+            storage_layer.session.execute(insert(ActivityHighscore), [
+                {
+                    'score_id': play.score_id,
+                    'game_id': play.game_id,
+                    'user_id': play.user_id,
+                    'username': username,
+                    'score': play.score,
+                    'played_at': play.played_at
+                }
+                for play in entrants
+            ])
+        if overflow:
+            storage_layer.session.execute(
+                delete(ActivityHighscore).where(ActivityHighscore.score_id.in_(overflow))
+            )
+        if kept:
+            defer_until_commit(highscore_floors.remember, game_id, len(kept), kept[-1][0])
+        placed += len(entrants)
+
+    return placed
+
+
+def offer_highscore(play_record, username=None):
+    return offer_highscores([play_record], username) > 0
+
+
+def rebuild_highscores(connection, game_ids=None):
+    if game_ids is None:
+        game_ids = connection.execute(select(InteractiveActivity.game_id)).scalars().all()
+
+    for game_id in game_ids:
+        connection.execute(delete(ActivityHighscore).where(ActivityHighscore.game_id == game_id))
+        # Compacted plays live on in game_scores_archive, so the top K of
+        # each table are merged.
+        leaders = []
+        for plays in (PlaySession, ArchivedPlay):
+            leaders += connection.execute(select(
+                plays.score_id, plays.game_id, plays.user_id,
+                PersonEntity.username, plays.score, plays.played_at
+            ).join(
+                PersonEntity, PersonEntity.user_id == plays.user_id
+            ).where(plays.game_id == game_id).order_by(
+                plays.score.desc(), plays.score_id
+            ).limit(HIGHSCORE_DEPTH)).all()
+        leaders.sort(key=lambda row: (-row.score, row.score_id))
+        if leaders:
+            connection.execute(insert(ActivityHighscore), [row._asdict() for row in leaders[:HIGHSCORE_DEPTH]])
+
+    return len(game_ids)
+
+
+def init_app(app):
+    @app.cli.command('rebuild-highscores')
+    @click.option('--game-id', type=int, multiple=True, help='Only rebuild these games.')
+    def rebuild_highscores_command(game_id):
+        """Recompute the per-game top-K tables from play history."""
+        with storage_layer.engine.begin() as connection:
+            rebuilt = rebuild_highscores(connection, list(game_id) or None)
+        highscore_floors.forget()
+        click.echo(f'Rebuilt high scores for {rebuilt} game(s)')
@@ -0,0 +1,241 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from models import storage_layer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BACKGROUND_ROUTE = 'background'
+UNMATCHED_ROUTE = 'unmatched'
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILE_MAX_DEPTH = 128
+
+
+class Histogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+
+    def exposition(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RouteMetrics:
+    # Aggregates per route template (e.g. /api/modules/details/<int:module_id>)
+    # so the number of series stays bounded however many ids are requested.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.latency = {}
+            self.response_size = {}
+            self.statements = Counter()
+            self.database_seconds = Counter()
+            self.slow_queries = Counter()
+
+    def record_request(self, route, method, status, seconds, size):
+        with self.lock:
+            self.requests[(route, method, status)] += 1
+            self.latency.setdefault((route, method), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if size is not None:
+                self.response_size.setdefault((route, method), Histogram(SIZE_BUCKETS)).observe(size)
+
+    def record_statement(self, route, seconds, slow):
+        with self.lock:
+            self.statements[route] += 1
+            self.database_seconds[route] += seconds
+            if slow:
+                self.slow_queries[route] += 1
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP edugamify_requests_total Requests handled, by route, method and status.',
+                '# TYPE edugamify_requests_total counter'
+            ]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'edugamify_requests_total{{route="{label_value(route)}",method="{method}",'
+                             f'status="{status}"}} {count}')
+
+            lines += ['# HELP edugamify_request_duration_seconds Request latency until the response is returned.',
+                      '# TYPE edugamify_request_duration_seconds histogram']
+            for (route, method), histogram in sorted(self.latency.items()):
+                lines += histogram.exposition('edugamify_request_duration_seconds',
+                                              f'route="{label_value(route)}",method="{method}"')
+
+            lines += ['# HELP edugamify_response_size_bytes Response body size; streamed responses are not counted.',
+                      '# TYPE edugamify_response_size_bytes histogram']
+            for (route, method), histogram in sorted(self.response_size.items()):
+                lines += histogram.exposition('edugamify_response_size_bytes',
+                                              f'route="{label_value(route)}",method="{method}"')
+
+            for name, kind, help_text, values in (
+                ('edugamify_sql_statements_total', 'counter', 'SQL statements executed, by issuing route.',
+                 self.statements),
+                ('edugamify_sql_duration_seconds_total', 'counter', 'Time spent executing SQL, by issuing route.',
+                 self.database_seconds),
+                ('edugamify_slow_queries_total', 'counter', 'SQL statements over the slow query threshold.',
+                 self.slow_queries),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for route, value in sorted(values.items()):
+                    lines.append(f'{name}{{route="{label_value(route)}"}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    # Opt-in sampler: while enabled, one thread snapshots the stacks of every
+    # thread that is serving a request every PROFILE_INTERVAL_SECONDS. Samples
+    # of requests slower than the threshold are appended to a folded-stack
+    # file (one "frame;frame;frame count" line per stack) that flamegraph.pl
+    # and speedscope read directly.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.threshold_seconds = None
+        self.output_path = None
+        self.active = {}
+        self.sampler = None
+
+    def configure(self, threshold_ms, output_dir):
+        if not threshold_ms:
+            return
+        self.threshold_seconds = threshold_ms / 1000
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_path = os.path.join(output_dir, 'slow-requests.folded')
+
+    @property
+    def enabled(self):
+        return self.threshold_seconds is not None
+
+    def begin(self):
+        with self.lock:
+            self.active[threading.get_ident()] = Counter()
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self.sampler.start()
+
+    def finish(self, route_label, seconds):
+        with self.lock:
+            samples = self.active.pop(threading.get_ident(), None)
+        if not samples or seconds < self.threshold_seconds:
+            return
+        with self.lock, open(self.output_path, 'a') as folded:
+            for stack, count in samples.items():
+                folded.write(f'{route_label};{stack} {count}\n')
+
+    def _sample(self):
+        while True:
+            time.sleep(PROFILE_INTERVAL_SECONDS)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, samples in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[fold_stack(frame)] += 1
+
+
+def fold_stack(frame):
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names)).replace(' ', '_')
+
+
+route_metrics = RouteMetrics()
+request_profiler = SlowRequestProfiler()
+
+
+def current_route():
+    if not has_request_context():
+        return BACKGROUND_ROUTE
+    return request.url_rule.rule if request.url_rule is not None else UNMATCHED_ROUTE
+
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request_profiler.enabled:
+        request_profiler.begin()
+
+
+def record_request(response):
+    # Registered before the other after_request hooks, so it runs last and
+    # the timing includes jobs run inline at the end of the request.
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    route = current_route()
+    size = None if response.is_streamed else response.content_length
+    route_metrics.record_request(route, request.method, response.status_code, seconds, size)
+    if request_profiler.enabled:
+        request_profiler.finish(f'{request.method}_{route}', seconds)
+    return response
+
+
+def attach_engine_hooks(engine, app):
+    slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_statement_timer(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('statement_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_statement(connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info['statement_started'].pop()
+        route = current_route()
+        slow = seconds >= slow_query_seconds
+        route_metrics.record_statement(route, seconds, slow)
+        if slow:
+            app.logger.warning('Slow query (%.1f ms) from %s: %s', seconds * 1000, route,
+                               ' '.join(statement.split())[:2000])
+
+    @event.listens_for(engine, 'handle_error')
+    def discard_statement_timer(exception_context):
+        started = exception_context.connection.info.get('statement_started') if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+def init_app(app):
+    with app.app_context():
+        for engine in storage_layer.engines.values():
+            attach_engine_hooks(engine, app)
+    request_profiler.configure(app.config.get('PROFILE_SLOW_REQUESTS_MS'),
+                               app.config.get('PROFILE_OUTPUT_DIR') or os.path.join(app.instance_path, 'profiles'))
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
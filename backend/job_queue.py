@@ -0,0 +1,239 @@
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import g, has_app_context
+from sqlalchemy import select, update, delete, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from models import storage_layer, DeferredJob
+from commit_hooks import defer_until_commit
+
+JOB_HANDLERS = {}
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2
+CLAIM_LEASE_SECONDS = 300
+IDLE_POLL_SECONDS = 5
+
+
+def job_handler(job_type):
+    def register(handler_func):
+        JOB_HANDLERS[job_type] = handler_func
+        return handler_func
+    return register
+
+
+def enqueue_job(job_type, payload, idempotency_key=None):
+    # The job row is written in the caller's transaction, so it exists exactly
+    # when the triggering write does. A repeated idempotency key is ignored.
+    job = DeferredJob(job_type=job_type, payload=json.dumps(payload), idempotency_key=idempotency_key)
+    if idempotency_key is None:
+        storage_layer.session.add(job)
+    else:
+        try:
+            with storage_layer.session.begin_nested():
+                storage_layer.session.add(job)
+        except IntegrityError:
+            return None
+    defer_until_commit(job_workers.wake)
+    return job
+
+
+def claim_next_job():
+    now = datetime.utcnow()
+    lease_expired = now - timedelta(seconds=CLAIM_LEASE_SECONDS)
+    claimable = or_(
+        DeferredJob.status == 'pending',
+        (DeferredJob.status == 'running') & (DeferredJob.claimed_at < lease_expired)
+    )
+
+    candidate_ids = storage_layer.session.execute(
+        select(DeferredJob.job_id).where(claimable, DeferredJob.run_after <= now)
+        .order_by(DeferredJob.run_after, DeferredJob.job_id).limit(5)
+    ).scalars().all()
+
+    for job_id in candidate_ids:
+        claimed = storage_layer.session.execute(
+            update(DeferredJob).where(DeferredJob.job_id == job_id, claimable).values(
+                status='running', claimed_at=now, attempts=DeferredJob.attempts + 1
+            ).execution_options(synchronize_session=False)
+        )
+        storage_layer.session.commit()
+        if claimed.rowcount:
+            return storage_layer.session.get(DeferredJob, job_id)
+    return None
+
+
+class ClaimSuperseded(Exception):
+    pass
+
+
+def run_job(job):
+    # A job that outlives its lease can be claimed again by another worker.
+    # The handler's writes commit together with the status change, and that
+    # change only applies while this claim (status and attempt count) is
+    # still the current one, so a superseded run leaves nothing behind.
+    job_id, job_type, attempts = job.job_id, job.job_type, job.attempts
+    still_claimed = and_(DeferredJob.job_id == job_id, DeferredJob.status == 'running',
+                         DeferredJob.attempts == attempts)
+    try:
+        JOB_HANDLERS[job_type](**json.loads(job.payload))
+        finished = storage_layer.session.execute(
+            update(DeferredJob).where(still_claimed).values(
+                status='done', finished_at=datetime.utcnow(), last_error=None
+            ).execution_options(synchronize_session=False)
+        )
+        if not finished.rowcount:
+            raise ClaimSuperseded()
+        storage_layer.session.commit()
+        job_workers.count('completed')
+        return True
+    except ClaimSuperseded:
+        storage_layer.session.rollback()
+        job_workers.count('superseded')
+        return False
+    except Exception:
+        storage_layer.session.rollback()
+        exhausted = attempts >= MAX_ATTEMPTS
+        storage_layer.session.execute(
+            update(DeferredJob).where(still_claimed).values(
+                status='failed' if exhausted else 'pending',
+                run_after=datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** attempts),
+                last_error=traceback.format_exc(limit=5)[-2000:],
+                finished_at=datetime.utcnow() if exhausted else None
+            )
+        )
+        storage_layer.session.commit()
+        job_workers.count('failed' if exhausted else 'retried')
+        return False
+
+
+def run_due_jobs(limit=None):
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def queue_depth():
+    counts = dict(storage_layer.session.execute(
+        select(DeferredJob.status, func.count()).group_by(DeferredJob.status)
+    ).all())
+    oldest_pending = storage_layer.session.execute(
+        select(func.min(DeferredJob.created_at)).where(DeferredJob.status == 'pending')
+    ).scalar()
+    return {
+        'pending': counts.get('pending', 0),
+        'running': counts.get('running', 0),
+        'failed': counts.get('failed', 0),
+        'done': counts.get('done', 0),
+        'oldest_pending_seconds': (datetime.utcnow() - oldest_pending).total_seconds() if oldest_pending else 0,
+        'processed': dict(job_workers.counters)
+    }
+
+
+class JobWorkerPool:
+    # Worker threads poll the job table and are woken early when a request
+    # commits new jobs. With a pool size of 0 due jobs are run at the end of
+    # the enqueuing request instead, which keeps development setups simple.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.app = None
+        self.pool_size = 2
+        self.threads = []
+        self.pending_signal = threading.Event()
+        self.stopping = threading.Event()
+        self.counters = {'completed': 0, 'retried': 0, 'failed': 0, 'superseded': 0}
+
+    def init_app(self, app):
+        self.app = app
+        self.pool_size = app.config.get('JOB_WORKERS', 2)
+
+    def count(self, outcome):
+        with self.lock:
+            self.counters[outcome] += 1
+
+    def start(self):
+        if self.threads or self.pool_size <= 0:
+            return
+        with self.lock:
+            if self.threads or self.pool_size <= 0:
+                return
+            self.stopping.clear()
+            for position in range(self.pool_size):
+                worker = threading.Thread(target=self._work, name=f'job-worker-{position}', daemon=True)
+                worker.start()
+                self.threads.append(worker)
+
+    def wake(self):
+        # Called from the after_commit hook, where no SQL may be issued.
+        if self.pool_size <= 0:
+            if has_app_context():
+                g.job_queue_due = True
+            return
+        self.start()
+        self.pending_signal.set()
+
+    def _work(self):
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    processed = run_due_jobs(limit=50)
+                except Exception:
+                    storage_layer.session.rollback()
+                    processed = 0
+            if not processed:
+                self.pending_signal.wait(IDLE_POLL_SECONDS)
+                self.pending_signal.clear()
+
+    def shutdown(self):
+        self.stopping.set()
+        self.pending_signal.set()
+        for worker in self.threads:
+            worker.join()
+        self.threads = []
+
+
+job_workers = JobWorkerPool()
+
+
+def run_inline_jobs(response):
+    if g.pop('job_queue_due', False):
+        run_due_jobs()
+    return response
+
+
+def init_app(app):
+    job_workers.init_app(app)
+    app.before_request(job_workers.start)
+    app.after_request(run_inline_jobs)
+
+    @app.cli.command('drain-jobs')
+    def drain_jobs_command():
+        """Run every due job in the queue, then exit."""
+        processed = run_due_jobs()
+        click.echo(f'{processed} job(s) run')
+
+    @app.cli.command('job-status')
+    def job_status_command():
+        """Show queue depth by status."""
+        for status, value in queue_depth().items():
+            click.echo(f'{status:24} {value}')
+
+    @app.cli.command('prune-jobs')
+    @click.option('--days', default=7, show_default=True, help='Keep finished jobs this long.')
+    def prune_jobs_command(days):
+        """Delete completed jobs older than the given age."""
+        removed = storage_layer.session.execute(
+            delete(DeferredJob).where(
+                DeferredJob.status == 'done',
+                DeferredJob.finished_at < datetime.utcnow() - timedelta(days=days)
+            )
+        )
+        storage_layer.session.commit()
+        click.echo(f'{removed.rowcount} finished job(s) removed')
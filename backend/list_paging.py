@@ -0,0 +1,65 @@
+from flask import request, jsonify, stream_with_context, current_app
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 500
+STREAM_BATCH_SIZE = 500
+
+
+def serialize_model(row):
+    return row.serialize_info()
+
+
+def respond_with_listing(query, key_column, collection_name, serialize_row=serialize_model, cursor_of=None):
+    # Lists are ordered by key_column and paged with ?limit=&after=<last key>.
+    # Without either parameter the whole list is returned as before, and
+    # ?stream=1 writes the array incrementally from a server-side cursor.
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after', type=int)
+    stream_requested = request.args.get('stream', '').lower() in ('1', 'true')
+
+    if after is not None:
+        query = query.filter(key_column > after)
+    query = query.order_by(key_column)
+
+    if stream_requested:
+        if limit is not None:
+            limit = min(max(limit, 1), MAX_PAGE_LIMIT)
+            query = query.limit(limit + 1)
+        cursor_for = cursor_of or (lambda row: getattr(row, key_column.key))
+        return stream_listing(query, collection_name, serialize_row, limit, cursor_for), 200
+
+    if limit is None and after is None:
+        return jsonify({collection_name: [serialize_row(row) for row in query.all()]}), 200
+
+    limit = min(max(limit or DEFAULT_PAGE_LIMIT, 1), MAX_PAGE_LIMIT)
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_after = None
+    if has_more:
+        last_row = rows[-1]
+        next_after = cursor_of(last_row) if cursor_of else getattr(last_row, key_column.key)
+
+    return jsonify({collection_name: [serialize_row(row) for row in rows], 'next_after': next_after}), 200
+
+
+def stream_listing(query, collection_name, serialize_row, limit=None, cursor_of=None):
+    # With a limit the query fetches one extra row; reaching it means the
+    # page was cut short, and the last emitted key becomes next_after.
+    encoder = current_app.json
+
+    def emit_chunks():
+        yield '{"%s": [' % collection_name
+        streamed_rows = query.execution_options(stream_results=True).yield_per(STREAM_BATCH_SIZE)
+        next_after = None
+        last_row = None
+        for position, row in enumerate(streamed_rows):
+            if limit is not None and position == limit:
+                next_after = cursor_of(last_row)
+                break
+            yield (', ' if position else '') + encoder.dumps(serialize_row(row))
+            last_row = row
+        yield '], "next_after": %s}' % encoder.dumps(next_after)
+
+    return current_app.response_class(stream_with_context(emit_chunks()), mimetype='application/json')
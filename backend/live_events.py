@@ -0,0 +1,201 @@
+import json
+import queue
+import threading
+import time
+from sqlalchemy import select
+from commit_hooks import defer_until_commit
+from models import storage_layer, PersonEntity
+from standings_board import standings_board
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SUBSCRIBER_BACKLOG = 100
+HEARTBEAT_SECONDS = 20
+LEADERBOARD_COALESCE_SECONDS = 2
+LEADERBOARD_DEPTH = 10
+RELAY_CHANNEL = 'live-events'
+
+
+class Subscription:
+    # A slow client only ever holds SUBSCRIBER_BACKLOG messages; older ones
+    # are dropped instead of growing the queue.
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.messages = queue.Queue(SUBSCRIBER_BACKLOG)
+
+    def offer(self, message):
+        while True:
+            try:
+                self.messages.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.messages.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next_message(self, timeout):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalRelay:
+    # Single-process deployments deliver straight to the local hub.
+    shared = False
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def send(self, message):
+        self.deliver(message)
+
+
+class RedisRelay:
+    # Every worker publishes to one Redis channel and delivers what it hears
+    # to its own subscribers, so an event raised in one worker reaches a
+    # client connected to another.
+    shared = True
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('LIVE_EVENTS_URL is set but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+
+    def start(self, deliver):
+        listener = self.client.pubsub(ignore_subscribe_messages=True)
+        listener.subscribe(**{RELAY_CHANNEL: lambda raw: deliver(json.loads(raw['data']))})
+        listener.run_in_thread(sleep_time=1, daemon=True)
+
+    def send(self, message):
+        self.client.publish(RELAY_CHANNEL, json.dumps(message))
+
+
+class EventHub:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.relay = None
+        self.app = None
+        self.leaderboard_dirty = threading.Event()
+        self.last_leaderboard = []
+        self.coalescer = None
+
+    def init_app(self, app):
+        self.app = app
+        self.relay = RedisRelay(app.config['LIVE_EVENTS_URL']) if app.config.get('LIVE_EVENTS_URL') else LocalRelay()
+        self.relay.start(self.deliver)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            user_subscriptions = self.subscriptions.get(subscription.user_id)
+            if user_subscriptions is not None:
+                user_subscriptions.discard(subscription)
+                if not user_subscriptions:
+                    del self.subscriptions[subscription.user_id]
+
+    def connection_count(self):
+        with self.lock:
+            return sum(len(user_subscriptions) for user_subscriptions in self.subscriptions.values())
+
+    def publish(self, user_id, event_type, data):
+        self.relay.send({'user_id': user_id, 'event': event_type, 'data': data})
+
+    def deliver(self, message):
+        with self.lock:
+            if message['event'] == 'leaderboard':
+                message = self._leaderboard_changes(message['data']['top'])
+                if message is None:
+                    return
+            if message.get('user_id') is None:
+                recipients = [s for user_subscriptions in self.subscriptions.values() for s in user_subscriptions]
+            else:
+                recipients = list(self.subscriptions.get(message['user_id'], ()))
+        for subscription in recipients:
+            subscription.offer(message)
+
+    def mark_leaderboard_dirty(self):
+        self.leaderboard_dirty.set()
+        if self.coalescer is None:
+            with self.lock:
+                if self.coalescer is None:
+                    self.coalescer = threading.Thread(target=self._coalesce_leaderboard, name='live-leaderboard',
+                                                      daemon=True)
+                    self.coalescer.start()
+
+    def current_leaderboard(self):
+        # With a shared relay the top rows come from the database, since each
+        # worker's standings_board only reflects the writes it has seen.
+        if not self.relay.shared:
+            return [
+                {'rank': standing['rank'], 'user_id': standing['user_id'],
+                 'username': standing['username'], 'points': standing['points']}
+                for standing in standings_board.page(0, LEADERBOARD_DEPTH)
+            ]
+        rows = storage_layer.session.execute(
+            select(PersonEntity.user_id, PersonEntity.username, PersonEntity.points)
+            .where(PersonEntity.role == 'student')
+            .order_by(PersonEntity.points.desc(), PersonEntity.user_id)
+            .limit(LEADERBOARD_DEPTH)
+        ).all()
+        return [{'rank': position + 1, 'user_id': row.user_id, 'username': row.username, 'points': row.points or 0}
+                for position, row in enumerate(rows)]
+
+    def _leaderboard_changes(self, current):
+        # Every worker receives the same snapshots in the same order from the
+        # relay, so each one sends its clients the same changed rows.
+        changed = [entry for entry in current if entry not in self.last_leaderboard]
+        self.last_leaderboard = current
+        if not changed:
+            return None
+        return {'user_id': None, 'event': 'leaderboard', 'data': {'changed': changed, 'depth': len(current)}}
+
+    def _coalesce_leaderboard(self):
+        # However many point changes land in an interval, this worker publishes
+        # at most one snapshot of the top rows; clients only get the rows that
+        # changed. A worker without subscribers of its own still publishes
+        # when the relay is shared.
+        while True:
+            self.leaderboard_dirty.wait()
+            time.sleep(LEADERBOARD_COALESCE_SECONDS)
+            self.leaderboard_dirty.clear()
+            if not self.relay.shared and not self.connection_count():
+                continue
+
+            with self.app.app_context():
+                current = self.current_leaderboard()
+            self.relay.send({'user_id': None, 'event': 'leaderboard', 'data': {'top': current}})
+
+
+live_hub = EventHub()
+
+
+def notify_after_commit(user_id, event_type, data):
+    defer_until_commit(live_hub.publish, user_id, event_type, data)
+
+
+def format_event(message):
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+def event_stream(user_id):
+    subscription = live_hub.subscribe(user_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            message = subscription.next_message(HEARTBEAT_SECONDS)
+            yield format_event(message) if message is not None else ': keepalive\n\n'
+    finally:
+        live_hub.unsubscribe(subscription)
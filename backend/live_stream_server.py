@@ -0,0 +1,36 @@
+from gevent import monkey
+monkey.patch_all()
+
+import os
+from gevent.pywsgi import WSGIServer
+from werkzeug.exceptions import NotFound
+
+# This process only holds open event streams, so it runs no job workers.
+os.environ.setdefault('JOB_WORKERS', '0')
+
+from app import web_application
+
+STREAM_PATH_PREFIX = '/api/live/'
+
+
+# Serves GET /api/live/stream from a gevent server, where every open stream
+# is a greenlet rather than a request thread, so thousands of idle dashboards
+# cost a few kilobytes each. Run it next to the regular workers and route
+# only /api/live/ to it; events raised by the workers reach it through the
+# LIVE_EVENTS_URL relay, and sessions are read from the shared SECRET_KEY
+# cookie without touching the database.
+
+def stream_only(environ, start_response):
+    if environ.get('PATH_INFO', '').startswith(STREAM_PATH_PREFIX):
+        return web_application(environ, start_response)
+    return NotFound()(environ, start_response)
+
+
+if __name__ == '__main__':
+    if not web_application.config.get('LIVE_EVENTS_URL'):
+        raise SystemExit('LIVE_EVENTS_URL must be set: the stream server only hears events through the relay')
+
+    listen_port = int(os.environ.get('LIVE_STREAM_PORT', 5001))
+    web_application.logger.setLevel('INFO')
+    web_application.logger.info('Serving live event streams on port %s', listen_port)
+    WSGIServer(('0.0.0.0', listen_port), stream_only).serve_forever()
@@ -0,0 +1,273 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, update, insert, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+from models import (storage_layer, PersonEntity, MilestoneRecord, MilestoneCounter, PlaySession, ArchivedPlay,
+                    WorkSubmission, PointsEvent, DeferredJob)
+from job_queue import job_handler, enqueue_job
+from live_events import notify_after_commit
+
+BACKFILL_CHUNK_SIZE = 2000
+
+
+class MilestoneJobsPending(Exception):
+    pass
+
+
+class MilestoneRule:
+    # A rule counts one event type per user, optionally per calendar day, and
+    # is awarded once when its counter first reaches the threshold. measure
+    # names an event attribute to sum instead of counting events.
+
+    def __init__(self, key, title, description, event, threshold, measure=None, window=None,
+                 game_id=None, min_score=None, min_grade=None):
+        self.key = key
+        self.title = title
+        self.description = description
+        self.event = event
+        self.threshold = threshold
+        self.measure = measure
+        self.window = window
+        self.game_id = game_id
+        self.min_score = min_score
+        self.min_grade = min_grade
+
+    def matches(self, attributes):
+        if self.game_id is not None and attributes.get('game_id') != self.game_id:
+            return False
+        if self.min_score is not None and (attributes.get('score') or 0) < self.min_score:
+            return False
+        if self.min_grade is not None and (attributes.get('grade') or 0) < self.min_grade:
+            return False
+        return True
+
+    def amount(self, attributes):
+        return (attributes.get(self.measure) or 0) if self.measure else 1
+
+    def period(self, attributes):
+        return attributes['at'][:10] if self.window == 'day' else ''
+
+
+MILESTONE_RULES = [
+    MilestoneRule('first-delivery', 'First Delivery', 'Delivered your first assignment',
+                  'submission_delivered', 1),
+    MilestoneRule('deliveries-10', 'Dedicated Learner', 'Delivered 10 assignments',
+                  'submission_delivered', 10),
+    MilestoneRule('graded-5', 'Feedback Seeker', 'Had 5 assignments graded',
+                  'submission_graded', 5),
+    MilestoneRule('high-grade', 'Top Marks', 'Received a grade of 90 or more',
+                  'submission_graded', 1, min_grade=90),
+    MilestoneRule('first-play', 'Player One', 'Played your first game',
+                  'activity_played', 1),
+    MilestoneRule('daily-plays-5', 'On a Roll', 'Played 5 games in one day',
+                  'activity_played', 5, window='day'),
+    MilestoneRule('plays-100', 'Arcade Regular', 'Played 100 games',
+                  'activity_played', 100),
+    MilestoneRule('score-1000', 'High Scorer', 'Scored 1000 or more in a game',
+                  'activity_played', 1, min_score=1000),
+    MilestoneRule('points-1000', 'Point Collector', 'Earned 1000 points',
+                  'points_awarded', 1000, measure='delta'),
+]
+
+
+def compile_rules(rules):
+    rules_by_event = defaultdict(list)
+    for rule in rules:
+        rules_by_event[rule.event].append(rule)
+    return dict(rules_by_event), {rule.key: rule for rule in rules}
+
+
+RULES_BY_EVENT, RULES_BY_KEY = compile_rules(MILESTONE_RULES)
+
+
+def milestone_event(event, at=None, **attributes):
+    attributes['event'] = event
+    attributes['at'] = (at or datetime.utcnow()).isoformat()
+    return attributes
+
+
+def emit_milestone_events(user_id, events):
+    relevant = [
+        event for event in events
+        if any(rule.matches(event) for rule in RULES_BY_EVENT.get(event['event'], ()))
+    ]
+    if relevant:
+        enqueue_job('milestones.evaluate', {'user_id': user_id, 'events': relevant})
+
+
+def bump_counter(user_id, counter_key, period, amount):
+    db_session = storage_layer.session
+    increment = update(MilestoneCounter).where(
+        MilestoneCounter.user_id == user_id,
+        MilestoneCounter.counter_key == counter_key,
+        MilestoneCounter.period == period
+    ).values(value=MilestoneCounter.value + amount).execution_options(synchronize_session=False)
+
+    for attempt in range(2):
+        if db_session.get_bind().dialect.update_returning:
+            new_value = db_session.execute(increment.returning(MilestoneCounter.value)).scalar_one_or_none()
+        elif db_session.execute(increment).rowcount:
+            new_value = db_session.execute(
+                select(MilestoneCounter.value).where(
+                    MilestoneCounter.user_id == user_id,
+                    MilestoneCounter.counter_key == counter_key,
+                    MilestoneCounter.period == period
+                )
+            ).scalar_one()
+        else:
+            new_value = None
+        if new_value is not None:
+            return new_value - amount, new_value
+
+        try:
+            with db_session.begin_nested():
+                db_session.execute(insert(MilestoneCounter).values(
+                    user_id=user_id, counter_key=counter_key, period=period, value=amount
+                ))
+            return 0, amount
+        except IntegrityError:
+            continue
+    return 0, 0
+
+
+def award_milestone(user_id, rule):
+    try:
+        with storage_layer.session.begin_nested():
+            storage_layer.session.execute(insert(MilestoneRecord).values(
+                user_id=user_id, milestone_key=rule.key, title=rule.title,
+                description=rule.description, points=0, achieved_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        return
+    notify_after_commit(user_id, 'milestone_reached', {'key': rule.key, 'title': rule.title})
+
+
+@job_handler('milestones.evaluate')
+def evaluate_milestone_events(user_id, events):
+    # Only the rules registered for each event type are looked at, and events
+    # hitting the same counter are summed first, so a batch of plays costs
+    # one counter update per rule and period.
+    increments = defaultdict(int)
+    for event in events:
+        for rule in RULES_BY_EVENT.get(event['event'], ()):
+            if rule.matches(event):
+                increments[(rule.key, rule.period(event))] += rule.amount(event)
+
+    for (rule_key, period), amount in increments.items():
+        rule = RULES_BY_KEY[rule_key]
+        old_value, new_value = bump_counter(user_id, rule_key, period, amount)
+        if old_value < rule.threshold <= new_value:
+            award_milestone(user_id, rule)
+
+
+def chunked_rows(statement, key_column, chunk_size):
+    last_key = None
+    while True:
+        bounded = statement if last_key is None else statement.where(key_column > last_key)
+        rows = storage_layer.session.execute(bounded.order_by(key_column).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][0]
+
+
+def evaluate_chunk(events_by_user):
+    for user_id, events in events_by_user.items():
+        evaluate_milestone_events(user_id, events)
+    storage_layer.session.commit()
+
+
+def late_points(user_ids, started_at):
+    return dict(storage_layer.session.execute(
+        select(PointsEvent.user_id, func.sum(PointsEvent.delta))
+        .where(PointsEvent.user_id.in_(user_ids), PointsEvent.created_at >= started_at)
+        .group_by(PointsEvent.user_id)
+    ).all())
+
+
+def backfill_milestones(chunk_size=BACKFILL_CHUNK_SIZE, announce=None):
+    # Counters are rebuilt from scratch, so the backfill can be re-run; awards
+    # already made are kept by the unique (user_id, milestone_key) index.
+    # Points are seeded from each user's current total rather than the
+    # ledger, which does not go back to before the ledger existed.
+    #
+    # Live traffic may continue: history is replayed only up to the moment
+    # the counters are cleared, and everything after it is counted by its own
+    # milestones.evaluate job. Jobs for earlier events that have not run yet
+    # would be counted twice, so the backfill refuses to start until they are
+    # drained.
+    started_at = datetime.utcnow()
+    waiting = storage_layer.session.execute(
+        select(func.count()).select_from(DeferredJob).where(
+            DeferredJob.job_type == 'milestones.evaluate', DeferredJob.status.in_(('pending', 'running'))
+        )
+    ).scalar()
+    if waiting:
+        storage_layer.session.rollback()
+        raise MilestoneJobsPending(f'{waiting} milestones.evaluate job(s) are still queued; run drain-jobs or '
+                                   'wait for the workers, then start the backfill again.')
+    storage_layer.session.execute(delete(MilestoneCounter))
+    storage_layer.session.commit()
+
+    for plays in (ArchivedPlay, PlaySession):
+        play_rows = select(plays.score_id, plays.user_id, plays.game_id, plays.score, plays.played_at).where(
+            or_(plays.played_at.is_(None), plays.played_at < started_at)
+        )
+        for rows in chunked_rows(play_rows, plays.score_id, chunk_size):
+            events_by_user = defaultdict(list)
+            for row in rows:
+                events_by_user[row.user_id].append(milestone_event(
+                    'activity_played', at=row.played_at, game_id=row.game_id, score=row.score
+                ))
+            evaluate_chunk(events_by_user)
+            if announce:
+                announce(f'Plays up to {rows[-1].score_id}')
+
+    submission_rows = select(WorkSubmission.submission_id, WorkSubmission.student_id,
+                             WorkSubmission.submitted_at, WorkSubmission.grade, WorkSubmission.graded_at)
+    for rows in chunked_rows(submission_rows, WorkSubmission.submission_id, chunk_size):
+        events_by_user = defaultdict(list)
+        for row in rows:
+            if row.submitted_at is None or row.submitted_at < started_at:
+                events_by_user[row.student_id].append(milestone_event('submission_delivered', at=row.submitted_at))
+            if row.grade is not None and (row.graded_at is None or row.graded_at < started_at):
+                events_by_user[row.student_id].append(milestone_event(
+                    'submission_graded', at=row.graded_at, grade=row.grade
+                ))
+        evaluate_chunk(events_by_user)
+        if announce:
+            announce(f'Submissions up to {rows[-1].submission_id}')
+
+    point_rows = select(PersonEntity.user_id, PersonEntity.points).where(PersonEntity.points > 0)
+    for rows in chunked_rows(point_rows, PersonEntity.user_id, chunk_size):
+        awarded_since = late_points([row.user_id for row in rows], started_at)
+        evaluate_chunk({
+            row.user_id: [milestone_event('points_awarded', delta=row.points - awarded_since.get(row.user_id, 0))]
+            for row in rows
+        })
+        if announce:
+            announce(f'Point totals up to user {rows[-1].user_id}')
+
+
+def init_app(app):
+    @app.cli.command('backfill-milestones')
+    @click.option('--chunk-size', default=BACKFILL_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+    def backfill_milestones_command(chunk_size):
+        """Rebuild milestone counters from history and award reached milestones."""
+        try:
+            backfill_milestones(chunk_size, announce=click.echo)
+        except MilestoneJobsPending as pending:
+            raise click.ClickException(str(pending))
+        click.echo('Milestone backfill complete')
+
+    @app.cli.command('prune-milestone-counters')
+    @click.option('--days', default=2, show_default=True, help='Keep per-day counters this long.')
+    def prune_milestone_counters_command(days):
+        """Delete per-day milestone counters for days that are over."""
+        cutoff = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+        removed = storage_layer.session.execute(
+            delete(MilestoneCounter).where(MilestoneCounter.period != '', MilestoneCounter.period < cutoff)
+        )
+        storage_layer.session.commit()
+        click.echo(f'{removed.rowcount} expired counter(s) removed')
@@ -1,11 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import bcrypt
+from credential_pool import credential_pool
+from engine_config import RoutingSession
 
-storage_layer = SQLAlchemy()
+storage_layer = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class PersonEntity(storage_layer.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        storage_layer.Index('ix_users_role_points', 'role', 'points'),
+    )
     
     user_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     username = storage_layer.Column(storage_layer.String(50), unique=True, nullable=False)
@@ -14,6 +18,7 @@ class PersonEntity(storage_layer.Model):
     role = storage_layer.Column(storage_layer.Enum('admin', 'teacher', 'student'), nullable=False)
     profile_picture = storage_layer.Column(storage_layer.String(255))
     points = storage_layer.Column(storage_layer.Integer, default=0)
+    access_version = storage_layer.Column(storage_layer.Integer, nullable=False, default=0)
     created_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
     
     class_memberships = storage_layer.relationship('ClassMembership', back_populates='enrolled_person', lazy=True)
@@ -25,12 +30,13 @@ class PersonEntity(storage_layer.Model):
     play_history = storage_layer.relationship('PlaySession', back_populates='participant', lazy=True)
     
     def encode_credential(self, raw_credential):
-        salt_bytes = bcrypt.gensalt(rounds=12)
-        hashed_bytes = bcrypt.hashpw(raw_credential.encode('utf-8'), salt_bytes)
-        self.password_hash = hashed_bytes.decode('utf-8')
+        self.password_hash = credential_pool.hash(raw_credential)
     
     def authenticate_credential(self, raw_credential):
-        return bcrypt.checkpw(raw_credential.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return credential_pool.verify(raw_credential, self.password_hash)
+    
+    def credential_needs_rehash(self):
+        return credential_pool.needs_rehash(self.password_hash)
     
     def serialize_info(self):
         return {
@@ -46,6 +52,9 @@ class PersonEntity(storage_layer.Model):
 
 class CredentialResetTicket(storage_layer.Model):
     __tablename__ = 'password_reset_tokens'
+    __table_args__ = (
+        storage_layer.Index('ix_password_reset_tokens_token_used', 'token', 'used'),
+    )
     
     token_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
@@ -57,6 +66,9 @@ class CredentialResetTicket(storage_layer.Model):
 
 class LearningModule(storage_layer.Model):
     __tablename__ = 'courses'
+    __table_args__ = (
+        storage_layer.Index('ix_courses_teacher', 'teacher_id'),
+    )
     
     course_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     course_name = storage_layer.Column(storage_layer.String(100), nullable=False)
@@ -81,6 +93,10 @@ class LearningModule(storage_layer.Model):
 
 class ClassMembership(storage_layer.Model):
     __tablename__ = 'enrollments'
+    __table_args__ = (
+        storage_layer.Index('uq_enrollments_user_course', 'user_id', 'course_id', unique=True),
+        storage_layer.Index('ix_enrollments_course', 'course_id'),
+    )
     
     enrollment_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
@@ -93,6 +109,9 @@ class ClassMembership(storage_layer.Model):
 
 class ResourceDocument(storage_layer.Model):
     __tablename__ = 'coursework'
+    __table_args__ = (
+        storage_layer.Index('ix_coursework_course', 'course_id'),
+    )
     
     coursework_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     course_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('courses.course_id', ondelete='CASCADE'), nullable=False)
@@ -118,6 +137,9 @@ class ResourceDocument(storage_layer.Model):
 
 class TaskItem(storage_layer.Model):
     __tablename__ = 'assignments'
+    __table_args__ = (
+        storage_layer.Index('ix_assignments_course', 'course_id'),
+    )
     
     assignment_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     course_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('courses.course_id', ondelete='CASCADE'), nullable=False)
@@ -146,6 +168,9 @@ class TaskItem(storage_layer.Model):
 
 class WorkSubmission(storage_layer.Model):
     __tablename__ = 'submissions'
+    __table_args__ = (
+        storage_layer.Index('uq_submissions_assignment_student', 'assignment_id', 'student_id', unique=True),
+    )
     
     submission_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     assignment_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('assignments.assignment_id', ondelete='CASCADE'), nullable=False)
@@ -201,6 +226,9 @@ class TrophyDefinition(storage_layer.Model):
 
 class TrophyOwnership(storage_layer.Model):
     __tablename__ = 'user_badges'
+    __table_args__ = (
+        storage_layer.Index('uq_user_badges_user_badge', 'user_id', 'badge_id', unique=True),
+    )
     
     user_badge_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
@@ -213,9 +241,13 @@ class TrophyOwnership(storage_layer.Model):
 
 class MilestoneRecord(storage_layer.Model):
     __tablename__ = 'achievements'
+    __table_args__ = (
+        storage_layer.Index('uq_achievements_user_milestone', 'user_id', 'milestone_key', unique=True),
+    )
     
     achievement_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    milestone_key = storage_layer.Column(storage_layer.String(80))
     title = storage_layer.Column(storage_layer.String(200), nullable=False)
     description = storage_layer.Column(storage_layer.Text)
     points = storage_layer.Column(storage_layer.Integer, default=0)
@@ -259,6 +291,10 @@ class InteractiveActivity(storage_layer.Model):
 
 class PlaySession(storage_layer.Model):
     __tablename__ = 'game_scores'
+    __table_args__ = (
+        storage_layer.Index('ix_game_scores_game_score', 'game_id', 'score'),
+        storage_layer.Index('ix_game_scores_played_at', 'played_at'),
+    )
     
     score_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
     game_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('games.game_id', ondelete='CASCADE'), nullable=False)
@@ -277,3 +313,184 @@ class PlaySession(storage_layer.Model):
             'score': self.score,
             'played_at': self.played_at.isoformat() if self.played_at else None
         }
+
+
+class ArchivedPlay(storage_layer.Model):
+    __tablename__ = 'game_scores_archive'
+    __table_args__ = (
+        storage_layer.Index('ix_game_scores_archive_game_score', 'game_id', 'score'),
+    )
+
+    score_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=False)
+    game_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('games.game_id', ondelete='CASCADE'), nullable=False)
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    score = storage_layer.Column(storage_layer.Integer, nullable=False)
+    played_at = storage_layer.Column(storage_layer.DateTime)
+
+
+class PlayRollup(storage_layer.Model):
+    __tablename__ = 'game_score_rollups'
+    __table_args__ = (
+        storage_layer.Index('ix_game_score_rollups_day', 'play_day'),
+    )
+
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    game_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('games.game_id', ondelete='CASCADE'), primary_key=True)
+    play_day = storage_layer.Column(storage_layer.Date, primary_key=True)
+    plays = storage_layer.Column(storage_layer.Integer, nullable=False, default=0)
+    score_total = storage_layer.Column(storage_layer.BigInteger, nullable=False, default=0)
+    best_score = storage_layer.Column(storage_layer.Integer, nullable=False)
+
+
+class PointsEvent(storage_layer.Model):
+    __tablename__ = 'points_events'
+    __table_args__ = (
+        storage_layer.Index('ix_points_events_user_created', 'user_id', 'created_at'),
+    )
+    
+    event_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=True)
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    delta = storage_layer.Column(storage_layer.Integer, nullable=False)
+    source_type = storage_layer.Column(storage_layer.String(30), nullable=False)
+    source_id = storage_layer.Column(storage_layer.Integer)
+    created_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
+    
+    def serialize_info(self):
+        return {
+            'event_id': self.event_id,
+            'user_id': self.user_id,
+            'delta': self.delta,
+            'source_type': self.source_type,
+            'source_id': self.source_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PointsBucket(storage_layer.Model):
+    __tablename__ = 'points_buckets'
+    __table_args__ = (
+        storage_layer.Index('ix_points_buckets_period_points', 'granularity', 'period_start', 'points'),
+    )
+    
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    granularity = storage_layer.Column(storage_layer.String(5), primary_key=True)
+    period_start = storage_layer.Column(storage_layer.Date, primary_key=True)
+    points = storage_layer.Column(storage_layer.Integer, nullable=False, default=0)
+
+
+class ActivityHighscore(storage_layer.Model):
+    __tablename__ = 'game_highscores'
+    __table_args__ = (
+        storage_layer.Index('ix_game_highscores_game_score', 'game_id', 'score'),
+    )
+    
+    score_id = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=False)
+    game_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('games.game_id', ondelete='CASCADE'), nullable=False)
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    username = storage_layer.Column(storage_layer.String(50), nullable=False)
+    score = storage_layer.Column(storage_layer.Integer, nullable=False)
+    played_at = storage_layer.Column(storage_layer.DateTime)
+    
+    def serialize_info(self):
+        return {
+            'username': self.username,
+            'score': self.score,
+            'played_at': self.played_at.isoformat() if self.played_at else None
+        }
+
+
+class StoredBlob(storage_layer.Model):
+    __tablename__ = 'stored_blobs'
+    
+    digest = storage_layer.Column(storage_layer.String(64), primary_key=True)
+    byte_size = storage_layer.Column(storage_layer.BigInteger, nullable=False)
+    ref_count = storage_layer.Column(storage_layer.Integer, nullable=False, default=0)
+    created_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
+    released_at = storage_layer.Column(storage_layer.DateTime)
+
+
+class ChunkedUpload(storage_layer.Model):
+    __tablename__ = 'chunked_uploads'
+    
+    upload_id = storage_layer.Column(storage_layer.String(64), primary_key=True)
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    subfolder = storage_layer.Column(storage_layer.String(20), nullable=False)
+    original_name = storage_layer.Column(storage_layer.String(255), nullable=False)
+    total_size = storage_layer.Column(storage_layer.BigInteger, nullable=False)
+    received_size = storage_layer.Column(storage_layer.BigInteger, nullable=False, default=0)
+    file_url = storage_layer.Column(storage_layer.String(255))
+    created_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
+    
+    def serialize_info(self):
+        return {
+            'upload_id': self.upload_id,
+            'subfolder': self.subfolder,
+            'filename': self.original_name,
+            'total_size': self.total_size,
+            'received_size': self.received_size,
+            'file_url': self.file_url,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class MilestoneCounter(storage_layer.Model):
+    __tablename__ = 'milestone_counters'
+    
+    user_id = storage_layer.Column(storage_layer.Integer, storage_layer.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    counter_key = storage_layer.Column(storage_layer.String(80), primary_key=True)
+    period = storage_layer.Column(storage_layer.String(10), primary_key=True, default='')
+    value = storage_layer.Column(storage_layer.BigInteger, nullable=False, default=0)
+
+
+class DeferredJob(storage_layer.Model):
+    __tablename__ = 'job_queue'
+    __table_args__ = (
+        storage_layer.Index('ix_job_queue_status_run_after', 'status', 'run_after'),
+    )
+    
+    job_id = storage_layer.Column(storage_layer.Integer, primary_key=True)
+    job_type = storage_layer.Column(storage_layer.String(50), nullable=False)
+    idempotency_key = storage_layer.Column(storage_layer.String(150), unique=True)
+    payload = storage_layer.Column(storage_layer.Text, nullable=False)
+    status = storage_layer.Column(storage_layer.String(20), nullable=False, default='pending')
+    attempts = storage_layer.Column(storage_layer.Integer, nullable=False, default=0)
+    run_after = storage_layer.Column(storage_layer.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = storage_layer.Column(storage_layer.DateTime)
+    last_error = storage_layer.Column(storage_layer.Text)
+    created_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
+    finished_at = storage_layer.Column(storage_layer.DateTime)
+    
+    def serialize_info(self):
+        return {
+            'job_id': self.job_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PlatformCounter(storage_layer.Model):
+    __tablename__ = 'platform_counters'
+
+    counter_key = storage_layer.Column(storage_layer.String(40), primary_key=True)
+    shard = storage_layer.Column(storage_layer.SmallInteger, primary_key=True, autoincrement=False)
+    value = storage_layer.Column(storage_layer.BigInteger, nullable=False, default=0)
+
+
+class PlatformSnapshot(storage_layer.Model):
+    __tablename__ = 'platform_snapshots'
+
+    snapshot_key = storage_layer.Column(storage_layer.String(40), primary_key=True)
+    payload = storage_layer.Column(storage_layer.Text, nullable=False)
+    refreshed_at = storage_layer.Column(storage_layer.DateTime, nullable=False)
+
+
+class SchemaVersion(storage_layer.Model):
+    __tablename__ = 'schema_versions'
+    
+    version = storage_layer.Column(storage_layer.Integer, primary_key=True, autoincrement=False)
+    name = storage_layer.Column(storage_layer.String(200), nullable=False)
+    applied_at = storage_layer.Column(storage_layer.DateTime, default=datetime.utcnow)
@@ -0,0 +1,154 @@
+import json
+import random
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, update, insert, delete, func, case
+from sqlalchemy.exc import IntegrityError
+from models import (storage_layer, PersonEntity, LearningModule, ClassMembership, WorkSubmission,
+                    TrophyOwnership, PlatformCounter, PlatformSnapshot)
+from job_queue import job_handler, enqueue_job
+from play_history import daily_play_counts
+
+COUNTER_SHARDS = 8
+SNAPSHOT_KEY = 'platform'
+SNAPSHOT_MAX_AGE_SECONDS = 300
+PLAY_DAYS_SHOWN = 30
+POINT_BANDS = ((0, 0), (1, 99), (100, 499), (500, 999), (1000, 4999), (5000, None))
+USER_ROLES = ('admin', 'teacher', 'student')
+
+
+# Counters are split over COUNTER_SHARDS rows per key and each write bumps a
+# random one, so signups, enrollments and deliveries from many workers do not
+# queue on a single row lock. The refresh recounts the underlying tables and
+# adds the difference to shard 0, which corrects any drift from cascading
+# deletes. Counts and current sums are read from the same snapshot and the
+# correction is an increment, so bumps committed meanwhile are kept.
+
+CORRECTION_SHARD = 0
+
+
+def role_counter(role):
+    return f'users:{role}'
+
+
+def add_to_counter_shard(connection, shard, deltas):
+    for counter_key, delta in deltas.items():
+        if not delta:
+            continue
+        updated = connection.execute(
+            update(PlatformCounter).where(
+                PlatformCounter.counter_key == counter_key, PlatformCounter.shard == shard
+            ).values(value=PlatformCounter.value + delta).execution_options(synchronize_session=False)
+        )
+        if updated.rowcount:
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(PlatformCounter).values(
+                    counter_key=counter_key, shard=shard, value=delta
+                ))
+        except IntegrityError:
+            connection.execute(
+                update(PlatformCounter).where(
+                    PlatformCounter.counter_key == counter_key, PlatformCounter.shard == shard
+                ).values(value=PlatformCounter.value + delta).execution_options(synchronize_session=False)
+            )
+
+
+def bump_platform_counters(deltas):
+    add_to_counter_shard(storage_layer.session, random.randrange(COUNTER_SHARDS), deltas)
+
+
+def bump_platform_counter(counter_key, delta=1):
+    bump_platform_counters({counter_key: delta})
+
+
+def counted_totals(connection):
+    totals = {role_counter(role): 0 for role in USER_ROLES}
+    for role, people in connection.execute(select(PersonEntity.role, func.count()).group_by(PersonEntity.role)):
+        totals[role_counter(role)] = people
+    totals['courses'] = connection.execute(select(func.count()).select_from(LearningModule)).scalar()
+    totals['enrollments'] = connection.execute(select(func.count()).select_from(ClassMembership)).scalar()
+    totals['pending_submissions'] = connection.execute(
+        select(func.count()).select_from(WorkSubmission).where(WorkSubmission.grade.is_(None))
+    ).scalar()
+    totals['badges_awarded'] = connection.execute(select(func.count()).select_from(TrophyOwnership)).scalar()
+    return totals
+
+
+def points_distribution(connection):
+    band_labels = [f'{low}+' if high is None else (f'{low}' if low == high else f'{low}-{high}')
+                   for low, high in POINT_BANDS]
+    points = func.coalesce(PersonEntity.points, 0)
+    band = case(*[
+        (points <= high, position) for position, (low, high) in enumerate(POINT_BANDS) if high is not None
+    ], else_=len(POINT_BANDS) - 1)
+    students = dict(connection.execute(
+        select(band, func.count()).where(PersonEntity.role == 'student').group_by(band)
+    ).all())
+    return [{'band': label, 'students': students.get(position, 0)} for position, label in enumerate(band_labels)]
+
+
+def refresh_platform_stats(connection):
+    now = datetime.utcnow()
+    recorded = dict(connection.execute(
+        select(PlatformCounter.counter_key, func.sum(PlatformCounter.value)).group_by(PlatformCounter.counter_key)
+    ).all())
+    totals = counted_totals(connection)
+    add_to_counter_shard(connection, CORRECTION_SHARD, {
+        counter_key: totals.get(counter_key, 0) - int(recorded.get(counter_key) or 0)
+        for counter_key in set(totals) | set(recorded)
+    })
+
+    payload = json.dumps({
+        'plays_per_day': daily_play_counts(connection, now.date() - timedelta(days=PLAY_DAYS_SHOWN - 1)),
+        'points_distribution': points_distribution(connection)
+    })
+    connection.execute(delete(PlatformSnapshot).where(PlatformSnapshot.snapshot_key == SNAPSHOT_KEY))
+    connection.execute(insert(PlatformSnapshot).values(snapshot_key=SNAPSHOT_KEY, payload=payload, refreshed_at=now))
+    return totals
+
+
+@job_handler('platform_stats.refresh')
+def refresh_platform_stats_job():
+    refresh_platform_stats(storage_layer.session)
+
+
+def current_platform_stats(max_age_seconds=SNAPSHOT_MAX_AGE_SECONDS):
+    # One read of the counters and one of the snapshot. A stale snapshot is
+    # still served while a job refreshes it; the time-bucketed key makes
+    # concurrent dashboards queue a single refresh.
+    snapshot = storage_layer.session.get(PlatformSnapshot, SNAPSHOT_KEY)
+    now = datetime.utcnow()
+    if snapshot is None:
+        refresh_platform_stats(storage_layer.session)
+        storage_layer.session.commit()
+        snapshot = storage_layer.session.get(PlatformSnapshot, SNAPSHOT_KEY)
+    elif snapshot.refreshed_at < now - timedelta(seconds=max_age_seconds):
+        window = int(now.timestamp() // max_age_seconds)
+        enqueue_job('platform_stats.refresh', {}, idempotency_key=f'platform-stats:{window}')
+        storage_layer.session.commit()
+
+    counters = dict(storage_layer.session.execute(
+        select(PlatformCounter.counter_key, func.sum(PlatformCounter.value)).group_by(PlatformCounter.counter_key)
+    ).all())
+    aggregates = json.loads(snapshot.payload)
+    return {
+        'users_by_role': {role: int(counters.get(role_counter(role), 0)) for role in USER_ROLES},
+        'courses': int(counters.get('courses', 0)),
+        'enrollments': int(counters.get('enrollments', 0)),
+        'pending_submissions': int(counters.get('pending_submissions', 0)),
+        'badges_awarded': int(counters.get('badges_awarded', 0)),
+        'plays_per_day': aggregates['plays_per_day'],
+        'points_distribution': aggregates['points_distribution'],
+        'snapshot_refreshed_at': snapshot.refreshed_at.isoformat()
+    }
+
+
+def init_app(app):
+    @app.cli.command('refresh-platform-stats')
+    def refresh_platform_stats_command():
+        """Recount the platform counters and rebuild the statistics snapshot."""
+        with storage_layer.engine.begin() as connection:
+            totals = refresh_platform_stats(connection)
+        click.echo(', '.join(f'{counter_key}={value}' for counter_key, value in sorted(totals.items())))
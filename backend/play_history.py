@@ -0,0 +1,146 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import select, insert, update, delete, func, case, bindparam
+from models import storage_layer, PlaySession, ArchivedPlay, PlayRollup
+
+HOT_HISTORY_DAYS = 90
+COMPACTION_CHUNK_SIZE = 5000
+
+
+def as_day(value):
+    # SQLite hands DATE() back as text, MySQL as a date.
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def compaction_cutoff(hot_days):
+    # Whole days only, so a day is never split between the hot table and its roll-up.
+    return datetime.combine(datetime.utcnow().date() - timedelta(days=hot_days), datetime.min.time())
+
+
+def rollup_chunk(rows):
+    totals = {}
+    for row in rows:
+        key = (row.user_id, row.game_id, row.played_at.date())
+        plays, score_total, best_score = totals.get(key, (0, 0, row.score))
+        totals[key] = (plays + 1, score_total + row.score, max(best_score, row.score))
+    return totals
+
+
+def merge_rollups(connection, totals):
+    existing = set(connection.execute(
+        select(PlayRollup.user_id, PlayRollup.game_id, PlayRollup.play_day).where(
+            PlayRollup.user_id.in_({key[0] for key in totals}),
+            PlayRollup.game_id.in_({key[1] for key in totals}),
+            PlayRollup.play_day.in_({key[2] for key in totals})
+        )
+    ).tuples())
+
+    additions = [
+        {'key_user': user_id, 'key_game': game_id, 'key_day': play_day,
+         'added_plays': plays, 'added_total': score_total, 'chunk_best': best_score}
+        for (user_id, game_id, play_day), (plays, score_total, best_score) in totals.items()
+        if (user_id, game_id, play_day) in existing
+    ]
+    if additions:
+        connection.execute(
+            update(PlayRollup).where(
+                PlayRollup.user_id == bindparam('key_user'),
+                PlayRollup.game_id == bindparam('key_game'),
+                PlayRollup.play_day == bindparam('key_day')
+            ).values(
+                plays=PlayRollup.plays + bindparam('added_plays'),
+                score_total=PlayRollup.score_total + bindparam('added_total'),
+                best_score=case((PlayRollup.best_score < bindparam('chunk_best'), bindparam('chunk_best')),
+                                else_=PlayRollup.best_score)
+            ).execution_options(synchronize_session=False),
+            additions
+        )
+
+    fresh = [
+        {'user_id': user_id, 'game_id': game_id, 'play_day': play_day,
+         'plays': plays, 'score_total': score_total, 'best_score': best_score}
+        for (user_id, game_id, play_day), (plays, score_total, best_score) in totals.items()
+        if (user_id, game_id, play_day) not in existing
+    ]
+    if fresh:
+        connection.execute(insert(PlayRollup), fresh)
+
+
+def compact_play_history(engine, hot_days=HOT_HISTORY_DAYS, chunk_size=COMPACTION_CHUNK_SIZE, announce=None):
+    # Each chunk is copied to the archive, folded into the daily roll-ups and
+    # removed from game_scores in its own short transaction, so plays keep
+    # being recorded while a large backlog is compacted. A second compaction
+    # running at the same time fails on the archive primary key and rolls
+    # its chunk back instead of counting plays twice.
+    cutoff = compaction_cutoff(hot_days)
+    compacted = 0
+    with engine.connect() as connection:
+        newest_id = connection.execute(select(func.max(PlaySession.score_id))).scalar()
+    if newest_id is None:
+        return compacted
+
+    while True:
+        with engine.begin() as connection:
+            # The newest play always stays behind: SQLite (and MySQL 5.7 after
+            # a restart) hands out max(score_id) + 1, so emptying the table
+            # would reuse ids that are already in the archive.
+            rows = connection.execute(
+                select(PlaySession.score_id, PlaySession.game_id, PlaySession.user_id,
+                       PlaySession.score, PlaySession.played_at)
+                .where(PlaySession.played_at < cutoff, PlaySession.score_id < newest_id)
+                .order_by(PlaySession.score_id).limit(chunk_size)
+            ).all()
+            if not rows:
+                return compacted
+
+            connection.execute(insert(ArchivedPlay), [row._asdict() for row in rows])
+            merge_rollups(connection, rollup_chunk(rows))
+            connection.execute(delete(PlaySession).where(PlaySession.score_id.in_([row.score_id for row in rows])))
+
+        compacted += len(rows)
+        if announce:
+            announce(f'Compacted plays up to {rows[-1].score_id}')
+
+
+def recent_daily_plays(first_day, last_day):
+    play_day = func.date(PlaySession.played_at)
+    return select(play_day, func.count()).where(
+        PlaySession.played_at >= datetime.combine(first_day, datetime.min.time()),
+        PlaySession.played_at < datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+    ).group_by(play_day)
+
+
+def daily_play_counts(connection, first_day, last_day=None):
+    # Plays per day from the roll-ups for compacted days and from game_scores
+    # for the rest; a day is only ever in one of the two.
+    last_day = last_day or datetime.utcnow().date()
+    counts = defaultdict(int)
+
+    rolled_up = connection.execute(
+        select(PlayRollup.play_day, func.sum(PlayRollup.plays))
+        .where(PlayRollup.play_day >= first_day, PlayRollup.play_day <= last_day)
+        .group_by(PlayRollup.play_day)
+    )
+    for play_day, plays in rolled_up:
+        counts[as_day(play_day)] += int(plays)
+
+    hot = connection.execute(recent_daily_plays(first_day, last_day))
+    for day, plays in hot:
+        counts[as_day(day)] += plays
+
+    return [{'day': (first_day + timedelta(days=offset)).isoformat(),
+             'plays': counts.get(first_day + timedelta(days=offset), 0)}
+            for offset in range((last_day - first_day).days + 1)]
+
+
+def init_app(app):
+    @app.cli.command('compact-play-history')
+    @click.option('--days', default=None, type=int,
+                  help=f'Keep this many days of raw plays hot (default PLAY_HISTORY_HOT_DAYS or {HOT_HISTORY_DAYS}).')
+    @click.option('--chunk-size', default=COMPACTION_CHUNK_SIZE, show_default=True, help='Plays per transaction.')
+    def compact_play_history_command(days, chunk_size):
+        """Move old plays to the archive table and roll them up per user, game and day."""
+        hot_days = days if days is not None else app.config.get('PLAY_HISTORY_HOT_DAYS', HOT_HISTORY_DAYS)
+        compacted = compact_play_history(storage_layer.engine, max(hot_days, 0), chunk_size, announce=click.echo)
+        click.echo(f'{compacted} play(s) compacted')
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, update, insert, delete, and_, or_
+from sqlalchemy.exc import IntegrityError
+from models import storage_layer, PersonEntity, ClassMembership, PointsEvent, PointsBucket
+
+BUCKET_GRANULARITIES = ('day', 'week', 'month')
+STANDINGS_WINDOWS = BUCKET_GRANULARITIES + ('all',)
+RETAINED_PERIODS = 2
+
+
+def period_start(granularity, moment):
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def earlier_period_start(granularity, start, periods_back):
+    if granularity == 'day':
+        return start - timedelta(days=periods_back)
+    if granularity == 'week':
+        return start - timedelta(weeks=periods_back)
+    month_index = start.year * 12 + start.month - 1 - periods_back
+    return start.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def record_bucket_points(user_id, delta, at=None):
+    # One UPDATE covers the day, week and month buckets in the common case;
+    # only the first award of a period inserts the missing rows.
+    starts = {granularity: period_start(granularity, at or datetime.utcnow())
+              for granularity in BUCKET_GRANULARITIES}
+    in_current_periods = or_(*[
+        and_(PointsBucket.granularity == granularity, PointsBucket.period_start == start)
+        for granularity, start in starts.items()
+    ])
+
+    updated = storage_layer.session.execute(
+        update(PointsBucket).where(PointsBucket.user_id == user_id, in_current_periods).values(
+            points=PointsBucket.points + delta
+        ).execution_options(synchronize_session=False)
+    )
+    if updated.rowcount == len(starts):
+        return
+
+    existing = set(storage_layer.session.execute(
+        select(PointsBucket.granularity).where(PointsBucket.user_id == user_id, in_current_periods)
+    ).scalars())
+    for granularity, start in starts.items():
+        if granularity in existing:
+            continue
+        try:
+            with storage_layer.session.begin_nested():
+                storage_layer.session.execute(insert(PointsBucket).values(
+                    user_id=user_id, granularity=granularity, period_start=start, points=delta
+                ))
+        except IntegrityError:
+            storage_layer.session.execute(
+                update(PointsBucket).where(
+                    PointsBucket.user_id == user_id,
+                    PointsBucket.granularity == granularity,
+                    PointsBucket.period_start == start
+                ).values(points=PointsBucket.points + delta).execution_options(synchronize_session=False)
+            )
+
+
+def windowed_standings_query(window, course_id=None):
+    # The all-time board reads users.points. A window reads the buckets of the
+    # current calendar period. The global board walks
+    # ix_points_buckets_period_points from the top and looks each row's user
+    # up by primary key, so a page costs offset + limit rows however many
+    # students there are. The role check is an EXISTS rather than a filter on
+    # the joined users so the planner cannot start from ix_users_role_points
+    # and sort every student's bucket. Course scope starts from the course's
+    # enrollments instead.
+    if window == 'all':
+        standings = select(PersonEntity.user_id, PersonEntity.username, PersonEntity.profile_picture,
+                           PersonEntity.points.label('points')).where(PersonEntity.role == 'student')
+        ranked_points, ranked_user = PersonEntity.points, PersonEntity.user_id
+    else:
+        is_student = select(PersonEntity.user_id).where(
+            PersonEntity.user_id == PointsBucket.user_id, PersonEntity.role == 'student'
+        ).correlate(PointsBucket).exists()
+        standings = select(PointsBucket.user_id, PersonEntity.username, PersonEntity.profile_picture,
+                           PointsBucket.points.label('points')).select_from(PointsBucket).join(
+            PersonEntity, PersonEntity.user_id == PointsBucket.user_id
+        ).where(
+            PointsBucket.granularity == window,
+            PointsBucket.period_start == period_start(window, datetime.utcnow()),
+            is_student
+        )
+        ranked_points, ranked_user = PointsBucket.points, PointsBucket.user_id
+
+    if course_id is not None:
+        standings = standings.join(
+            ClassMembership, ClassMembership.user_id == ranked_user
+        ).where(ClassMembership.course_id == course_id)
+
+    return standings.order_by(ranked_points.desc(), ranked_user)
+
+
+def windowed_standings(window, course_id=None, offset=0, limit=50):
+    rows = storage_layer.session.execute(
+        windowed_standings_query(window, course_id).offset(offset).limit(limit)
+    ).all()
+    return [
+        {
+            'rank': offset + position + 1,
+            'user_id': row.user_id,
+            'username': row.username,
+            'points': row.points or 0,
+            'profile_picture': row.profile_picture
+        }
+        for position, row in enumerate(rows)
+    ]
+
+
+def roll_off_buckets(retained_periods=RETAINED_PERIODS):
+    today = datetime.utcnow().date()
+    removed = 0
+    for granularity in BUCKET_GRANULARITIES:
+        cutoff = earlier_period_start(granularity, period_start(granularity, today), retained_periods - 1)
+        removed += storage_layer.session.execute(
+            delete(PointsBucket).where(PointsBucket.granularity == granularity, PointsBucket.period_start < cutoff)
+        ).rowcount
+    storage_layer.session.commit()
+    return removed
+
+
+def rebuild_point_buckets(connection):
+    # Refills the current buckets from the points ledger.
+    now = datetime.utcnow()
+    starts = {granularity: period_start(granularity, now) for granularity in BUCKET_GRANULARITIES}
+    earliest = datetime.combine(min(starts.values()), datetime.min.time())
+
+    totals = defaultdict(int)
+    ledger = connection.execute(
+        select(PointsEvent.user_id, PointsEvent.delta, PointsEvent.created_at)
+        .where(PointsEvent.created_at >= earliest)
+    )
+    for row in ledger:
+        for granularity, start in starts.items():
+            if period_start(granularity, row.created_at) == start:
+                totals[(row.user_id, granularity, start)] += row.delta
+
+    connection.execute(delete(PointsBucket).where(or_(*[
+        and_(PointsBucket.granularity == granularity, PointsBucket.period_start == start)
+        for granularity, start in starts.items()
+    ])))
+    if totals:
+        connection.execute(insert(PointsBucket), [
+            {'user_id': user_id, 'granularity': granularity, 'period_start': start, 'points': points}
+            for (user_id, granularity, start), points in totals.items()
+        ])
+    return len(totals)
+
+
+def init_app(app):
+    @app.cli.command('roll-off-point-buckets')
+    @click.option('--keep', default=RETAINED_PERIODS, show_default=True,
+                  help='Periods of each granularity to keep, the current one included.')
+    def roll_off_point_buckets_command(keep):
+        """Delete point buckets for windows that have closed."""
+        removed = roll_off_buckets(max(keep, 1))
+        click.echo(f'{removed} expired bucket(s) removed')
+
+    @app.cli.command('rebuild-point-buckets')
+    def rebuild_point_buckets_command():
+        """Recompute the current day, week and month buckets from the points ledger."""
+        with storage_layer.engine.begin() as connection:
+            rebuilt = rebuild_point_buckets(connection)
+        click.echo(f'Rebuilt {rebuilt} bucket(s)')
@@ -0,0 +1,47 @@
+from sqlalchemy import select, update
+from sqlalchemy.orm import attributes
+from sqlalchemy.orm.util import identity_key
+from models import storage_layer, PersonEntity, PointsEvent
+from commit_hooks import defer_until_commit
+from standings_board import standings_board
+from trophy_index import schedule_trophy_check
+from milestone_rules import emit_milestone_events, milestone_event
+from point_buckets import record_bucket_points
+from live_events import live_hub, notify_after_commit
+
+
+def grant_points(user_id, delta, source_type, source_id=None, milestone_events=()):
+    db_session = storage_layer.session
+    db_session.add(PointsEvent(
+        user_id=user_id,
+        delta=delta,
+        source_type=source_type,
+        source_id=source_id
+    ))
+
+    increment = update(PersonEntity).where(PersonEntity.user_id == user_id).values(
+        points=PersonEntity.points + delta
+    ).execution_options(synchronize_session=False)
+
+    if db_session.get_bind().dialect.update_returning:
+        new_total = db_session.execute(increment.returning(PersonEntity.points)).scalar_one_or_none()
+    else:
+        db_session.execute(increment)
+        new_total = db_session.execute(
+            select(PersonEntity.points).where(PersonEntity.user_id == user_id)
+        ).scalar_one_or_none()
+
+    if new_total is None:
+        return None
+
+    loaded_person = db_session.identity_map.get(identity_key(PersonEntity, user_id))
+    if loaded_person is not None:
+        attributes.set_committed_value(loaded_person, 'points', new_total)
+
+    record_bucket_points(user_id, delta)
+    schedule_trophy_check(user_id, new_total - delta, new_total)
+    emit_milestone_events(user_id, [milestone_event('points_awarded', delta=delta), *milestone_events])
+    defer_until_commit(standings_board.place_points, user_id, new_total)
+    defer_until_commit(live_hub.mark_leaderboard_dirty)
+    notify_after_commit(user_id, 'points_changed', {'points': new_total, 'delta': delta, 'source': source_type})
+    return new_total
@@ -0,0 +1,249 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import create_engine, select, insert, text
+from models import (storage_layer, PersonEntity, CredentialResetTicket, LearningModule, ClassMembership,
+                    ResourceDocument, TaskItem, WorkSubmission, TrophyDefinition, TrophyOwnership,
+                    InteractiveActivity, PlaySession, ActivityHighscore, PointsBucket)
+from schema_migrations import apply_pending_migrations
+from highscore_board import rebuild_highscores
+from point_buckets import BUCKET_GRANULARITIES, period_start, windowed_standings_query
+from play_history import recent_daily_plays
+
+AUDITED_QUERIES = []
+
+
+def audited_query(label):
+    def register(builder):
+        AUDITED_QUERIES.append((label, builder))
+        return builder
+    return register
+
+
+# Each entry mirrors the filtered query a route issues on its hot path.
+# Whole-table listings (catalogs, unpaged lists) are intentionally absent.
+
+@audited_query('signin: user by username')
+def signin_lookup():
+    return select(PersonEntity).where(PersonEntity.username == 'learner_7')
+
+
+@audited_query('finalize-reset: token lookup')
+def reset_token_lookup():
+    return select(CredentialResetTicket).where(
+        CredentialResetTicket.token == 'token_7', CredentialResetTicket.used == False
+    )
+
+
+@audited_query('modules/list: teacher modules')
+def teacher_modules():
+    return select(LearningModule).where(LearningModule.teacher_id == 1)
+
+
+@audited_query('modules/list: student modules')
+def student_modules():
+    return select(LearningModule).join(
+        ClassMembership, ClassMembership.course_id == LearningModule.course_id
+    ).where(ClassMembership.user_id == 7)
+
+
+@audited_query('modules/join: existing membership')
+def membership_lookup():
+    return select(ClassMembership).where(ClassMembership.user_id == 7, ClassMembership.course_id == 3)
+
+
+@audited_query('modules/roster: course students')
+def course_roster():
+    return select(PersonEntity.user_id, PersonEntity.username).join(
+        ClassMembership, ClassMembership.user_id == PersonEntity.user_id
+    ).where(ClassMembership.course_id == 3)
+
+
+@audited_query('modules/resources: course materials')
+def course_resources():
+    return select(ResourceDocument).where(ResourceDocument.course_id == 3).order_by(ResourceDocument.coursework_id)
+
+
+@audited_query('modules/tasks: course assignments')
+def course_tasks():
+    return select(TaskItem).where(TaskItem.course_id == 3).order_by(TaskItem.assignment_id)
+
+
+@audited_query('tasks/deliver: existing submission')
+def submission_lookup():
+    return select(WorkSubmission).where(WorkSubmission.assignment_id == 5, WorkSubmission.student_id == 7)
+
+
+@audited_query('tasks/responses: submissions with names')
+def task_responses():
+    return select(WorkSubmission, PersonEntity.username).join(
+        PersonEntity, PersonEntity.user_id == WorkSubmission.student_id
+    ).where(WorkSubmission.assignment_id == 5).order_by(WorkSubmission.submission_id)
+
+
+@audited_query('trophies/mine: owned badges')
+def owned_trophies():
+    return select(TrophyDefinition, TrophyOwnership.earned_at).join(
+        TrophyOwnership, TrophyOwnership.badge_id == TrophyDefinition.badge_id
+    ).where(TrophyOwnership.user_id == 7)
+
+
+@audited_query('activities/records: game high scores')
+def game_highscores():
+    return select(ActivityHighscore).where(ActivityHighscore.game_id == 2).order_by(
+        ActivityHighscore.score.desc(), ActivityHighscore.score_id
+    ).limit(10)
+
+
+@audited_query('rankings: student standings seed')
+def student_standings():
+    return select(PersonEntity.user_id, PersonEntity.points).where(PersonEntity.role == 'student')
+
+
+@audited_query('rankings/standings: weekly course board')
+def weekly_course_standings():
+    return windowed_standings_query('week', course_id=3).limit(50)
+
+
+@audited_query('rankings/standings: daily global board')
+def daily_standings():
+    return windowed_standings_query('day').limit(50)
+
+
+@audited_query('admin/platform-stats: plays per day since compaction')
+def daily_plays():
+    today = datetime.utcnow().date()
+    return recent_daily_plays(today - timedelta(days=29), today)
+
+
+@audited_query('admin/person-list: keyset page')
+def person_page():
+    return select(PersonEntity).where(PersonEntity.user_id > 500).order_by(PersonEntity.user_id).limit(100)
+
+
+def seed_audit_dataset(engine, user_count):
+    course_count = max(user_count // 100, 5)
+    teacher_count = max(user_count // 50, 1)
+    assignment_count = course_count * 4
+    game_count = 10
+    created = datetime.utcnow()
+    generator = random.Random(7)
+
+    with engine.begin() as connection:
+        connection.execute(insert(PersonEntity), [
+            {'username': f'learner_{n}', 'email': f'learner_{n}@example.test', 'password_hash': 'x',
+             'role': 'teacher' if n % 50 == 0 else 'student', 'points': generator.randint(0, 5000),
+             'access_version': 0, 'created_at': created}
+            for n in range(1, user_count + 1)
+        ])
+        connection.execute(insert(CredentialResetTicket), [
+            {'user_id': n, 'token': f'token_{n}', 'expires_at': created + timedelta(hours=1),
+             'used': n % 2 == 0, 'created_at': created}
+            for n in range(1, user_count // 10 + 1)
+        ])
+        connection.execute(insert(LearningModule), [
+            {'course_name': f'Course {n}', 'teacher_id': 50 * (n % teacher_count + 1), 'created_at': created}
+            for n in range(1, course_count + 1)
+        ])
+        connection.execute(insert(ClassMembership), [
+            {'user_id': n, 'course_id': course, 'enrollment_date': created}
+            for n in range(1, user_count + 1)
+            for course in {generator.randint(1, course_count) for _ in range(3)}
+        ])
+        connection.execute(insert(ResourceDocument), [
+            {'course_id': n % course_count + 1, 'title': f'Notes {n}', 'created_by': 50, 'created_at': created}
+            for n in range(course_count * 5)
+        ])
+        connection.execute(insert(TaskItem), [
+            {'course_id': n % course_count + 1, 'title': f'Task {n}', 'points': 10, 'created_by': 50,
+             'created_at': created}
+            for n in range(assignment_count)
+        ])
+        connection.execute(insert(WorkSubmission), [
+            {'assignment_id': assignment, 'student_id': n, 'content': 'work', 'submitted_at': created}
+            for n in range(1, user_count + 1)
+            for assignment in {generator.randint(1, assignment_count) for _ in range(2)}
+        ])
+        connection.execute(insert(TrophyDefinition), [
+            {'name': f'Badge {n}', 'points_required': n * 250, 'created_at': created} for n in range(20)
+        ])
+        connection.execute(insert(TrophyOwnership), [
+            {'user_id': n, 'badge_id': badge, 'earned_at': created}
+            for n in range(1, user_count + 1)
+            for badge in range(1, generator.randint(1, 20))
+        ])
+        connection.execute(insert(InteractiveActivity), [
+            {'name': f'Game {n}', 'points_per_play': 10, 'created_at': created} for n in range(game_count)
+        ])
+        connection.execute(insert(PlaySession), [
+            {'game_id': generator.randint(1, game_count), 'user_id': generator.randint(1, user_count),
+             'score': generator.randint(0, 100000), 'played_at': created}
+            for _ in range(user_count * 10)
+        ])
+        connection.execute(insert(PointsBucket), [
+            {'user_id': n, 'granularity': granularity, 'period_start': period_start(granularity, created),
+             'points': generator.randint(1, 500)}
+            for n in range(1, user_count + 1)
+            for granularity in BUCKET_GRANULARITIES
+        ])
+        rebuild_highscores(connection)
+        if engine.dialect.name == 'sqlite':
+            connection.execute(text('ANALYZE'))
+
+
+def full_scans_in_plan(connection, statement):
+    compiled = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+
+    if connection.dialect.name == 'sqlite':
+        plan_rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled).all()
+        details = [row[-1] for row in plan_rows]
+        return [detail for detail in details if detail.startswith('SCAN')], details
+
+    plan_rows = connection.exec_driver_sql('EXPLAIN ' + compiled).mappings().all()
+    details = [f"{row['table']}: type={row['type']} key={row['key']}" for row in plan_rows]
+    return [detail for row, detail in zip(plan_rows, details) if row['type'] == 'ALL'], details
+
+
+def audit_query_plans(engine):
+    with engine.connect() as connection:
+        for label, builder in AUDITED_QUERIES:
+            scans, details = full_scans_in_plan(connection, builder())
+            yield label, scans, details
+
+
+def init_app(app):
+    @app.cli.command('audit-query-plans')
+    @click.option('--users', default=20000, show_default=True, help='Users in the seeded audit dataset.')
+    @click.option('--database-url', default=None, help='Audit an existing database instead of seeding one.')
+    def audit_query_plans_command(users, database_url):
+        """Fail if a registered route query needs a full table scan."""
+        scratch_dir = None
+        if database_url:
+            engine = create_engine(database_url)
+        else:
+            scratch_dir = tempfile.mkdtemp(prefix='plan_audit_')
+            engine = create_engine('sqlite:///' + os.path.join(scratch_dir, 'audit.db'))
+            storage_layer.metadata.create_all(engine)
+            apply_pending_migrations(engine)
+            click.echo(f'Seeding audit dataset with {users} users...')
+            seed_audit_dataset(engine, users)
+
+        failures = 0
+        for label, scans, details in audit_query_plans(engine):
+            status = 'FULL SCAN' if scans else 'ok'
+            click.echo(f'{status:9}  {label}')
+            for detail in details:
+                click.echo(f'           {detail}')
+            failures += len(scans)
+
+        engine.dispose()
+        if scratch_dir:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        if failures:
+            click.echo(f'{failures} full table scan(s) found')
+            sys.exit(1)
+        click.echo('No full table scans in audited route queries')
@@ -0,0 +1,147 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import request, current_app
+from commit_hooks import defer_until_commit
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+LOCAL_CACHE_SECONDS = 60
+SHARED_CACHE_SECONDS = 24 * 3600
+
+
+class LocalCacheBackend:
+    # LRU bounded by total payload bytes. Versions live in this process only,
+    # so entries also expire after LOCAL_CACHE_SECONDS to pick up writes made
+    # through other workers.
+
+    def __init__(self, max_bytes, ttl_seconds=LOCAL_CACHE_SECONDS):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.used_bytes = 0
+
+    def versions_of(self, entities):
+        with self.lock:
+            return [self.versions.get(entity, 0) for entity in entities]
+
+    def bump(self, entity):
+        with self.lock:
+            self.versions[entity] = self.versions.get(entity, 0) + 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] >= self.ttl_seconds:
+                self._evict(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, etag, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._evict(key)
+            self.entries[key] = (etag, payload, time.monotonic())
+            self.used_bytes += len(payload)
+            while self.used_bytes > self.max_bytes:
+                self._evict(next(iter(self.entries)))
+
+    def _evict(self, key):
+        etag, payload, stored_at = self.entries.pop(key)
+        self.used_bytes -= len(payload)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+            self.used_bytes = 0
+
+
+class SharedCacheBackend:
+    # Redis-backed: versions are shared by every worker, so a write anywhere
+    # is visible to the next read everywhere.
+
+    def __init__(self, url, ttl_seconds=SHARED_CACHE_SECONDS):
+        if redis is None:
+            raise RuntimeError('RESPONSE_CACHE_URL is set but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+
+    def versions_of(self, entities):
+        stored = self.client.mget([f'rc:version:{entity}' for entity in entities])
+        return [int(version or 0) for version in stored]
+
+    def bump(self, entity):
+        self.client.incr(f'rc:version:{entity}')
+
+    def get(self, key):
+        stored = self.client.get(f'rc:entry:{key}')
+        if stored is None:
+            return None
+        etag, payload = stored.split(b'\n', 1)
+        return etag.decode(), payload
+
+    def set(self, key, etag, payload):
+        self.client.setex(f'rc:entry:{key}', self.ttl_seconds, etag.encode() + b'\n' + payload)
+
+    def clear(self):
+        for stored_key in self.client.scan_iter('rc:*'):
+            self.client.delete(stored_key)
+
+
+class ResponseCache:
+
+    def __init__(self):
+        self.backend = LocalCacheBackend(32 * 1024 * 1024)
+
+    def init_app(self, app):
+        if app.config.get('RESPONSE_CACHE_URL'):
+            self.backend = SharedCacheBackend(app.config['RESPONSE_CACHE_URL'])
+        else:
+            self.backend = LocalCacheBackend(app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    def invalidate(self, *entities):
+        # Bumped only once the write commits, so a reader can never cache the
+        # old rows under the new version.
+        for entity in entities:
+            defer_until_commit(self.backend.bump, entity)
+
+    def respond(self, entities, build_response):
+        # Streamed listings are produced incrementally and are never cached.
+        if request.args.get('stream'):
+            return build_response()
+
+        versions = self.backend.versions_of(entities)
+        version_tag = '.'.join(str(version) for version in versions)
+        cache_key = f'{request.path}?{request.query_string.decode()}@{version_tag}'
+
+        cached = self.backend.get(cache_key)
+        if cached is None:
+            response, status_code = build_response()
+            if status_code != 200:
+                return response, status_code
+            payload = response.get_data()
+            etag = hashlib.sha1(payload).hexdigest()
+            self.backend.set(cache_key, etag, payload)
+        else:
+            etag, payload = cached
+
+        response = current_app.response_class(payload, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+response_cache = ResponseCache()
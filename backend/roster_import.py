@@ -0,0 +1,274 @@
+import csv
+import io
+import re
+import secrets
+from itertools import islice
+from sqlalchemy import select, insert, or_, func
+from sqlalchemy.exc import IntegrityError
+from models import storage_layer, PersonEntity, LearningModule, ClassMembership
+from credential_pool import credential_pool
+from platform_stats import role_counter, bump_platform_counters
+from standings_board import standings_board
+
+IMPORT_CHUNK_SIZE = 1000
+REQUIRED_COLUMNS = ('username', 'email')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+$')
+COURSE_SEPARATORS = re.compile(r'[;,\s]+')
+
+
+class RosterFormatError(Exception):
+    pass
+
+
+class RosterRow:
+
+    def __init__(self, line, fields):
+        self.line = line
+        self.username = (fields.get('username') or '').strip()
+        self.email = (fields.get('email') or '').strip()
+        self.password = fields.get('password') or ''
+        self.role = (fields.get('role') or 'student').strip().lower()
+        self.course_text = fields.get('courses') or ''
+        self.course_ids = []
+        self.user_id = None
+        self.error = None
+        self.status = None
+        self.needs_password_reset = False
+        self.enrolled = []
+
+    def fail(self, message):
+        self.error = message
+        self.status = 'error'
+
+    def report(self):
+        entry = {'line': self.line, 'username': self.username, 'status': self.status}
+        if self.error:
+            entry['error'] = self.error
+        else:
+            entry['user_id'] = self.user_id
+            entry['enrolled'] = self.enrolled
+        if self.needs_password_reset:
+            entry['password_reset_required'] = True
+        return entry
+
+
+def roster_rows(text_stream):
+    reader = csv.DictReader(text_stream)
+    if reader.fieldnames is None:
+        raise RosterFormatError('The roster is empty')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise RosterFormatError(f"Missing column(s): {', '.join(missing)}")
+    for fields in reader:
+        yield RosterRow(reader.line_num, fields)
+
+
+def case_insensitive(column):
+    # MySQL's default collation already ignores case and keeps the unique
+    # index usable; SQLite compares bytes, so the column is lowered there.
+    if storage_layer.session.get_bind().dialect.name == 'sqlite':
+        return func.lower(column)
+    return column
+
+
+def validate_row(row, allowed_roles, seen_usernames, seen_emails):
+    if not row.username or not row.email:
+        return row.fail('username and email are required')
+    if len(row.username) > 50 or len(row.email) > 100:
+        return row.fail('username or email is too long')
+    if not EMAIL_PATTERN.match(row.email):
+        return row.fail('invalid email')
+    if row.role not in allowed_roles:
+        return row.fail(f"role must be one of {', '.join(allowed_roles)}")
+    try:
+        row.course_ids = sorted({int(part) for part in COURSE_SEPARATORS.split(row.course_text.strip()) if part})
+    except ValueError:
+        return row.fail('courses must be course ids')
+    if row.username.lower() in seen_usernames or row.email.lower() in seen_emails:
+        return row.fail('duplicate of an earlier row')
+    seen_usernames.add(row.username.lower())
+    seen_emails.add(row.email.lower())
+
+
+class RosterImport:
+    # Rows are read from the CSV stream and handled IMPORT_CHUNK_SIZE at a
+    # time. Each chunk costs a fixed number of statements: one lookup of the
+    # existing accounts, one of the courses, one of the existing enrollments,
+    # and executemany inserts. Passwords are hashed in parallel on the
+    # credential pool at BCRYPT_ROUNDS unless a lower import cost is set.
+
+    def __init__(self, importer_id, importer_role, hash_rounds=None):
+        self.importer_id = importer_id
+        self.importer_role = importer_role
+        self.allowed_roles = ('student', 'teacher') if importer_role == 'admin' else ('student',)
+        self.hash_rounds = hash_rounds
+        self.seen_usernames = set()
+        self.seen_emails = set()
+        self.rows = []
+        self.handled_through_line = 0
+
+    def run(self, text_stream):
+        rows = roster_rows(text_stream)
+        while True:
+            chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            self.rows += chunk
+            self.handled_through_line = chunk[-1].line
+        return self.summary()
+
+    def import_chunk(self, chunk):
+        for row in chunk:
+            validate_row(row, self.allowed_roles, self.seen_usernames, self.seen_emails)
+        pending = [row for row in chunk if row.error is None]
+        if not pending:
+            return
+
+        try:
+            self.match_existing_accounts(pending)
+            self.check_courses(pending)
+            created = self.create_accounts([row for row in pending if row.status == 'created'])
+            self.enroll([row for row in pending if row.error is None])
+            storage_layer.session.commit()
+        except IntegrityError:
+            # An account or enrollment was added elsewhere since the lookup;
+            # nothing of this chunk was kept, so importing it again is safe.
+            storage_layer.session.rollback()
+            for row in pending:
+                row.user_id, row.enrolled, row.needs_password_reset = None, [], False
+                row.fail('conflicting change while importing, please retry')
+            return
+        standings_board.record_new_students(
+            [(row.user_id, row.username) for row in created if row.role == 'student']
+        )
+
+    def match_existing_accounts(self, rows):
+        existing = storage_layer.session.execute(
+            select(PersonEntity.user_id, PersonEntity.username, PersonEntity.email, PersonEntity.role).where(or_(
+                case_insensitive(PersonEntity.username).in_([row.username.lower() for row in rows]),
+                case_insensitive(PersonEntity.email).in_([row.email.lower() for row in rows])
+            ))
+        ).all()
+        by_username = {person.username.lower(): person for person in existing}
+        by_email = {person.email.lower(): person for person in existing}
+        reachable = self.students_of_importer([person.user_id for person in existing])
+
+        for row in rows:
+            person = by_username.get(row.username.lower())
+            if person is None and row.email.lower() not in by_email:
+                row.status = 'created'
+            elif person is None or person.email.lower() != row.email.lower():
+                row.fail('username or email belongs to another account')
+            elif row.course_ids and person.role != 'student':
+                row.fail('only student accounts can be enrolled')
+            elif self.importer_role != 'admin' and person.user_id not in reachable:
+                row.fail('account already exists')
+            else:
+                row.status = 'existing'
+                row.user_id = person.user_id
+                row.role = person.role
+
+    def students_of_importer(self, user_ids):
+        # Teachers may only enroll existing accounts that are already
+        # students in one of their courses; knowing a username and email is
+        # not enough.
+        if self.importer_role == 'admin' or not user_ids:
+            return set()
+        return set(storage_layer.session.execute(
+            select(ClassMembership.user_id).join(
+                LearningModule, LearningModule.course_id == ClassMembership.course_id
+            ).where(
+                ClassMembership.user_id.in_(user_ids), LearningModule.teacher_id == self.importer_id
+            ).distinct()
+        ).scalars())
+
+    def check_courses(self, rows):
+        requested = {course_id for row in rows if row.error is None for course_id in row.course_ids}
+        if not requested:
+            return
+        courses = select(LearningModule.course_id).where(LearningModule.course_id.in_(requested))
+        if self.importer_role != 'admin':
+            courses = courses.where(LearningModule.teacher_id == self.importer_id)
+        permitted = set(storage_layer.session.execute(courses).scalars())
+
+        for row in rows:
+            if row.error is not None:
+                continue
+            unknown = [course_id for course_id in row.course_ids if course_id not in permitted]
+            if unknown:
+                row.fail(f"unknown course(s) {', '.join(map(str, unknown))}")
+            elif row.course_ids and row.role != 'student':
+                row.fail('only student accounts can be enrolled')
+
+    def create_accounts(self, rows):
+        if not rows:
+            return rows
+        # Accounts without a password get a random one that is never shown;
+        # the student sets their own through the password reset email.
+        for row in rows:
+            if not row.password:
+                row.password = secrets.token_urlsafe(24)
+                row.needs_password_reset = True
+        hashes = credential_pool.hash_many([row.password for row in rows], self.hash_rounds)
+        for row in rows:
+            row.password = None
+
+        storage_layer.session.execute(insert(PersonEntity), [
+            {'username': row.username, 'email': row.email, 'password_hash': password_hash, 'role': row.role}
+            for row, password_hash in zip(rows, hashes)
+        ])
+        user_ids = dict(storage_layer.session.execute(
+            select(PersonEntity.username, PersonEntity.user_id)
+            .where(PersonEntity.username.in_([row.username for row in rows]))
+        ).all())
+        for row in rows:
+            row.user_id = user_ids[row.username]
+
+        role_counts = {}
+        for row in rows:
+            role_counts[role_counter(row.role)] = role_counts.get(role_counter(row.role), 0) + 1
+        bump_platform_counters(role_counts)
+        return rows
+
+    def enroll(self, rows):
+        wanted = {(row.user_id, course_id): row for row in rows for course_id in row.course_ids}
+        if not wanted:
+            return
+        already = set(storage_layer.session.execute(
+            select(ClassMembership.user_id, ClassMembership.course_id).where(
+                ClassMembership.user_id.in_({user_id for user_id, course_id in wanted}),
+                ClassMembership.course_id.in_({course_id for user_id, course_id in wanted})
+            )
+        ).tuples())
+        fresh = [key for key in wanted if key not in already]
+        if fresh:
+            storage_layer.session.execute(insert(ClassMembership), [
+                {'user_id': user_id, 'course_id': course_id} for user_id, course_id in fresh
+            ])
+            bump_platform_counters({'enrollments': len(fresh)})
+        for user_id, course_id in fresh:
+            wanted[(user_id, course_id)].enrolled.append(course_id)
+
+    def summary(self):
+        counts = {'created': 0, 'existing': 0, 'error': 0}
+        for row in self.rows:
+            counts[row.status] += 1
+        return {
+            'created': counts['created'],
+            'existing': counts['existing'],
+            'failed': counts['error'],
+            'enrollments_added': sum(len(row.enrolled) for row in self.rows),
+            'rows': [row.report() for row in self.rows]
+        }
+
+
+def roster_text_stream(incoming_request):
+    # Multipart uploads arrive as a 'file' field; anything else is read as a
+    # raw text/csv body, straight from the request stream.
+    if 'file' in incoming_request.files:
+        binary = incoming_request.files['file'].stream
+    else:
+        binary = io.BufferedReader(incoming_request.stream)
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
@@ -2,16 +2,49 @@ from flask import request, jsonify, session, send_from_directory
 from app import web_application, storage_layer
 from models import (PersonEntity, CredentialResetTicket, LearningModule, ClassMembership,
                     ResourceDocument, TaskItem, WorkSubmission, TrophyDefinition,
-                    TrophyOwnership, MilestoneRecord, InteractiveActivity, PlaySession)
-from werkzeug.utils import secure_filename
+                    TrophyOwnership, MilestoneRecord, InteractiveActivity, PlaySession,
+                    ActivityHighscore, ChunkedUpload, DeferredJob)
+from standings_board import standings_board
+from trophy_index import trophy_index, grant_trophy_retroactively
+from points_ledger import grant_points
+from access_claims import (current_person, resolve_session_role, issue_access_claim,
+                           invalidate_access_claims, revoke_access_claims)
+from list_paging import respond_with_listing
+from credential_pool import CredentialPoolSaturated
+from highscore_board import (HIGHSCORE_DEPTH, offer_highscore, offer_highscores, could_place, rebuild_highscores,
+                             highscore_floors)
+from activity_catalog import activity_catalog
+from response_cache import response_cache
+from job_queue import queue_depth
+from milestone_rules import emit_milestone_events, milestone_event
+from point_buckets import STANDINGS_WINDOWS, windowed_standings, period_start
+from live_events import notify_after_commit, event_stream
+from instrumentation import route_metrics
+from engine_config import reads_from_replica
+from roster_import import RosterImport, RosterFormatError, roster_text_stream
+from platform_stats import role_counter, bump_platform_counter, bump_platform_counters, current_platform_stats
+from asset_store import (ASSET_SUBFOLDERS, UnknownChunkedUpload, ChunkOffsetMoved, ingest_stream, release_asset,
+                         open_chunked_upload, append_chunk, claim_chunked_upload, deliver_stored_asset)
+from avatar_thumbnails import (LEADERBOARD_THUMBNAIL_SIZE, PROFILE_THUMBNAIL_SIZE, thumbnail_url,
+                               schedule_thumbnails, deliver_thumbnail)
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 from datetime import datetime, timedelta
-import os
+from collections import defaultdict
 import secrets
+import hmac
+import csv
 import random
 
 def craft_random_token(token_length=40):
     return secrets.token_urlsafe(token_length)
 
+def serialize_profile(person):
+    profile_info = person.serialize_info()
+    profile_info['avatar_url'] = thumbnail_url(person.profile_picture, PROFILE_THUMBNAIL_SIZE)
+    return profile_info
+
 def verify_session_active(handler_func):
     def wrapper_function(*positional_args, **keyword_args):
         if 'user_id' not in session:
@@ -25,22 +58,35 @@ def verify_role_access(*permitted_roles):
         def inner_wrapper(*positional_args, **keyword_args):
             if 'user_id' not in session:
                 return jsonify({'error': 'Must be logged in'}), 401
-            person = PersonEntity.query.get(session['user_id'])
-            if not person or person.role not in permitted_roles:
+            if resolve_session_role() not in permitted_roles:
                 return jsonify({'error': 'Insufficient permissions'}), 403
             return handler_func(*positional_args, **keyword_args)
         inner_wrapper.__name__ = handler_func.__name__
         return inner_wrapper
     return outer_wrapper
 
+@web_application.errorhandler(CredentialPoolSaturated)
+def reject_when_credential_pool_full(error):
+    storage_layer.session.rollback()
+    busy_response = jsonify({'error': 'Server busy, please retry shortly'})
+    busy_response.headers['Retry-After'] = '2'
+    return busy_response, 503
+
+@web_application.errorhandler(UnknownChunkedUpload)
+def reject_unknown_upload(error):
+    storage_layer.session.rollback()
+    return jsonify({'error': 'Upload not found or not complete'}), 400
+
 def persist_uploaded_asset(asset_file, subfolder_name):
     if asset_file and asset_file.filename:
-        sanitized_name = secure_filename(asset_file.filename)
-        time_marker = datetime.now().strftime('%Y%m%d_%H%M%S')
-        final_name = f"{time_marker}_{sanitized_name}"
-        storage_path = os.path.join(web_application.config['FILE_STORAGE_PATH'], subfolder_name, final_name)
-        asset_file.save(storage_path)
-        return f'/uploads/{subfolder_name}/{final_name}'
+        return ingest_stream(asset_file.stream, subfolder_name, asset_file.filename)
+    return None
+
+def collect_uploaded_asset(file_field, subfolder_name):
+    if file_field in request.files:
+        return persist_uploaded_asset(request.files[file_field], subfolder_name)
+    if request.form.get('upload_id'):
+        return claim_chunked_upload(request.form['upload_id'], session['user_id'], subfolder_name)
     return None
 
 # ===== AUTHENTICATION ENDPOINTS =====
@@ -77,13 +123,16 @@ def create_new_account():
     if 'profile_picture' in request.files:
         picture_file = request.files['profile_picture']
         fresh_person.profile_picture = persist_uploaded_asset(picture_file, 'profiles')
+        schedule_thumbnails(fresh_person.profile_picture)
     
     storage_layer.session.add(fresh_person)
+    bump_platform_counter(role_counter(account_role))
     storage_layer.session.commit()
+    standings_board.record_person(fresh_person)
     
     return jsonify({
         'message': 'Account created successfully',
-        'user': fresh_person.serialize_info()
+        'user': serialize_profile(fresh_person)
     }), 201
 
 @web_application.route('/api/auth/signin', methods=['POST'])
@@ -98,14 +147,22 @@ def authenticate_person():
     if not person or not person.authenticate_credential(incoming_data['password']):
         return jsonify({'error': 'Authentication failed'}), 401
     
+    # Upgrading the stored hash is optional work; when the credential pool is
+    # saturated it is left for a later sign-in instead of failing this one.
+    if person.credential_needs_rehash():
+        try:
+            person.encode_credential(incoming_data['password'])
+            storage_layer.session.commit()
+        except CredentialPoolSaturated:
+            pass
+    
     session.permanent = True
-    session['user_id'] = person.user_id
-    session['role'] = person.role
+    issue_access_claim(person)
     session['username'] = person.username
     
     return jsonify({
         'message': 'Authentication successful',
-        'user': person.serialize_info()
+        'user': serialize_profile(person)
     }), 200
 
 @web_application.route('/api/auth/signout', methods=['POST'])
@@ -117,10 +174,10 @@ def terminate_session():
 @web_application.route('/api/auth/whoami', methods=['GET'])
 @verify_session_active
 def fetch_active_user():
-    person = PersonEntity.query.get(session['user_id'])
+    person = current_person()
     if not person:
         return jsonify({'error': 'User not located'}), 404
-    return jsonify({'user': person.serialize_info()}), 200
+    return jsonify({'user': serialize_profile(person)}), 200
 
 @web_application.route('/api/auth/request-reset', methods=['POST'])
 def begin_credential_reset():
@@ -181,37 +238,46 @@ def execute_credential_reset():
 @web_application.route('/api/profile/modify', methods=['PUT'])
 @verify_session_active
 def alter_profile():
-    person = PersonEntity.query.get(session['user_id'])
+    person = current_person()
     incoming_data = request.get_json()
     
     if incoming_data.get('email'):
         person.email = incoming_data['email']
     
     storage_layer.session.commit()
-    return jsonify({'message': 'Profile modified', 'user': person.serialize_info()}), 200
+    return jsonify({'message': 'Profile modified', 'user': serialize_profile(person)}), 200
 
 @web_application.route('/api/profile/avatar-upload', methods=['POST'])
 @verify_session_active
 def store_avatar_image():
-    if 'picture' not in request.files:
+    if 'picture' not in request.files and not request.form.get('upload_id'):
         return jsonify({'error': 'No picture file'}), 400
     
-    picture_file = request.files['picture']
-    person = PersonEntity.query.get(session['user_id'])
+    person = current_person()
     
-    avatar_path = persist_uploaded_asset(picture_file, 'profiles')
+    avatar_path = collect_uploaded_asset('picture', 'profiles')
+    release_asset(person.profile_picture)
     person.profile_picture = avatar_path
+    schedule_thumbnails(avatar_path)
     
     storage_layer.session.commit()
-    return jsonify({'message': 'Avatar updated', 'url': avatar_path}), 200
+    standings_board.record_person(person)
+    return jsonify({
+        'message': 'Avatar updated',
+        'url': avatar_path,
+        'avatar_url': thumbnail_url(avatar_path, PROFILE_THUMBNAIL_SIZE)
+    }), 200
 
 # ===== ADMIN CONTROL PANEL =====
 
 @web_application.route('/api/admin/person-list', methods=['GET'])
 @verify_role_access('admin')
 def fetch_all_persons():
-    persons = PersonEntity.query.all()
-    return jsonify({'users': [p.serialize_info() for p in persons]}), 200
+    persons = PersonEntity.query.options(
+        load_only(PersonEntity.user_id, PersonEntity.username, PersonEntity.email, PersonEntity.role,
+                  PersonEntity.profile_picture, PersonEntity.points, PersonEntity.created_at)
+    )
+    return respond_with_listing(persons, PersonEntity.user_id, 'users')
 
 @web_application.route('/api/admin/person-remove/<int:person_id>', methods=['DELETE'])
 @verify_role_access('admin')
@@ -220,8 +286,37 @@ def remove_person(person_id):
     if not person:
         return jsonify({'error': 'Person not found'}), 404
     
-    storage_layer.session.delete(person)
+    # Coursework, submissions and unclaimed chunked uploads go with the person
+    # through ON DELETE CASCADE, so their blob references are released too.
+    owned_assets = [person.profile_picture]
+    for asset_column, owner_column in ((ResourceDocument.file_url, ResourceDocument.created_by),
+                                       (WorkSubmission.file_url, WorkSubmission.student_id),
+                                       (ChunkedUpload.file_url, ChunkedUpload.user_id)):
+        owned_assets += storage_layer.session.execute(
+            select(asset_column).where(owner_column == person_id, asset_column.is_not(None))
+        ).scalars().all()
+    for asset_url in owned_assets:
+        release_asset(asset_url)
+    bump_platform_counters({
+        role_counter(person.role): -1,
+        'enrollments': -ClassMembership.query.filter_by(user_id=person_id).count(),
+        'pending_submissions': -WorkSubmission.query.filter_by(student_id=person_id, grade=None).count(),
+        'badges_awarded': -TrophyOwnership.query.filter_by(user_id=person_id).count()
+    })
+    ranked_games = storage_layer.session.execute(
+        select(ActivityHighscore.game_id).where(ActivityHighscore.user_id == person_id).distinct()
+    ).scalars().all()
+    # The rows that reference the person go with it through ON DELETE CASCADE.
+    storage_layer.session.execute(delete(PersonEntity).where(PersonEntity.user_id == person_id))
+    revoke_access_claims(person_id)
     storage_layer.session.commit()
+    standings_board.discard_person(person_id)
+    
+    # The next-best plays move up into the places the person held.
+    if ranked_games:
+        rebuild_highscores(storage_layer.session, ranked_games)
+        storage_layer.session.commit()
+        highscore_floors.forget()
     return jsonify({'message': 'Person removed'}), 200
 
 @web_application.route('/api/admin/person-role-change/<int:person_id>', methods=['PUT'])
@@ -234,8 +329,12 @@ def modify_person_role(person_id):
         return jsonify({'error': 'Person not found'}), 404
     
     if incoming_data.get('role') in ['admin', 'teacher', 'student']:
+        if incoming_data['role'] != person.role:
+            bump_platform_counters({role_counter(person.role): -1, role_counter(incoming_data['role']): 1})
         person.role = incoming_data['role']
+        invalidate_access_claims(person)
         storage_layer.session.commit()
+        standings_board.record_person(person)
         return jsonify({'message': 'Role modified', 'user': person.serialize_info()}), 200
     
     return jsonify({'error': 'Invalid role'}), 400
@@ -253,7 +352,11 @@ def establish_trophy():
     )
     
     storage_layer.session.add(trophy)
+    storage_layer.session.flush()
+    grant_trophy_retroactively(trophy)
+    response_cache.invalidate('trophies')
     storage_layer.session.commit()
+    trophy_index.invalidate()
     
     return jsonify({'message': 'Trophy established', 'badge': trophy.serialize_info()}), 201
 
@@ -270,24 +373,57 @@ def establish_activity():
     )
     
     storage_layer.session.add(activity)
+    response_cache.invalidate('activities')
     storage_layer.session.commit()
+    activity_catalog.invalidate()
     
     return jsonify({'message': 'Activity established', 'game': activity.serialize_info()}), 201
 
+@web_application.route('/api/admin/job-queue', methods=['GET'])
+@verify_role_access('admin')
+def inspect_job_queue():
+    recent_failures = DeferredJob.query.filter_by(status='failed').order_by(
+        DeferredJob.job_id.desc()
+    ).limit(20).all()
+    return jsonify({
+        'depth': queue_depth(),
+        'recent_failures': [job.serialize_info() for job in recent_failures]
+    }), 200
+
+@web_application.route('/api/admin/platform-stats', methods=['GET'])
+@verify_role_access('admin')
+def fetch_platform_stats():
+    return jsonify(current_platform_stats()), 200
+
+@web_application.route('/metrics', methods=['GET'])
+def export_metrics():
+    # Scrapers authenticate with METRICS_TOKEN as a bearer token; otherwise an
+    # admin session is required.
+    scrape_token = web_application.config.get('METRICS_TOKEN')
+    presented_token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (scrape_token and hmac.compare_digest(presented_token, scrape_token)):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Must be logged in'}), 401
+        if resolve_session_role() != 'admin':
+            return jsonify({'error': 'Insufficient permissions'}), 403
+    return web_application.response_class(route_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # ===== LEARNING MODULE MANAGEMENT =====
 
 @web_application.route('/api/modules/list', methods=['GET'])
 @verify_session_active
 def retrieve_modules():
-    person = PersonEntity.query.get(session['user_id'])
+    person_id = session['user_id']
+    person_role = resolve_session_role()
     
-    if person.role == 'admin':
+    if person_role == 'admin':
         modules = LearningModule.query.all()
-    elif person.role == 'teacher':
-        modules = LearningModule.query.filter_by(teacher_id=person.user_id).all()
+    elif person_role == 'teacher':
+        modules = LearningModule.query.filter_by(teacher_id=person_id).all()
     else:
-        memberships = ClassMembership.query.filter_by(user_id=person.user_id).all()
-        modules = [m.learning_module for m in memberships]
+        modules = LearningModule.query.join(
+            ClassMembership, ClassMembership.course_id == LearningModule.course_id
+        ).filter(ClassMembership.user_id == person_id).all()
     
     return jsonify({'courses': [m.serialize_info() for m in modules]}), 200
 
@@ -295,27 +431,52 @@ def retrieve_modules():
 @verify_role_access('admin', 'teacher')
 def establish_module():
     incoming_data = request.get_json()
-    person = PersonEntity.query.get(session['user_id'])
     
     module = LearningModule(
         course_name=incoming_data['course_name'],
         description=incoming_data.get('description'),
-        teacher_id=incoming_data.get('teacher_id') if person.role == 'admin' else person.user_id
+        teacher_id=incoming_data.get('teacher_id') if resolve_session_role() == 'admin' else session['user_id']
     )
     
     storage_layer.session.add(module)
+    bump_platform_counter('courses')
     storage_layer.session.commit()
     
     return jsonify({'message': 'Module established', 'course': module.serialize_info()}), 201
 
+@web_application.route('/api/modules/roster-import', methods=['POST'])
+@verify_role_access('admin', 'teacher')
+def import_module_roster():
+    roster_import = RosterImport(session['user_id'], resolve_session_role(),
+                                 web_application.config['ROSTER_IMPORT_BCRYPT_ROUNDS'])
+    try:
+        report = roster_import.run(roster_text_stream(request))
+    except (RosterFormatError, UnicodeDecodeError, csv.Error, CredentialPoolSaturated) as error:
+        storage_layer.session.rollback()
+        saturated = isinstance(error, CredentialPoolSaturated)
+        if not roster_import.rows:
+            if saturated:
+                raise
+            return jsonify({'error': f'Invalid roster: {error}', **roster_import.summary()}), 400
+        # Earlier chunks are already committed, so report them along with
+        # the line the import stopped after instead of failing the request.
+        return jsonify({
+            'error': 'Server busy, please retry shortly' if saturated else f'Invalid roster: {error}',
+            'imported_through_line': roster_import.handled_through_line,
+            **roster_import.summary()
+        }), 207
+    return jsonify(report), 200
+
 @web_application.route('/api/modules/details/<int:module_id>', methods=['GET'])
 @verify_session_active
 def retrieve_module_details(module_id):
-    module = LearningModule.query.get(module_id)
-    if not module:
-        return jsonify({'error': 'Module not found'}), 404
+    def build_details():
+        module = LearningModule.query.get(module_id)
+        if not module:
+            return jsonify({'error': 'Module not found'}), 404
+        return jsonify({'course': module.serialize_info()}), 200
     
-    return jsonify({'course': module.serialize_info()}), 200
+    return response_cache.respond([f'module:{module_id}'], build_details)
 
 @web_application.route('/api/modules/join/<int:module_id>', methods=['POST'])
 @verify_role_access('student')
@@ -332,15 +493,27 @@ def join_module(module_id):
     
     membership = ClassMembership(user_id=person_id, course_id=module_id)
     storage_layer.session.add(membership)
-    storage_layer.session.commit()
+    try:
+        storage_layer.session.flush()
+        bump_platform_counter('enrollments')
+        storage_layer.session.commit()
+    except IntegrityError:
+        storage_layer.session.rollback()
+        return jsonify({'error': 'Already joined'}), 409
     
     return jsonify({'message': 'Joined successfully'}), 201
 
 @web_application.route('/api/modules/roster/<int:module_id>', methods=['GET'])
 @verify_role_access('teacher', 'admin')
+@reads_from_replica
 def retrieve_module_roster(module_id):
-    memberships = ClassMembership.query.filter_by(course_id=module_id).all()
-    roster = [PersonEntity.query.get(m.user_id).serialize_info() for m in memberships]
+    students = PersonEntity.query.options(
+        load_only(PersonEntity.user_id, PersonEntity.username, PersonEntity.email, PersonEntity.role,
+                  PersonEntity.profile_picture, PersonEntity.points, PersonEntity.created_at)
+    ).join(
+        ClassMembership, ClassMembership.user_id == PersonEntity.user_id
+    ).filter(ClassMembership.course_id == module_id).all()
+    roster = [student.serialize_info() for student in students]
     return jsonify({'students': roster}), 200
 
 # ===== RESOURCE MANAGEMENT =====
@@ -348,8 +521,11 @@ def retrieve_module_roster(module_id):
 @web_application.route('/api/modules/<int:module_id>/resources', methods=['GET'])
 @verify_session_active
 def retrieve_resources(module_id):
-    resources = ResourceDocument.query.filter_by(course_id=module_id).all()
-    return jsonify({'materials': [r.serialize_info() for r in resources]}), 200
+    resources = ResourceDocument.query.filter_by(course_id=module_id)
+    return response_cache.respond(
+        [f'module:{module_id}:materials'],
+        lambda: respond_with_listing(resources, ResourceDocument.coursework_id, 'materials')
+    )
 
 @web_application.route('/api/modules/<int:module_id>/resource-upload', methods=['POST'])
 @verify_role_access('teacher', 'admin')
@@ -363,11 +539,10 @@ def upload_resource(module_id):
         created_by=session['user_id']
     )
     
-    if 'file' in request.files:
-        asset_file = request.files['file']
-        resource.file_url = persist_uploaded_asset(asset_file, 'coursework')
+    resource.file_url = collect_uploaded_asset('file', 'coursework')
     
     storage_layer.session.add(resource)
+    response_cache.invalidate(f'module:{module_id}:materials')
     storage_layer.session.commit()
     
     return jsonify({'message': 'Resource uploaded', 'material': resource.serialize_info()}), 201
@@ -377,8 +552,11 @@ def upload_resource(module_id):
 @web_application.route('/api/modules/<int:module_id>/tasks', methods=['GET'])
 @verify_session_active
 def retrieve_tasks(module_id):
-    tasks = TaskItem.query.filter_by(course_id=module_id).all()
-    return jsonify({'assignments': [t.serialize_info() for t in tasks]}), 200
+    tasks = TaskItem.query.filter_by(course_id=module_id)
+    return response_cache.respond(
+        [f'module:{module_id}:tasks'],
+        lambda: respond_with_listing(tasks, TaskItem.assignment_id, 'assignments')
+    )
 
 @web_application.route('/api/modules/<int:module_id>/task-create', methods=['POST'])
 @verify_role_access('teacher', 'admin')
@@ -400,6 +578,7 @@ def establish_task(module_id):
     )
     
     storage_layer.session.add(task)
+    response_cache.invalidate(f'module:{module_id}:tasks')
     storage_layer.session.commit()
     
     return jsonify({'message': 'Task established', 'assignment': task.serialize_info()}), 201
@@ -423,14 +602,18 @@ def deliver_task_work(task_id):
         content=form_data.get('content')
     )
     
-    if 'file' in request.files:
-        asset_file = request.files['file']
-        work.file_url = persist_uploaded_asset(asset_file, 'submissions')
+    work.file_url = collect_uploaded_asset('file', 'submissions')
     
     storage_layer.session.add(work)
+    try:
+        storage_layer.session.flush()
+    except IntegrityError:
+        storage_layer.session.rollback()
+        return jsonify({'error': 'Already delivered'}), 409
     
-    person = PersonEntity.query.get(session['user_id'])
-    person.points += 10
+    grant_points(session['user_id'], 10, 'submission', work.submission_id)
+    emit_milestone_events(session['user_id'], [milestone_event('submission_delivered')])
+    bump_platform_counter('pending_submissions')
     
     storage_layer.session.commit()
     
@@ -438,70 +621,261 @@ def deliver_task_work(task_id):
 
 @web_application.route('/api/tasks/<int:task_id>/responses', methods=['GET'])
 @verify_role_access('teacher', 'admin')
+@reads_from_replica
 def retrieve_task_responses(task_id):
-    responses = WorkSubmission.query.filter_by(assignment_id=task_id).all()
-    response_list = []
-    for resp in responses:
-        learner = PersonEntity.query.get(resp.student_id)
+    responses = storage_layer.session.query(WorkSubmission, PersonEntity.username).join(
+        PersonEntity, PersonEntity.user_id == WorkSubmission.student_id
+    ).filter(WorkSubmission.assignment_id == task_id)
+    
+    def serialize_response(row):
+        resp, learner_name = row
         resp_dict = resp.serialize_info()
-        resp_dict['student_name'] = learner.username
-        response_list.append(resp_dict)
-    return jsonify({'submissions': response_list}), 200
+        resp_dict['student_name'] = learner_name
+        return resp_dict
+    
+    return respond_with_listing(responses, WorkSubmission.submission_id, 'submissions',
+                                serialize_response, lambda row: row[0].submission_id)
+
+MAX_BATCH_EVALUATIONS = 500
+
+def parse_evaluation(entry):
+    if not isinstance(entry, dict):
+        return 'Evaluation must be an object'
+    submission_id, grade, feedback = entry.get('submission_id'), entry.get('grade'), entry.get('feedback')
+    if not isinstance(submission_id, int) or isinstance(submission_id, bool):
+        return 'submission_id must be an integer'
+    if grade is not None and (not isinstance(grade, int) or isinstance(grade, bool)):
+        return 'Grade must be an integer'
+    if feedback is not None and not isinstance(feedback, str):
+        return 'Feedback must be text'
+    return None
+
+def record_evaluations(evaluations):
+    # One read of all the submissions, one executemany UPDATE, and one points
+    # grant per student for the sum of (new grade - previous grade), so a
+    # re-grade only moves the total by the difference. Returns the ids that
+    # do not exist; nothing is written in that case.
+    submission_ids = [entry['submission_id'] for entry in evaluations]
+    previous = {
+        row.submission_id: row for row in storage_layer.session.execute(
+            select(WorkSubmission.submission_id, WorkSubmission.student_id,
+                   WorkSubmission.assignment_id, WorkSubmission.grade)
+            .where(WorkSubmission.submission_id.in_(submission_ids))
+        )
+    }
+    missing = [submission_id for submission_id in submission_ids if submission_id not in previous]
+    if missing:
+        return missing
+    
+    graded_at = datetime.utcnow()
+    storage_layer.session.execute(update(WorkSubmission), [
+        {
+            'submission_id': entry['submission_id'],
+            'grade': entry.get('grade'),
+            'feedback': entry.get('feedback'),
+            'graded_by': session['user_id'],
+            'graded_at': graded_at
+        }
+        for entry in evaluations
+    ])
+    
+    point_deltas = defaultdict(int)
+    graded_by_student = defaultdict(list)
+    first_grades = defaultdict(list)
+    pending_change = 0
+    for entry in evaluations:
+        before = previous[entry['submission_id']]
+        grade = entry.get('grade')
+        point_deltas[before.student_id] += (grade or 0) - (before.grade or 0)
+        graded_by_student[before.student_id].append(before.submission_id)
+        if before.grade is None and grade is not None:
+            first_grades[before.student_id].append(milestone_event('submission_graded', grade=grade))
+        pending_change += (grade is None) - (before.grade is None)
+        notify_after_commit(before.student_id, 'submission_graded', {
+            'submission_id': before.submission_id,
+            'assignment_id': before.assignment_id,
+            'grade': grade,
+            'feedback': entry.get('feedback')
+        })
+    
+    for student_id, delta in point_deltas.items():
+        if not delta:
+            continue
+        # The student's grading milestones ride along in the same job.
+        graded_ids = graded_by_student[student_id]
+        events = first_grades.pop(student_id, [])
+        if len(graded_ids) == 1:
+            grant_points(student_id, delta, 'grade', graded_ids[0], milestone_events=events)
+        else:
+            grant_points(student_id, delta, 'grade_batch', milestone_events=events)
+    for student_id, events in first_grades.items():
+        emit_milestone_events(student_id, events)
+    bump_platform_counter('pending_submissions', pending_change)
+    return []
 
 @web_application.route('/api/responses/<int:response_id>/evaluate', methods=['PUT'])
 @verify_role_access('teacher', 'admin')
 def evaluate_response(response_id):
-    incoming_data = request.get_json()
-    
-    response = WorkSubmission.query.get(response_id)
-    if not response:
+    incoming_data = request.get_json(silent=True) or {}
+    evaluation = {'submission_id': response_id, 'grade': incoming_data.get('grade'),
+                  'feedback': incoming_data.get('feedback')}
+    
+    invalid = parse_evaluation(evaluation)
+    if invalid:
+        return jsonify({'error': invalid}), 400
+    if record_evaluations([evaluation]):
         return jsonify({'error': 'Response not found'}), 404
     
-    response.grade = incoming_data.get('grade')
-    response.feedback = incoming_data.get('feedback')
-    response.graded_by = session['user_id']
-    response.graded_at = datetime.utcnow()
+    storage_layer.session.commit()
+    response = WorkSubmission.query.get(response_id)
     
-    if incoming_data.get('grade'):
-        learner = PersonEntity.query.get(response.student_id)
-        learner.points += incoming_data['grade']
+    return jsonify({'message': 'Response evaluated', 'submission': response.serialize_info()}), 200
+
+@web_application.route('/api/responses/evaluate-batch', methods=['POST'])
+@verify_role_access('teacher', 'admin')
+def evaluate_response_batch():
+    incoming_data = request.get_json(silent=True) or {}
+    evaluations = incoming_data.get('evaluations')
+    
+    if not isinstance(evaluations, list) or not evaluations:
+        return jsonify({'error': 'evaluations must be a non-empty list'}), 400
+    if len(evaluations) > MAX_BATCH_EVALUATIONS:
+        return jsonify({'error': f'At most {MAX_BATCH_EVALUATIONS} evaluations per batch'}), 400
+    
+    rejected = []
+    seen_ids = set()
+    for position, entry in enumerate(evaluations):
+        invalid = parse_evaluation(entry)
+        if invalid is None and entry['submission_id'] in seen_ids:
+            invalid = 'Submission appears more than once'
+        if invalid:
+            rejected.append({'index': position, 'error': invalid})
+        else:
+            seen_ids.add(entry['submission_id'])
+    if rejected:
+        return jsonify({'error': 'Invalid evaluations in batch', 'rejected': rejected}), 400
+    
+    missing = record_evaluations(evaluations)
+    if missing:
+        return jsonify({'error': 'Responses not found', 'missing': missing}), 404
     
     storage_layer.session.commit()
     
-    return jsonify({'message': 'Response evaluated', 'submission': response.serialize_info()}), 200
+    return jsonify({'message': 'Responses evaluated', 'evaluated': len(evaluations)}), 200
 
 # ===== GAMIFICATION FEATURES =====
 
 @web_application.route('/api/rankings/top-performers', methods=['GET'])
 @verify_session_active
 def fetch_top_performers():
-    performers = PersonEntity.query.filter_by(role='student').order_by(PersonEntity.points.desc()).limit(50).all()
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    
+    rankings = [
+        {
+            'rank': standing['rank'],
+            'username': standing['username'],
+            'points': standing['points'],
+            'profile_picture': standing['profile_picture'],
+            'avatar_url': thumbnail_url(standing['profile_picture'], LEADERBOARD_THUMBNAIL_SIZE)
+        }
+        for standing in standings_board.page(offset, limit)
+    ]
+    return jsonify({'leaderboard': rankings, 'total': standings_board.total()}), 200
+
+@web_application.route('/api/rankings/my-standing', methods=['GET'])
+@verify_session_active
+def fetch_personal_standing():
+    radius = min(max(request.args.get('radius', 5, type=int), 0), 50)
+    
+    rank, neighbours = standings_board.neighbourhood(session['user_id'], radius)
+    if rank is None:
+        return jsonify({'error': 'Not ranked'}), 404
+    
+    nearby = [
+        {
+            'rank': standing['rank'],
+            'username': standing['username'],
+            'points': standing['points'],
+            'profile_picture': standing['profile_picture'],
+            'avatar_url': thumbnail_url(standing['profile_picture'], LEADERBOARD_THUMBNAIL_SIZE),
+            'is_self': standing['user_id'] == session['user_id']
+        }
+        for standing in neighbours
+    ]
+    return jsonify({'rank': rank, 'total': standings_board.total(), 'neighbours': nearby}), 200
+
+@web_application.route('/api/rankings/standings', methods=['GET'])
+@verify_session_active
+@reads_from_replica
+def fetch_scoped_standings():
+    window = request.args.get('window', 'all')
+    course_id = request.args.get('course_id', type=int)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    
+    if window not in STANDINGS_WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(STANDINGS_WINDOWS)}"}), 400
+    
+    if course_id is not None:
+        module = storage_layer.session.get(LearningModule, course_id)
+        if not module:
+            return jsonify({'error': 'Module not found'}), 404
+        person_role = resolve_session_role()
+        if person_role == 'teacher' and module.teacher_id != session['user_id']:
+            return jsonify({'error': 'Insufficient permissions'}), 403
+        if person_role == 'student' and not ClassMembership.query.filter_by(
+                user_id=session['user_id'], course_id=course_id).first():
+            return jsonify({'error': 'Not enrolled'}), 403
+    
+    if window == 'all' and course_id is None:
+        standings = standings_board.page(offset, limit)
+    else:
+        standings = windowed_standings(window, course_id, offset, limit)
+    
     rankings = [
         {
-            'rank': position + 1,
-            'username': perf.username,
-            'points': perf.points,
-            'profile_picture': perf.profile_picture
+            'rank': standing['rank'],
+            'username': standing['username'],
+            'points': standing['points'],
+            'profile_picture': standing['profile_picture'],
+            'avatar_url': thumbnail_url(standing['profile_picture'], LEADERBOARD_THUMBNAIL_SIZE)
         }
-        for position, perf in enumerate(performers)
+        for standing in standings
     ]
-    return jsonify({'leaderboard': rankings}), 200
+    # day/week/month are the current calendar period (UTC), not a rolling span.
+    window_start = None if window == 'all' else period_start(window, datetime.utcnow()).isoformat()
+    return jsonify({'window': window, 'period_start': window_start, 'course_id': course_id,
+                    'leaderboard': rankings}), 200
+
+@web_application.route('/api/live/stream', methods=['GET'])
+@verify_session_active
+def stream_live_events():
+    # The generator does not touch the database, so the request's session is
+    # released as soon as the headers go out.
+    response = web_application.response_class(event_stream(session['user_id']), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @web_application.route('/api/trophies/catalog', methods=['GET'])
 @verify_session_active
 def fetch_trophy_catalog():
-    trophies = TrophyDefinition.query.all()
-    return jsonify({'badges': [t.serialize_info() for t in trophies]}), 200
+    trophies = TrophyDefinition.query
+    return response_cache.respond(
+        ['trophies'], lambda: respond_with_listing(trophies, TrophyDefinition.badge_id, 'badges')
+    )
 
 @web_application.route('/api/trophies/mine', methods=['GET'])
 @verify_session_active
 def fetch_personal_trophies():
-    ownerships = TrophyOwnership.query.filter_by(user_id=session['user_id']).all()
+    ownerships = storage_layer.session.query(TrophyDefinition, TrophyOwnership.earned_at).join(
+        TrophyOwnership, TrophyOwnership.badge_id == TrophyDefinition.badge_id
+    ).filter(TrophyOwnership.user_id == session['user_id']).all()
     trophy_list = []
-    for ownership in ownerships:
-        trophy = TrophyDefinition.query.get(ownership.badge_id)
+    for trophy, earned_at in ownerships:
         trophy_dict = trophy.serialize_info()
-        trophy_dict['earned_at'] = ownership.earned_at.isoformat()
+        trophy_dict['earned_at'] = earned_at.isoformat()
         trophy_list.append(trophy_dict)
     return jsonify({'badges': trophy_list}), 200
 
@@ -514,13 +888,18 @@ def fetch_personal_milestones():
 @web_application.route('/api/activities/catalog', methods=['GET'])
 @verify_session_active
 def fetch_activity_catalog():
-    activities = InteractiveActivity.query.all()
-    return jsonify({'games': [a.serialize_info() for a in activities]}), 200
+    activities = InteractiveActivity.query
+    return response_cache.respond(
+        ['activities'], lambda: respond_with_listing(activities, InteractiveActivity.game_id, 'games')
+    )
 
 @web_application.route('/api/activities/<int:activity_id>/participate', methods=['POST'])
 @verify_role_access('student')
 def record_participation(activity_id):
-    incoming_data = request.get_json()
+    incoming_data = request.get_json(silent=True) or {}
+    score = incoming_data.get('score', 0)
+    if not isinstance(score, int) or isinstance(score, bool):
+        return jsonify({'error': 'Score must be an integer'}), 400
     
     activity = InteractiveActivity.query.get(activity_id)
     if not activity:
@@ -529,54 +908,151 @@ def record_participation(activity_id):
     play_record = PlaySession(
         game_id=activity_id,
         user_id=session['user_id'],
-        score=incoming_data.get('score', 0)
+        score=score
     )
     
-    person = PersonEntity.query.get(session['user_id'])
-    person.points += activity.points_per_play
-    
     storage_layer.session.add(play_record)
-    storage_layer.session.commit()
+    storage_layer.session.flush()
     
-    evaluate_trophy_eligibility(person)
+    grant_points(session['user_id'], activity.points_per_play, 'activity_play', play_record.score_id)
+    emit_milestone_events(session['user_id'], [
+        milestone_event('activity_played', game_id=activity_id, score=score)
+    ])
+    offer_highscore(play_record, session.get('username'))
+    storage_layer.session.commit()
     
     return jsonify({'message': 'Participation recorded', 'points_earned': activity.points_per_play}), 201
 
+MAX_BATCH_PLAYS = 500
+
+@web_application.route('/api/activities/participate-batch', methods=['POST'])
+@verify_role_access('student')
+def record_participation_batch():
+    incoming_data = request.get_json(silent=True) or {}
+    plays = incoming_data.get('plays')
+    
+    if not isinstance(plays, list) or not plays:
+        return jsonify({'error': 'plays must be a non-empty list'}), 400
+    if len(plays) > MAX_BATCH_PLAYS:
+        return jsonify({'error': f'At most {MAX_BATCH_PLAYS} plays per batch'}), 400
+    
+    points_by_game = activity_catalog.points_table()
+    person_id = session['user_id']
+    received_at = datetime.utcnow()
+    play_rows = []
+    rejected = []
+    
+    for position, play in enumerate(plays):
+        game_id = play.get('game_id') if isinstance(play, dict) else None
+        score = play.get('score', 0) if isinstance(play, dict) else None
+        if not isinstance(game_id, int) or isinstance(game_id, bool):
+            rejected.append({'index': position, 'error': 'game_id must be an integer'})
+        elif game_id not in points_by_game:
+            rejected.append({'index': position, 'error': 'Activity not found'})
+        elif not isinstance(score, int) or isinstance(score, bool):
+            rejected.append({'index': position, 'error': 'Score must be an integer'})
+        else:
+            play_rows.append({'game_id': game_id, 'user_id': person_id, 'score': score, 'played_at': received_at})
+    
+    if rejected:
+        return jsonify({'error': 'Invalid plays in batch', 'rejected': rejected}), 400
+    
+    storage_layer.session.execute(insert(PlaySession), play_rows)
+    
+    contenders = [row for row in play_rows if could_place(row['game_id'], row['score'])]
+    if contenders:
+        inserted_plays = storage_layer.session.execute(
+            select(PlaySession.score_id, PlaySession.game_id, PlaySession.user_id,
+                   PlaySession.score, PlaySession.played_at)
+            .where(PlaySession.user_id == person_id,
+                   PlaySession.played_at == received_at,
+                   PlaySession.game_id.in_({row['game_id'] for row in contenders}),
+                   PlaySession.score >= min(row['score'] for row in contenders))
+        ).all()
+        offer_highscores(inserted_plays, session.get('username'))
+    
+    points_earned = sum(points_by_game[row['game_id']] for row in play_rows)
+    if points_earned:
+        grant_points(person_id, points_earned, 'activity_batch')
+    emit_milestone_events(person_id, [
+        milestone_event('activity_played', at=received_at, game_id=row['game_id'], score=row['score'])
+        for row in play_rows
+    ])
+    
+    storage_layer.session.commit()
+    
+    return jsonify({
+        'message': 'Participation batch recorded',
+        'plays_recorded': len(play_rows),
+        'points_earned': points_earned
+    }), 201
+
 @web_application.route('/api/activities/<int:activity_id>/records', methods=['GET'])
 @verify_session_active
+@reads_from_replica
 def fetch_activity_records(activity_id):
-    records = PlaySession.query.filter_by(game_id=activity_id).order_by(
-        PlaySession.score.desc()
-    ).limit(10).all()
-    
-    record_list = []
-    for rec in records:
-        participant = PersonEntity.query.get(rec.user_id)
-        record_list.append({
-            'username': participant.username,
-            'score': rec.score,
-            'played_at': rec.played_at.isoformat()
-        })
+    records = ActivityHighscore.query.filter_by(game_id=activity_id).order_by(
+        ActivityHighscore.score.desc(), ActivityHighscore.score_id
+    ).limit(HIGHSCORE_DEPTH).all()
     
-    return jsonify({'highscores': record_list}), 200
-
-def evaluate_trophy_eligibility(person):
-    trophies = TrophyDefinition.query.all()
-    for trophy in trophies:
-        if person.points >= trophy.points_required:
-            existing_ownership = TrophyOwnership.query.filter_by(
-                user_id=person.user_id,
-                badge_id=trophy.badge_id
-            ).first()
-            
-            if not existing_ownership:
-                ownership = TrophyOwnership(user_id=person.user_id, badge_id=trophy.badge_id)
-                storage_layer.session.add(ownership)
-    
-    storage_layer.session.commit()
+    return jsonify({'highscores': [rec.serialize_info() for rec in records]}), 200
 
 # ===== FILE DELIVERY =====
 
+@web_application.route('/api/uploads/chunked', methods=['POST'])
+@verify_session_active
+def begin_chunked_upload():
+    incoming_data = request.get_json(silent=True) or {}
+    subfolder_name = incoming_data.get('subfolder')
+    total_size = incoming_data.get('total_size')
+    
+    if subfolder_name not in ASSET_SUBFOLDERS or not incoming_data.get('filename'):
+        return jsonify({'error': 'Valid subfolder and filename required'}), 400
+    if not isinstance(total_size, int) or isinstance(total_size, bool) or total_size <= 0:
+        return jsonify({'error': 'total_size must be a positive integer'}), 400
+    if total_size > web_application.config['CHUNKED_UPLOAD_MAX_BYTES']:
+        return jsonify({'error': 'File too large'}), 413
+    if subfolder_name == 'coursework' and resolve_session_role() not in ('teacher', 'admin'):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    
+    pending = open_chunked_upload(session['user_id'], subfolder_name, incoming_data['filename'], total_size)
+    storage_layer.session.commit()
+    
+    return jsonify({'message': 'Upload started', 'upload': pending.serialize_info()}), 201
+
+@web_application.route('/api/uploads/chunked/<upload_id>', methods=['GET'])
+@verify_session_active
+def inspect_chunked_upload(upload_id):
+    pending = storage_layer.session.get(ChunkedUpload, upload_id)
+    if not pending or pending.user_id != session['user_id']:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify({'upload': pending.serialize_info()}), 200
+
+@web_application.route('/api/uploads/chunked/<upload_id>', methods=['PUT'])
+@verify_session_active
+def receive_upload_chunk(upload_id):
+    pending = storage_layer.session.get(ChunkedUpload, upload_id)
+    if not pending or pending.user_id != session['user_id']:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    offset = request.args.get('offset', type=int)
+    if pending.file_url or offset != pending.received_size:
+        return jsonify({'error': 'Offset does not match received size', 'upload': pending.serialize_info()}), 409
+    
+    try:
+        if not append_chunk(pending, request.stream):
+            storage_layer.session.rollback()
+            return jsonify({'error': 'Chunk exceeds declared total size'}), 413
+    except ChunkOffsetMoved:
+        storage_layer.session.rollback()
+        pending = storage_layer.session.get(ChunkedUpload, upload_id)
+        return jsonify({'error': 'Offset does not match received size', 'upload': pending.serialize_info()}), 409
+    
+    storage_layer.session.commit()
+    return jsonify({'upload': pending.serialize_info()}), 200
+
 @web_application.route('/uploads/<path:asset_path>')
 def deliver_asset(asset_path):
-    return send_from_directory(web_application.config['FILE_STORAGE_PATH'], asset_path)
+    if asset_path.startswith('thumbnails/'):
+        return deliver_thumbnail(asset_path)
+    return deliver_stored_asset(asset_path)
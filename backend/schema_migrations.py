@@ -0,0 +1,198 @@
+import click
+from datetime import datetime
+from sqlalchemy import inspect, select, text, insert
+from models import (storage_layer, SchemaVersion, PersonEntity, CredentialResetTicket, LearningModule,
+                    ClassMembership, ResourceDocument, TaskItem, WorkSubmission, TrophyOwnership,
+                    PlaySession, PointsEvent, ActivityHighscore, StoredBlob, ChunkedUpload,
+                    DeferredJob, MilestoneRecord, MilestoneCounter, PointsBucket, ArchivedPlay, PlayRollup,
+                    PlatformCounter, PlatformSnapshot)
+from highscore_board import rebuild_highscores
+from point_buckets import rebuild_point_buckets
+from platform_stats import refresh_platform_stats
+
+REGISTERED_MIGRATIONS = []
+DUPLICATE_GROUPS_REPORTED = 20
+
+
+class DuplicateRowsFound(Exception):
+    pass
+
+
+def schema_migration(version, name):
+    def register(migration_func):
+        REGISTERED_MIGRATIONS.append((version, name, migration_func))
+        REGISTERED_MIGRATIONS.sort(key=lambda entry: entry[0])
+        return migration_func
+    return register
+
+
+# Migrations are forward-only and must be safe to re-run: MySQL commits DDL
+# implicitly, so a migration interrupted halfway is simply applied again.
+
+def create_named_index(connection, model, index_name):
+    index = next(ix for ix in model.__table__.indexes if ix.name == index_name)
+    existing = {ix['name'] for ix in inspect(connection).get_indexes(model.__tablename__)}
+    if index_name not in existing:
+        index.create(connection)
+
+
+def duplicate_row_report(connection, table_name, key_column, grouping_columns):
+    # Rows that would break a new unique index are reported, never deleted:
+    # a duplicate submission can carry later work, a grade or feedback, so
+    # which row to keep is for an operator to decide.
+    grouping = ', '.join(grouping_columns)
+    matching = ' AND '.join(f'listed.{column} = duplicated.{column}' for column in grouping_columns)
+    rows = connection.execute(text(
+        f'SELECT listed.{key_column}, {", ".join(f"listed.{column}" for column in grouping_columns)} '
+        f'FROM {table_name} listed JOIN (SELECT {grouping} FROM {table_name} '
+        f'GROUP BY {grouping} HAVING COUNT(*) > 1) duplicated ON {matching} '
+        f'ORDER BY {", ".join(f"listed.{column}" for column in grouping_columns)}, listed.{key_column}'
+    )).all()
+    if not rows:
+        return None
+
+    ids_by_group = {}
+    for row in rows:
+        ids_by_group.setdefault(tuple(row[1:]), []).append(row[0])
+    listed = [
+        f"  ({', '.join(map(str, group))}): {key_column} {', '.join(map(str, ids))}"
+        for group, ids in list(ids_by_group.items())[:DUPLICATE_GROUPS_REPORTED]
+    ]
+    if len(ids_by_group) > DUPLICATE_GROUPS_REPORTED:
+        listed.append(f'  ... and {len(ids_by_group) - DUPLICATE_GROUPS_REPORTED} more')
+    return '\n'.join([f'{table_name} has {len(ids_by_group)} duplicated ({grouping}) group(s):'] + listed)
+
+
+def refuse_duplicate_rows(connection, checks):
+    reports = [report for report in (duplicate_row_report(connection, *check) for check in checks) if report]
+    if reports:
+        raise DuplicateRowsFound(
+            'Unique indexes cannot be added while these rows are duplicated. Merge or remove them by hand, '
+            'then run the migration again.\n' + '\n'.join(reports)
+        )
+
+
+def add_missing_column(connection, table_name, column_name, column_ddl):
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    if column_name not in existing:
+        connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}'))
+
+
+@schema_migration(1, 'hot path indexes and uniqueness constraints')
+def add_hot_path_indexes(connection):
+    refuse_duplicate_rows(connection, [
+        ('enrollments', 'enrollment_id', ['user_id', 'course_id']),
+        ('submissions', 'submission_id', ['assignment_id', 'student_id']),
+        ('user_badges', 'user_badge_id', ['user_id', 'badge_id'])
+    ])
+
+    create_named_index(connection, ClassMembership, 'uq_enrollments_user_course')
+    create_named_index(connection, ClassMembership, 'ix_enrollments_course')
+    create_named_index(connection, WorkSubmission, 'uq_submissions_assignment_student')
+    create_named_index(connection, PlaySession, 'ix_game_scores_game_score')
+    create_named_index(connection, TrophyOwnership, 'uq_user_badges_user_badge')
+    create_named_index(connection, PersonEntity, 'ix_users_role_points')
+    create_named_index(connection, LearningModule, 'ix_courses_teacher')
+    create_named_index(connection, ResourceDocument, 'ix_coursework_course')
+    create_named_index(connection, TaskItem, 'ix_assignments_course')
+    create_named_index(connection, CredentialResetTicket, 'ix_password_reset_tokens_token_used')
+
+
+@schema_migration(2, 'points ledger and access claim versions')
+def add_points_ledger(connection):
+    PointsEvent.__table__.create(connection, checkfirst=True)
+    add_missing_column(connection, 'users', 'access_version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+@schema_migration(3, 'per-game top-K high score table')
+def add_highscore_table(connection):
+    ActivityHighscore.__table__.create(connection, checkfirst=True)
+    rebuild_highscores(connection)
+
+
+@schema_migration(4, 'content-addressed upload store')
+def add_upload_store(connection):
+    StoredBlob.__table__.create(connection, checkfirst=True)
+    ChunkedUpload.__table__.create(connection, checkfirst=True)
+
+
+@schema_migration(5, 'durable job queue')
+def add_job_queue(connection):
+    DeferredJob.__table__.create(connection, checkfirst=True)
+
+
+@schema_migration(6, 'milestone counters and award keys')
+def add_milestone_counters(connection):
+    MilestoneCounter.__table__.create(connection, checkfirst=True)
+    add_missing_column(connection, 'achievements', 'milestone_key', 'VARCHAR(80)')
+    create_named_index(connection, MilestoneRecord, 'uq_achievements_user_milestone')
+
+
+@schema_migration(7, 'windowed point buckets')
+def add_point_buckets(connection):
+    PointsBucket.__table__.create(connection, checkfirst=True)
+    rebuild_point_buckets(connection)
+
+
+@schema_migration(8, 'play history archive and daily roll-ups')
+def add_play_history_tiers(connection):
+    ArchivedPlay.__table__.create(connection, checkfirst=True)
+    PlayRollup.__table__.create(connection, checkfirst=True)
+
+
+@schema_migration(9, 'platform statistics counters and snapshot')
+def add_platform_stats(connection):
+    PlatformCounter.__table__.create(connection, checkfirst=True)
+    PlatformSnapshot.__table__.create(connection, checkfirst=True)
+    refresh_platform_stats(connection)
+
+
+@schema_migration(10, 'play time index for daily play counts')
+def add_play_time_index(connection):
+    create_named_index(connection, PlaySession, 'ix_game_scores_played_at')
+
+
+def applied_versions(engine):
+    SchemaVersion.__table__.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return set(connection.execute(select(SchemaVersion.version)).scalars())
+
+
+def apply_pending_migrations(engine=None, announce=None):
+    engine = engine or storage_layer.engine
+    completed = applied_versions(engine)
+    newly_applied = []
+
+    for version, name, migration_func in REGISTERED_MIGRATIONS:
+        if version in completed:
+            continue
+        if announce:
+            announce(f'Applying migration {version:04d}: {name}')
+        with engine.begin() as connection:
+            migration_func(connection)
+            connection.execute(insert(SchemaVersion).values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        newly_applied.append(version)
+
+    return newly_applied
+
+
+def init_app(app):
+    @app.cli.command('migrate-schema')
+    def migrate_schema_command():
+        """Create missing tables, then apply pending schema migrations."""
+        storage_layer.create_all()
+        try:
+            applied = apply_pending_migrations(announce=click.echo)
+        except DuplicateRowsFound as error:
+            raise click.ClickException(str(error))
+        click.echo(f'{len(applied)} migration(s) applied')
+
+    @app.cli.command('schema-status')
+    def schema_status_command():
+        """List schema migrations and whether they are applied."""
+        completed = applied_versions(storage_layer.engine)
+        for version, name, migration_func in REGISTERED_MIGRATIONS:
+            marker = 'applied' if version in completed else 'pending'
+            click.echo(f'{version:04d}  {marker:8}  {name}')
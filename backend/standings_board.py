@@ -0,0 +1,302 @@
+import random
+import threading
+import time
+from sqlalchemy import select
+from models import storage_layer, PersonEntity
+
+MAX_LEVEL = 24
+PROMOTION_ODDS = 0.25
+STANDINGS_RESEED_SECONDS = 60
+
+
+class RankNode:
+    __slots__ = ('key', 'forward', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.forward = [None] * level
+        self.span = [0] * level
+
+
+class IndexedSkipList:
+    # Order-statistic skip list: every forward pointer remembers how many
+    # positions it jumps, so insert, remove, rank and lookup by index are all
+    # O(log n) on average.
+
+    def __init__(self):
+        self.head = RankNode(None, MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _draw_level(self):
+        level = 1
+        while level < MAX_LEVEL and random.random() < PROMOTION_ODDS:
+            level += 1
+        return level
+
+    def insert(self, key):
+        trail = [None] * MAX_LEVEL
+        trail_rank = [0] * MAX_LEVEL
+        cursor = self.head
+        for depth in range(self.level - 1, -1, -1):
+            trail_rank[depth] = trail_rank[depth + 1] if depth + 1 < self.level else 0
+            while cursor.forward[depth] is not None and cursor.forward[depth].key < key:
+                trail_rank[depth] += cursor.span[depth]
+                cursor = cursor.forward[depth]
+            trail[depth] = cursor
+
+        new_level = self._draw_level()
+        if new_level > self.level:
+            for depth in range(self.level, new_level):
+                trail[depth] = self.head
+                trail_rank[depth] = 0
+                self.head.span[depth] = self.size
+            self.level = new_level
+
+        node = RankNode(key, new_level)
+        for depth in range(new_level):
+            node.forward[depth] = trail[depth].forward[depth]
+            trail[depth].forward[depth] = node
+            node.span[depth] = trail[depth].span[depth] - (trail_rank[0] - trail_rank[depth])
+            trail[depth].span[depth] = (trail_rank[0] - trail_rank[depth]) + 1
+
+        for depth in range(new_level, self.level):
+            trail[depth].span[depth] += 1
+
+        self.size += 1
+
+    def remove(self, key):
+        trail = [None] * MAX_LEVEL
+        cursor = self.head
+        for depth in range(self.level - 1, -1, -1):
+            while cursor.forward[depth] is not None and cursor.forward[depth].key < key:
+                cursor = cursor.forward[depth]
+            trail[depth] = cursor
+
+        target = cursor.forward[0]
+        if target is None or target.key != key:
+            return False
+
+        for depth in range(self.level):
+            if trail[depth].forward[depth] is target:
+                trail[depth].span[depth] += target.span[depth] - 1
+                trail[depth].forward[depth] = target.forward[depth]
+            else:
+                trail[depth].span[depth] -= 1
+
+        while self.level > 1 and self.head.forward[self.level - 1] is None:
+            self.head.span[self.level - 1] = 0
+            self.level -= 1
+
+        self.size -= 1
+        return True
+
+    def index_of(self, key):
+        position = 0
+        cursor = self.head
+        for depth in range(self.level - 1, -1, -1):
+            while cursor.forward[depth] is not None and cursor.forward[depth].key <= key:
+                position += cursor.span[depth]
+                cursor = cursor.forward[depth]
+            if cursor.key == key:
+                return position - 1
+        return None
+
+    def slice(self, offset, count):
+        if offset < 0 or count <= 0 or offset >= self.size:
+            return []
+
+        traversed = 0
+        cursor = self.head
+        for depth in range(self.level - 1, -1, -1):
+            while cursor.forward[depth] is not None and traversed + cursor.span[depth] <= offset:
+                traversed += cursor.span[depth]
+                cursor = cursor.forward[depth]
+
+        keys = []
+        cursor = cursor.forward[0]
+        while cursor is not None and len(keys) < count:
+            keys.append(cursor.key)
+            cursor = cursor.forward[0]
+        return keys
+
+
+class StandingsBoard:
+    # Student leaderboard kept in process. Entries are ordered by
+    # (-points, user_id) so the skip list order is the ranking order and ties
+    # keep a stable position.
+    #
+    # Every worker holds its own copy and only applies the changes it commits
+    # itself, so the copy is rebuilt from the primary once it is
+    # reseed_seconds old. Readers keep using the old copy meanwhile, and
+    # changes applied during the rebuild are journaled and replayed onto the
+    # new one.
+
+    def __init__(self, reseed_seconds=STANDINGS_RESEED_SECONDS):
+        self.lock = threading.RLock()
+        self.ordering = IndexedSkipList()
+        self.entries = {}
+        self.seeded = False
+        self.seeded_at = 0.0
+        self.reseed_seconds = reseed_seconds
+        self.journal = None
+
+    def init_app(self, app):
+        self.reseed_seconds = app.config.get('STANDINGS_RESEED_SECONDS', STANDINGS_RESEED_SECONDS)
+
+    def ensure_seeded(self):
+        if self.seeded:
+            if time.monotonic() - self.seeded_at >= self.reseed_seconds:
+                self.reseed()
+            return
+        with self.lock:
+            if self.seeded:
+                return
+            ordering, entries = self._load()
+            self.ordering, self.entries = ordering, entries
+            self.seeded = True
+            self.seeded_at = time.monotonic()
+
+    def reseed(self):
+        with self.lock:
+            if self.journal is not None or time.monotonic() - self.seeded_at < self.reseed_seconds:
+                return
+            self.journal = []
+        try:
+            ordering, entries = self._load()
+        except Exception:
+            with self.lock:
+                self.journal = None
+            raise
+        with self.lock:
+            journal, self.journal = self.journal, None
+            self.ordering, self.entries = ordering, entries
+            for change, change_args in journal:
+                change(*change_args)
+            self.seeded_at = time.monotonic()
+
+    def _load(self):
+        # Always seeded from the primary: between reseeds the board is only
+        # corrected by later point changes, so a lagging replica would leave
+        # it behind.
+        rows = storage_layer.session.execute(
+            select(PersonEntity.user_id, PersonEntity.username,
+                   PersonEntity.points, PersonEntity.profile_picture)
+            .where(PersonEntity.role == 'student'),
+            bind_arguments={'bind': storage_layer.engine}
+        ).all()
+        ordering = IndexedSkipList()
+        entries = {}
+        for row in rows:
+            entries[row.user_id] = {
+                'username': row.username,
+                'points': row.points or 0,
+                'profile_picture': row.profile_picture
+            }
+            ordering.insert((-(row.points or 0), row.user_id))
+        return ordering, entries
+
+    def reset(self):
+        with self.lock:
+            self.ordering = IndexedSkipList()
+            self.entries = {}
+            self.seeded = False
+            self.journal = None
+
+    def _place(self, user_id, username, points, profile_picture):
+        previous = self.entries.get(user_id)
+        if previous is not None:
+            self.ordering.remove((-previous['points'], user_id))
+        self.entries[user_id] = {
+            'username': username,
+            'points': points,
+            'profile_picture': profile_picture
+        }
+        self.ordering.insert((-points, user_id))
+
+    def _apply(self, change, *change_args):
+        if not self.seeded:
+            return
+        with self.lock:
+            change(*change_args)
+            if self.journal is not None:
+                self.journal.append((change, change_args))
+
+    def record_person(self, person):
+        self._apply(self._record, person.user_id, person.role, person.username,
+                    person.points or 0, person.profile_picture)
+
+    def _record(self, user_id, role, username, points, profile_picture):
+        if role != 'student':
+            self._discard(user_id)
+            return
+        self._place(user_id, username, points, profile_picture)
+
+    def record_new_students(self, people):
+        self._apply(self._record_new, list(people))
+
+    def _record_new(self, people):
+        for user_id, username in people:
+            self._place(user_id, username, 0, None)
+
+    def place_points(self, user_id, points):
+        self._apply(self._place_points, user_id, points)
+
+    def _place_points(self, user_id, points):
+        entry = self.entries.get(user_id)
+        if entry is None or entry['points'] == points:
+            return
+        self._place(user_id, entry['username'], points, entry['profile_picture'])
+
+    def discard_person(self, user_id):
+        self._apply(self._discard, user_id)
+
+    def _discard(self, user_id):
+        previous = self.entries.pop(user_id, None)
+        if previous is not None:
+            self.ordering.remove((-previous['points'], user_id))
+
+    def _describe(self, key, position):
+        entry = self.entries[key[1]]
+        return {
+            'rank': position + 1,
+            'user_id': key[1],
+            'username': entry['username'],
+            'points': entry['points'],
+            'profile_picture': entry['profile_picture']
+        }
+
+    def page(self, offset, limit):
+        self.ensure_seeded()
+        with self.lock:
+            keys = self.ordering.slice(offset, limit)
+            return [self._describe(key, offset + index) for index, key in enumerate(keys)]
+
+    def rank_of(self, user_id):
+        self.ensure_seeded()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            return self.ordering.index_of((-entry['points'], user_id))
+
+    def neighbourhood(self, user_id, radius):
+        self.ensure_seeded()
+        with self.lock:
+            position = self.rank_of(user_id)
+            if position is None:
+                return None, []
+            first = max(position - radius, 0)
+            keys = self.ordering.slice(first, position - first + radius + 1)
+            return position + 1, [self._describe(key, first + index) for index, key in enumerate(keys)]
+
+    def total(self):
+        self.ensure_seeded()
+        with self.lock:
+            return len(self.ordering)
+
+
+standings_board = StandingsBoard()
@@ -0,0 +1,105 @@
+import bisect
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select, insert, exists, literal
+from models import storage_layer, PersonEntity, TrophyDefinition, TrophyOwnership
+from job_queue import job_handler, enqueue_job
+from live_events import notify_after_commit
+from platform_stats import bump_platform_counter
+
+THRESHOLD_CACHE_SECONDS = 60
+
+
+class TrophyThresholdIndex:
+    # Badge thresholds sorted by points_required. Reloaded after an admin adds
+    # a badge in this process, and at most every THRESHOLD_CACHE_SECONDS to
+    # pick up badges created through other workers.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thresholds = []
+        self.badge_ids = []
+        self.loaded_at = None
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def _refresh(self):
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < THRESHOLD_CACHE_SECONDS:
+            return
+        rows = storage_layer.session.execute(
+            select(TrophyDefinition.points_required, TrophyDefinition.badge_id)
+            .order_by(TrophyDefinition.points_required, TrophyDefinition.badge_id)
+        ).all()
+        self.thresholds = [row.points_required or 0 for row in rows]
+        self.badge_ids = [row.badge_id for row in rows]
+        self.loaded_at = time.monotonic()
+
+    def crossed(self, old_points, new_points):
+        with self.lock:
+            self._refresh()
+            upper = bisect.bisect_right(self.thresholds, new_points)
+            # A learner still on zero points has never been evaluated, so every
+            # badge up to the new total is a candidate, zero-point badges included.
+            lower = bisect.bisect_right(self.thresholds, old_points) if old_points > 0 else 0
+            return self.badge_ids[lower:upper]
+
+
+trophy_index = TrophyThresholdIndex()
+
+
+def schedule_trophy_check(user_id, old_points, new_points):
+    # The cached thresholds decide in process whether any badge is in reach;
+    # only then is the award itself queued.
+    if trophy_index.crossed(old_points or 0, new_points or 0):
+        enqueue_job('trophies.grant_crossed',
+                    {'user_id': user_id, 'old_points': old_points, 'new_points': new_points},
+                    idempotency_key=f'trophies:{user_id}:{old_points}:{new_points}')
+
+
+@job_handler('trophies.grant_crossed')
+def grant_crossed_trophies(user_id, old_points, new_points):
+    badge_ids = trophy_index.crossed(old_points or 0, new_points or 0)
+    if not badge_ids:
+        return
+
+    already_owned = exists().where(
+        TrophyOwnership.user_id == user_id,
+        TrophyOwnership.badge_id == TrophyDefinition.badge_id
+    )
+    earned = storage_layer.session.execute(
+        select(TrophyDefinition.badge_id, TrophyDefinition.name, TrophyDefinition.icon)
+        .where(TrophyDefinition.badge_id.in_(badge_ids), ~already_owned)
+    ).all()
+    if not earned:
+        return
+
+    candidates = select(
+        literal(user_id), TrophyDefinition.badge_id, literal(datetime.utcnow())
+    ).where(TrophyDefinition.badge_id.in_([badge.badge_id for badge in earned]), ~already_owned)
+
+    granted = storage_layer.session.execute(
+        insert(TrophyOwnership).from_select(['user_id', 'badge_id', 'earned_at'], candidates)
+    )
+    bump_platform_counter('badges_awarded', granted.rowcount)
+    for badge in earned:
+        notify_after_commit(user_id, 'badge_earned', {
+            'badge_id': badge.badge_id, 'name': badge.name, 'icon': badge.icon
+        })
+
+
+def grant_trophy_retroactively(trophy):
+    already_owned = exists().where(
+        TrophyOwnership.user_id == PersonEntity.user_id,
+        TrophyOwnership.badge_id == trophy.badge_id
+    )
+    qualifying = select(
+        PersonEntity.user_id, literal(trophy.badge_id), literal(datetime.utcnow())
+    ).where(PersonEntity.points > 0, PersonEntity.points >= (trophy.points_required or 0), ~already_owned)
+
+    granted = storage_layer.session.execute(
+        insert(TrophyOwnership).from_select(['user_id', 'badge_id', 'earned_at'], qualifying)
+    )
+    bump_platform_counter('badges_awarded', granted.rowcount)
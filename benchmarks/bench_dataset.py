@@ -0,0 +1,197 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from models import (storage_layer, PersonEntity, CredentialResetTicket, LearningModule, ClassMembership,
+                    ResourceDocument, TaskItem, WorkSubmission, TrophyDefinition, TrophyOwnership,
+                    InteractiveActivity, PlaySession, PointsBucket)
+from credential_pool import hash_credential
+from schema_migrations import apply_pending_migrations
+from highscore_board import rebuild_highscores
+from point_buckets import BUCKET_GRANULARITIES, period_start
+from platform_stats import refresh_platform_stats
+
+BENCH_PASSWORD = 'benchmark'
+BENCH_HASH_ROUNDS = 4
+INSERT_BATCH_SIZE = 50000
+PLAY_HISTORY_DAYS = 60
+
+
+class DatasetShape:
+    # Row counts for the generated dataset. Users 1..admins are admins, the
+    # next teachers are teachers and everybody else is a student.
+
+    def __init__(self, students=5000, teachers=50, admins=1, courses=200, enrollments_per_student=3,
+                 assignments_per_course=5, materials_per_course=5, submissions_per_student=4,
+                 games=20, badges=20, game_scores=1000000, reset_tokens=5000):
+        self.students = students
+        self.teachers = teachers
+        self.admins = admins
+        self.courses = courses
+        self.enrollments_per_student = enrollments_per_student
+        self.assignments_per_course = assignments_per_course
+        self.materials_per_course = materials_per_course
+        self.submissions_per_student = submissions_per_student
+        self.games = games
+        self.badges = badges
+        self.game_scores = game_scores
+        self.reset_tokens = reset_tokens
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    @property
+    def first_teacher_id(self):
+        return self.admins + 1
+
+    @property
+    def first_student_id(self):
+        return self.admins + self.teachers + 1
+
+    @property
+    def last_student_id(self):
+        return self.admins + self.teachers + self.students
+
+    def teacher_of(self, course_id):
+        return self.first_teacher_id + (course_id - 1) % self.teachers
+
+
+def batched(rows, batch_size=INSERT_BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(connection, model, rows):
+    inserted = 0
+    for batch in batched(rows):
+        connection.execute(insert(model), batch)
+        inserted += len(batch)
+    return inserted
+
+
+def person_rows(shape, generator, password_hash, created):
+    for user_id in range(1, shape.last_student_id + 1):
+        if user_id < shape.first_teacher_id:
+            role, username = 'admin', f'bench_admin_{user_id}'
+        elif user_id < shape.first_student_id:
+            role, username = 'teacher', f'bench_teacher_{user_id}'
+        else:
+            role, username = 'student', f'bench_student_{user_id}'
+        yield {
+            'user_id': user_id, 'username': username, 'email': f'{username}@bench.test',
+            'password_hash': password_hash, 'role': role, 'access_version': 0, 'created_at': created,
+            'points': generator.randint(0, 5000) if role == 'student' else 0
+        }
+
+
+def generate_dataset(engine, shape, seed=7, announce=None):
+    # Every row is derived from the seed, so two runs with the same shape and
+    # seed produce the same data; only play times, reset expiries and point
+    # buckets follow the current date. Rows go in through executemany in
+    # batches of INSERT_BATCH_SIZE.
+    generator = random.Random(seed)
+    created = datetime(2026, 1, 5, 12, 0, 0)
+    now = datetime.utcnow()
+    student_ids = range(shape.first_student_id, shape.last_student_id + 1)
+    assignment_count = shape.courses * shape.assignments_per_course
+
+    storage_layer.metadata.create_all(engine)
+    apply_pending_migrations(engine)
+
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA synchronous = OFF')
+
+        password_hash = hash_credential(BENCH_PASSWORD, BENCH_HASH_ROUNDS)
+        points_by_student = {}
+        people = []
+        for row in person_rows(shape, generator, password_hash, created):
+            if row['role'] == 'student':
+                points_by_student[row['user_id']] = row['points']
+            people.append(row)
+        insert_rows(connection, PersonEntity, people)
+
+        insert_rows(connection, CredentialResetTicket, (
+            {'user_id': student_ids[n % shape.students], 'token': f'bench-reset-{n}',
+             'expires_at': now + timedelta(days=30), 'used': False, 'created_at': created}
+            for n in range(shape.reset_tokens)
+        ))
+        insert_rows(connection, LearningModule, (
+            {'course_id': course_id, 'course_name': f'Bench Course {course_id}',
+             'teacher_id': shape.teacher_of(course_id), 'created_at': created}
+            for course_id in range(1, shape.courses + 1)
+        ))
+        insert_rows(connection, ClassMembership, (
+            {'user_id': student_id, 'course_id': course_id, 'enrollment_date': created}
+            for student_id in student_ids
+            for course_id in generator.sample(range(1, shape.courses + 1),
+                                              min(shape.enrollments_per_student, shape.courses))
+        ))
+        insert_rows(connection, ResourceDocument, (
+            {'course_id': n % shape.courses + 1, 'title': f'Notes {n}', 'content': 'Reading list',
+             'created_by': shape.teacher_of(n % shape.courses + 1), 'created_at': created}
+            for n in range(shape.courses * shape.materials_per_course)
+        ))
+        insert_rows(connection, TaskItem, (
+            {'course_id': n % shape.courses + 1, 'title': f'Task {n}', 'points': 10,
+             'created_by': shape.teacher_of(n % shape.courses + 1), 'created_at': created}
+            for n in range(assignment_count)
+        ))
+        if announce:
+            announce(f'{len(people)} users, {shape.courses} courses, {assignment_count} assignments')
+
+        submissions = insert_rows(connection, WorkSubmission, (
+            {'assignment_id': assignment_id, 'student_id': student_id, 'content': 'work', 'submitted_at': created,
+             **({'grade': generator.randint(40, 100), 'graded_by': shape.first_teacher_id, 'graded_at': created}
+                if generator.random() < 0.5 else {'grade': None, 'graded_by': None, 'graded_at': None})}
+            for student_id in student_ids
+            for assignment_id in generator.sample(range(1, assignment_count + 1),
+                                                  min(shape.submissions_per_student, assignment_count))
+        ))
+        if announce:
+            announce(f'{submissions} submissions')
+
+        insert_rows(connection, TrophyDefinition, (
+            {'badge_id': n + 1, 'name': f'Bench Badge {n + 1}', 'points_required': n * 250, 'created_at': created}
+            for n in range(shape.badges)
+        ))
+        insert_rows(connection, TrophyOwnership, (
+            {'user_id': student_id, 'badge_id': n + 1, 'earned_at': created}
+            for student_id in student_ids
+            for n in range(shape.badges)
+            if points_by_student[student_id] > 0 and n * 250 <= points_by_student[student_id]
+        ))
+        insert_rows(connection, InteractiveActivity, (
+            {'game_id': n + 1, 'name': f'Bench Game {n + 1}', 'points_per_play': 10, 'created_at': created}
+            for n in range(shape.games)
+        ))
+
+        history_seconds = PLAY_HISTORY_DAYS * 24 * 3600
+        plays = insert_rows(connection, PlaySession, (
+            {'game_id': generator.randint(1, shape.games),
+             'user_id': generator.randint(shape.first_student_id, shape.last_student_id),
+             'score': generator.randint(0, 100000),
+             'played_at': now - timedelta(seconds=generator.randrange(history_seconds))}
+            for _ in range(shape.game_scores)
+        ))
+        if announce:
+            announce(f'{plays} game scores')
+
+        insert_rows(connection, PointsBucket, (
+            {'user_id': student_id, 'granularity': granularity, 'period_start': period_start(granularity, now),
+             'points': generator.randint(1, 500)}
+            for student_id in student_ids
+            for granularity in BUCKET_GRANULARITIES
+        ))
+        rebuild_highscores(connection)
+        refresh_platform_stats(connection)
+
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            connection.execute(text('ANALYZE'))
+            connection.commit()
@@ -0,0 +1,441 @@
+import io
+import itertools
+import json
+import random
+import uuid
+from urllib.parse import urlencode
+from PIL import Image
+from bench_dataset import BENCH_PASSWORD
+
+CHUNK_BYTES = 64 * 1024
+
+
+class BenchRequest:
+    # One timed request. Bodies are encoded up front so both transports send
+    # exactly the same bytes.
+
+    def __init__(self, method, path, json_body=None, form=None, files=None, raw=None,
+                 session=None, streaming=False):
+        self.method = method
+        self.path = path
+        self.session = session
+        self.streaming = streaming
+        if json_body is not None:
+            self.body, self.content_type = json.dumps(json_body).encode(), 'application/json'
+        elif files:
+            self.body, self.content_type = encode_multipart(form or {}, files)
+        elif form is not None:
+            self.body, self.content_type = urlencode(form).encode(), 'application/x-www-form-urlencoded'
+        elif raw is not None:
+            self.body, self.content_type = raw, 'application/octet-stream'
+        else:
+            self.body, self.content_type = None, None
+
+
+def encode_multipart(form, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def sample_png(seed):
+    generator = random.Random(seed)
+    picture = Image.new('RGB', (256, 256), tuple(generator.randrange(256) for _ in range(3)))
+    encoded = io.BytesIO()
+    picture.save(encoded, 'PNG')
+    return encoded.getvalue()
+
+
+class BenchContext:
+    # Shared, seeded state for building requests: the dataset shape, one RNG
+    # and counters for names that have to be unique across the run.
+
+    def __init__(self, shape, seed):
+        self.shape = shape
+        self.rng = random.Random(seed)
+        self.sequence = itertools.count(1)
+        self.reset_tokens = itertools.count(0)
+        self.picture = sample_png(seed)
+        self.asset_url = None
+        self.thumbnail_url = None
+
+    def unique(self, prefix):
+        return f'{prefix}_{next(self.sequence)}_{uuid.uuid4().hex[:6]}'
+
+    def any_course(self):
+        return self.rng.randint(1, self.shape.courses)
+
+    def any_student(self):
+        return self.rng.randint(self.shape.first_student_id, self.shape.last_student_id)
+
+    def any_assignment(self):
+        return self.rng.randint(1, self.shape.courses * self.shape.assignments_per_course)
+
+    def any_submission(self):
+        return self.rng.randint(1, self.shape.students * self.shape.submissions_per_student)
+
+    def any_game(self):
+        return self.rng.randint(1, self.shape.games)
+
+    def course_taught_by(self, teacher_id):
+        first_course = teacher_id - self.shape.first_teacher_id + 1
+        taught = range(first_course, self.shape.courses + 1, self.shape.teachers)
+        return self.rng.choice(taught) if taught else first_course
+
+
+class Scenario:
+
+    def __init__(self, name, rule, method, role, build):
+        self.name = name
+        self.rule = rule
+        self.method = method
+        self.role = role
+        self.build = build
+
+
+SCENARIOS = []
+
+
+def scenario(rule, method='GET', role='student', name=None):
+    def register(build):
+        SCENARIOS.append(Scenario(name or f'{method} {rule}', rule, method, role, build))
+        return build
+    return register
+
+
+def created_id(payload, collection, key):
+    return json.loads(payload)[collection][key]
+
+
+# ===== AUTHENTICATION =====
+
+@scenario('/', role=None)
+def landing(context, worker):
+    return BenchRequest('GET', '/')
+
+
+@scenario('/api/auth/signup', 'POST', role=None)
+def signup(context, worker):
+    username = context.unique('bench_new')
+    return BenchRequest('POST', '/api/auth/signup', json_body={
+        'username': username, 'email': f'{username}@bench.test', 'password': BENCH_PASSWORD
+    })
+
+
+@scenario('/api/auth/signin', 'POST', role=None)
+def signin(context, worker):
+    return BenchRequest('POST', '/api/auth/signin', json_body={
+        'username': worker.usernames['student'], 'password': BENCH_PASSWORD
+    })
+
+
+@scenario('/api/auth/signout', 'POST', role=None)
+def signout(context, worker):
+    return BenchRequest('POST', '/api/auth/signout', session=worker.fresh_session('student'))
+
+
+@scenario('/api/auth/whoami')
+def whoami(context, worker):
+    return BenchRequest('GET', '/api/auth/whoami')
+
+
+@scenario('/api/auth/request-reset', 'POST', role=None)
+def request_reset(context, worker):
+    return BenchRequest('POST', '/api/auth/request-reset', json_body={
+        'email': f'bench_student_{context.any_student()}@bench.test'
+    })
+
+
+@scenario('/api/auth/finalize-reset', 'POST', role=None)
+def finalize_reset(context, worker):
+    return BenchRequest('POST', '/api/auth/finalize-reset', json_body={
+        'token': f'bench-reset-{next(context.reset_tokens)}', 'new_password': BENCH_PASSWORD
+    })
+
+
+# ===== PROFILE =====
+
+@scenario('/api/profile/modify', 'PUT')
+def modify_profile(context, worker):
+    return BenchRequest('PUT', '/api/profile/modify', json_body={
+        'email': f"{worker.usernames['student']}@bench.test"
+    })
+
+
+@scenario('/api/profile/avatar-upload', 'POST')
+def avatar_upload(context, worker):
+    return BenchRequest('POST', '/api/profile/avatar-upload', files={'picture': ('avatar.png', context.picture)})
+
+
+# ===== ADMIN =====
+
+@scenario('/api/admin/person-list', role='admin')
+def person_list(context, worker):
+    return BenchRequest('GET', f'/api/admin/person-list?limit=100&after={context.any_student()}')
+
+
+@scenario('/api/admin/person-remove/<int:person_id>', 'DELETE', role='admin')
+def person_remove(context, worker):
+    username = context.unique('bench_removed')
+    status, headers, payload = worker.sessions[None].send(BenchRequest('POST', '/api/auth/signup', json_body={
+        'username': username, 'email': f'{username}@bench.test', 'password': BENCH_PASSWORD
+    }))
+    return BenchRequest('DELETE', f"/api/admin/person-remove/{created_id(payload, 'user', 'user_id')}")
+
+
+@scenario('/api/admin/person-role-change/<int:person_id>', 'PUT', role='admin')
+def person_role_change(context, worker):
+    return BenchRequest('PUT', f'/api/admin/person-role-change/{context.any_student()}',
+                        json_body={'role': 'student'})
+
+
+@scenario('/api/admin/trophy-create', 'POST', role='admin')
+def trophy_create(context, worker):
+    return BenchRequest('POST', '/api/admin/trophy-create', json_body={
+        'name': context.unique('Bench Trophy'), 'points_required': 1000000 + next(context.sequence)
+    })
+
+
+@scenario('/api/admin/activity-create', 'POST', role='admin')
+def activity_create(context, worker):
+    return BenchRequest('POST', '/api/admin/activity-create', json_body={
+        'name': context.unique('Bench Activity'), 'points_per_play': 10
+    })
+
+
+@scenario('/api/admin/job-queue', role='admin')
+def job_queue(context, worker):
+    return BenchRequest('GET', '/api/admin/job-queue')
+
+
+@scenario('/api/admin/platform-stats', role='admin')
+def platform_stats(context, worker):
+    return BenchRequest('GET', '/api/admin/platform-stats')
+
+
+@scenario('/metrics', role='admin')
+def metrics(context, worker):
+    return BenchRequest('GET', '/metrics')
+
+
+# ===== COURSES =====
+
+@scenario('/api/modules/list')
+def module_list(context, worker):
+    return BenchRequest('GET', '/api/modules/list')
+
+
+@scenario('/api/modules/establish', 'POST', role='teacher')
+def module_establish(context, worker):
+    return BenchRequest('POST', '/api/modules/establish', json_body={'course_name': context.unique('Course')})
+
+
+@scenario('/api/modules/details/<int:module_id>')
+def module_details(context, worker):
+    return BenchRequest('GET', f'/api/modules/details/{context.any_course()}')
+
+
+@scenario('/api/modules/join/<int:module_id>', 'POST')
+def module_join(context, worker):
+    status, headers, payload = worker.sessions['teacher'].send(BenchRequest(
+        'POST', '/api/modules/establish', json_body={'course_name': context.unique('Open Course')}
+    ))
+    return BenchRequest('POST', f"/api/modules/join/{created_id(payload, 'course', 'course_id')}")
+
+
+@scenario('/api/modules/roster/<int:module_id>', role='teacher')
+def module_roster(context, worker):
+    return BenchRequest('GET', f"/api/modules/roster/{context.course_taught_by(worker.user_ids['teacher'])}")
+
+
+@scenario('/api/modules/roster-import', 'POST', role='teacher')
+def roster_import(context, worker):
+    # Twenty new accounts and five existing students, all enrolled in one of
+    # the teacher's courses.
+    course_id = context.course_taught_by(worker.user_ids['teacher'])
+    lines = ['username,email,courses']
+    for _ in range(20):
+        username = context.unique('import')
+        lines.append(f'{username},{username}@bench.test,{course_id}')
+    for _ in range(5):
+        student_id = context.any_student()
+        lines.append(f'bench_student_{student_id},bench_student_{student_id}@bench.test,{course_id}')
+    return BenchRequest('POST', '/api/modules/roster-import', files={'file': ('roster.csv', '\n'.join(lines).encode())})
+
+
+@scenario('/api/modules/<int:module_id>/resources')
+def module_resources(context, worker):
+    return BenchRequest('GET', f'/api/modules/{context.any_course()}/resources')
+
+
+@scenario('/api/modules/<int:module_id>/resource-upload', 'POST', role='teacher')
+def resource_upload(context, worker):
+    course_id = context.course_taught_by(worker.user_ids['teacher'])
+    return BenchRequest('POST', f'/api/modules/{course_id}/resource-upload', form={
+        'title': context.unique('Handout'), 'content': 'Read chapters 1-3'
+    })
+
+
+@scenario('/api/modules/<int:module_id>/tasks')
+def module_tasks(context, worker):
+    return BenchRequest('GET', f'/api/modules/{context.any_course()}/tasks')
+
+
+@scenario('/api/modules/<int:module_id>/task-create', 'POST', role='teacher')
+def task_create(context, worker):
+    course_id = context.course_taught_by(worker.user_ids['teacher'])
+    return BenchRequest('POST', f'/api/modules/{course_id}/task-create', json_body={
+        'title': context.unique('Exercise'), 'points': 10
+    })
+
+
+# ===== ASSIGNMENTS =====
+
+@scenario('/api/tasks/<int:task_id>/deliver', 'POST')
+def task_deliver(context, worker):
+    course_id = context.course_taught_by(worker.user_ids['teacher'])
+    status, headers, payload = worker.sessions['teacher'].send(BenchRequest(
+        'POST', f'/api/modules/{course_id}/task-create', json_body={'title': context.unique('Homework')}
+    ))
+    task_id = created_id(payload, 'assignment', 'assignment_id')
+    return BenchRequest('POST', f'/api/tasks/{task_id}/deliver', form={'content': 'My answer'})
+
+
+@scenario('/api/tasks/<int:task_id>/responses', role='teacher')
+def task_responses(context, worker):
+    return BenchRequest('GET', f'/api/tasks/{context.any_assignment()}/responses')
+
+
+@scenario('/api/responses/<int:response_id>/evaluate', 'PUT', role='teacher')
+def response_evaluate(context, worker):
+    return BenchRequest('PUT', f'/api/responses/{context.any_submission()}/evaluate', json_body={
+        'grade': context.rng.randint(50, 100), 'feedback': 'Good work'
+    })
+
+
+@scenario('/api/responses/evaluate-batch', 'POST', role='teacher')
+def response_evaluate_batch(context, worker):
+    submission_ids = {context.any_submission() for _ in range(20)}
+    return BenchRequest('POST', '/api/responses/evaluate-batch', json_body={'evaluations': [
+        {'submission_id': submission_id, 'grade': context.rng.randint(50, 100), 'feedback': 'Good work'}
+        for submission_id in sorted(submission_ids)
+    ]})
+
+
+# ===== GAMIFICATION =====
+
+@scenario('/api/rankings/top-performers')
+def top_performers(context, worker):
+    return BenchRequest('GET', '/api/rankings/top-performers?limit=50')
+
+
+@scenario('/api/rankings/my-standing')
+def my_standing(context, worker):
+    return BenchRequest('GET', '/api/rankings/my-standing')
+
+
+@scenario('/api/rankings/standings', role='teacher')
+def scoped_standings(context, worker):
+    course_id = context.course_taught_by(worker.user_ids['teacher'])
+    return BenchRequest('GET', f'/api/rankings/standings?window=week&course_id={course_id}')
+
+
+@scenario('/api/live/stream')
+def live_stream(context, worker):
+    return BenchRequest('GET', '/api/live/stream', streaming=True)
+
+
+@scenario('/api/trophies/catalog')
+def trophy_catalog(context, worker):
+    return BenchRequest('GET', '/api/trophies/catalog')
+
+
+@scenario('/api/trophies/mine')
+def trophies_mine(context, worker):
+    return BenchRequest('GET', '/api/trophies/mine')
+
+
+@scenario('/api/milestones/mine')
+def milestones_mine(context, worker):
+    return BenchRequest('GET', '/api/milestones/mine')
+
+
+@scenario('/api/activities/catalog')
+def activity_catalog(context, worker):
+    return BenchRequest('GET', '/api/activities/catalog')
+
+
+@scenario('/api/activities/<int:activity_id>/participate', 'POST')
+def participate(context, worker):
+    return BenchRequest('POST', f'/api/activities/{context.any_game()}/participate', json_body={
+        'score': context.rng.randint(0, 100000)
+    })
+
+
+@scenario('/api/activities/participate-batch', 'POST')
+def participate_batch(context, worker):
+    return BenchRequest('POST', '/api/activities/participate-batch', json_body={'plays': [
+        {'game_id': context.any_game(), 'score': context.rng.randint(0, 100000)} for _ in range(20)
+    ]})
+
+
+@scenario('/api/activities/<int:activity_id>/records')
+def activity_records(context, worker):
+    return BenchRequest('GET', f'/api/activities/{context.any_game()}/records')
+
+
+# ===== UPLOADS =====
+
+def start_upload(worker, total_size=CHUNK_BYTES):
+    status, headers, payload = worker.sessions['student'].send(BenchRequest('POST', '/api/uploads/chunked', json_body={
+        'subfolder': 'submissions', 'filename': 'essay.pdf', 'total_size': total_size
+    }))
+    return created_id(payload, 'upload', 'upload_id')
+
+
+@scenario('/api/uploads/chunked', 'POST')
+def chunked_start(context, worker):
+    return BenchRequest('POST', '/api/uploads/chunked', json_body={
+        'subfolder': 'submissions', 'filename': 'essay.pdf', 'total_size': CHUNK_BYTES
+    })
+
+
+@scenario('/api/uploads/chunked/<upload_id>')
+def chunked_progress(context, worker):
+    return BenchRequest('GET', f'/api/uploads/chunked/{start_upload(worker)}')
+
+
+@scenario('/api/uploads/chunked/<upload_id>', 'PUT')
+def chunked_append(context, worker):
+    return BenchRequest('PUT', f'/api/uploads/chunked/{start_upload(worker)}?offset=0',
+                        raw=context.rng.randbytes(CHUNK_BYTES))
+
+
+@scenario('/uploads/<path:asset_path>', role=None)
+def stored_asset(context, worker):
+    return BenchRequest('GET', context.asset_url)
+
+
+@scenario('/uploads/<path:asset_path>', role=None, name='GET /uploads/thumbnails/<variant>')
+def stored_thumbnail(context, worker):
+    return BenchRequest('GET', context.thumbnail_url)
+
+
+def uncovered_routes(app):
+    covered = {(entry.rule, entry.method) for entry in SCENARIOS}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (rule.rule, method) not in covered:
+                missing.append(f'{method} {rule.rule}')
+    return missing
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmarks for the EduGamify API.
+
+  python benchmarks/run_benchmarks.py seed --out bench.db --game-scores 2000000
+  python benchmarks/run_benchmarks.py run --database bench.db --save baseline.json
+  python benchmarks/run_benchmarks.py run --database bench.db --mode http --concurrency 8 --compare baseline.json
+  python benchmarks/run_benchmarks.py compare baseline.json current.json
+
+See TESTING.md for what is measured and how to read the report.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'backend'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from bench_dataset import BENCH_PASSWORD, DatasetShape, generate_dataset
+from bench_scenarios import SCENARIOS, BenchContext, BenchRequest, uncovered_routes
+
+REQUEST_ID_HEADER = 'X-Bench-Request'
+QUERY_COUNTS = {}
+request_ids = itertools.count(1)
+
+
+def load_application(database_path, storage_dir):
+    # The app reads its settings from the environment at import time.
+    os.environ['DATABASE_URL'] = 'sqlite:///' + database_path
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    os.environ.setdefault('JOB_WORKERS', '0')
+    from app import web_application
+    from flask import g, has_request_context, request
+
+    web_application.config['FILE_STORAGE_PATH'] = storage_dir
+    for subfolder in ('profiles', 'coursework', 'submissions', 'blobs', 'partial', 'thumbnails'):
+        os.makedirs(os.path.join(storage_dir, subfolder), exist_ok=True)
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count_query(*positional_args):
+        if has_request_context():
+            g.bench_queries = g.get('bench_queries', 0) + 1
+
+    @web_application.teardown_request
+    def store_query_count(error):
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        if request_id:
+            QUERY_COUNTS[request_id] = g.get('bench_queries', 0)
+
+    return web_application
+
+
+class TestClientSession:
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def send(self, bench_request, request_id=None):
+        headers = {REQUEST_ID_HEADER: request_id} if request_id else {}
+        response = self.client.open(bench_request.path, method=bench_request.method, data=bench_request.body,
+                                    content_type=bench_request.content_type, headers=headers,
+                                    buffered=not bench_request.streaming)
+        if bench_request.streaming:
+            payload = next(iter(response.response), b'')
+            response.close()
+        else:
+            payload = response.get_data()
+        return response.status_code, response.headers, payload
+
+
+class HttpSession:
+    # One keep-alive connection with its own cookie jar.
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookies = SimpleCookie()
+        self.connection = None
+
+    def send(self, bench_request, request_id=None):
+        headers = {}
+        if request_id:
+            headers[REQUEST_ID_HEADER] = request_id
+        if bench_request.content_type:
+            headers['Content-Type'] = bench_request.content_type
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={morsel.value}' for name, morsel in self.cookies.items())
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(bench_request.method, bench_request.path, bench_request.body, headers)
+                response = self.connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+        for cookie_header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(cookie_header)
+        if bench_request.streaming:
+            payload = response.readline()
+            self.connection.close()
+            self.connection = None
+        else:
+            payload = response.read()
+            if response.will_close:
+                self.connection.close()
+                self.connection = None
+        return response.status, response.headers, payload
+
+
+class BenchWorker:
+    # A load-generating client signed in once per role. Each worker uses its
+    # own student and teacher so concurrent writers do not collide.
+
+    def __init__(self, index, shape, open_session):
+        self.open_session = open_session
+        self.user_ids = {
+            'admin': 1,
+            'teacher': shape.first_teacher_id + index % shape.teachers,
+            'student': shape.first_student_id + index % shape.students
+        }
+        self.usernames = {
+            'admin': 'bench_admin_1',
+            'teacher': f"bench_teacher_{self.user_ids['teacher']}",
+            'student': f"bench_student_{self.user_ids['student']}"
+        }
+        self.sessions = {None: open_session()}
+        for role in ('admin', 'teacher', 'student'):
+            self.sessions[role] = self.fresh_session(role)
+
+    def fresh_session(self, role):
+        bench_session = self.open_session()
+        status, headers, payload = bench_session.send(BenchRequest('POST', '/api/auth/signin', json_body={
+            'username': self.usernames[role], 'password': BENCH_PASSWORD
+        }))
+        if status != 200:
+            raise RuntimeError(f'Could not sign in as {self.usernames[role]}: {status} {payload[:200]!r}')
+        return bench_session
+
+
+def timed_call(worker, entry, bench_request):
+    bench_session = bench_request.session or worker.sessions[entry.role]
+    request_id = f'{threading.get_ident()}-{next(request_ids)}'
+    started = time.perf_counter()
+    status, headers, payload = bench_session.send(bench_request, request_id)
+    elapsed = time.perf_counter() - started
+    return elapsed, status, QUERY_COUNTS.pop(request_id, 0)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def summarize(samples, wall_seconds):
+    latencies = sorted(elapsed * 1000 for elapsed, status, queries in samples)
+    errors = sum(1 for elapsed, status, queries in samples if status >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'throughput_rps': round(len(samples) / wall_seconds, 1) if wall_seconds else 0.0,
+        'queries_per_request': round(sum(queries for elapsed, status, queries in samples) / len(samples), 2)
+        if samples else 0.0
+    }
+
+
+def run_scenario(context, workers, entry, request_count, warmup):
+    # Requests are built first, including any untimed setup they need (a
+    # fresh course to join, an upload to append to), so the timed phase and
+    # its throughput only cover the requests themselves.
+    for _ in range(warmup):
+        timed_call(workers[0], entry, entry.build(context, workers[0]))
+
+    shares = [request_count // len(workers) + (1 if n < request_count % len(workers) else 0)
+              for n in range(len(workers))]
+    prepared = [[entry.build(context, worker) for _ in range(share)] for worker, share in zip(workers, shares)]
+    samples = []
+    samples_lock = threading.Lock()
+
+    def drive(worker, bench_requests):
+        collected = [timed_call(worker, entry, bench_request) for bench_request in bench_requests]
+        with samples_lock:
+            samples.extend(collected)
+
+    started = time.perf_counter()
+    if len(workers) == 1:
+        drive(workers[0], prepared[0])
+    else:
+        threads = [threading.Thread(target=drive, args=(worker, bench_requests))
+                   for worker, bench_requests in zip(workers, prepared)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+def prepare_assets(context, worker):
+    status, headers, payload = worker.sessions['admin'].send(BenchRequest(
+        'POST', '/api/profile/avatar-upload', files={'picture': ('bench.png', context.picture)}
+    ))
+    uploaded = json.loads(payload)
+    context.asset_url = uploaded['url']
+    context.thumbnail_url = uploaded['avatar_url']
+    worker.sessions[None].send(BenchRequest('GET', context.thumbnail_url))
+
+
+def start_http_server(app):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *positional_args):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def print_report(results):
+    print(f"{'endpoint':60} {'reqs':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'req/s':>8} {'queries':>8}")
+    for name, stats in results.items():
+        print(f"{name:60} {stats['requests']:6} {stats['errors']:4} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} "
+              f"{stats['p99_ms']:9.2f} {stats['throughput_rps']:8.1f} {stats['queries_per_request']:8.2f}")
+
+
+def compare_reports(baseline, current, max_regression):
+    # A regression is a p95 slower by more than max_regression percent (and
+    # at least a millisecond), or more queries per request than before.
+    for setting in ('mode', 'concurrency', 'dataset'):
+        if baseline.get(setting) != current.get(setting):
+            print(f'Warning: reports differ in {setting}; timings are not directly comparable')
+    regressions = []
+    print(f"{'endpoint':60} {'p95 before':>11} {'p95 now':>9} {'change':>8} {'queries':>12}")
+    for name, stats in current['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            print(f'{name:60} {"new":>11}')
+            continue
+        change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+        queries = f"{before['queries_per_request']:g} -> {stats['queries_per_request']:g}"
+        slower = change > max_regression and stats['p95_ms'] - before['p95_ms'] >= 1
+        more_queries = stats['queries_per_request'] > before['queries_per_request']
+        flag = '  REGRESSION' if slower or more_queries else ''
+        print(f"{name:60} {before['p95_ms']:11.2f} {stats['p95_ms']:9.2f} {change:+7.1f}% {queries:>12}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def shape_from_arguments(arguments):
+    return DatasetShape(
+        students=arguments.students, teachers=arguments.teachers, courses=arguments.courses,
+        enrollments_per_student=arguments.enrollments_per_student,
+        submissions_per_student=arguments.submissions_per_student,
+        games=arguments.games, game_scores=arguments.game_scores
+    )
+
+
+def seed_command(arguments):
+    if os.path.exists(arguments.out):
+        sys.exit(f'{arguments.out} already exists')
+    shape = shape_from_arguments(arguments)
+    started = time.perf_counter()
+    engine = create_engine('sqlite:///' + os.path.abspath(arguments.out))
+    generate_dataset(engine, shape, arguments.seed, announce=print)
+    engine.dispose()
+    with open(arguments.out + '.json', 'w') as shape_file:
+        json.dump({'seed': arguments.seed, 'dataset': shape.as_dict()}, shape_file, indent=2)
+    print(f'Dataset written to {arguments.out} in {time.perf_counter() - started:.1f}s')
+
+
+def run_command(arguments):
+    scratch_dir = tempfile.mkdtemp(prefix='edugamify_bench_')
+    database_path = os.path.join(scratch_dir, 'bench.db')
+    try:
+        if arguments.database:
+            # Runs write to the data, so every run starts from a fresh copy.
+            with open(arguments.database + '.json') as shape_file:
+                described = json.load(shape_file)
+            shape, seed = DatasetShape(**described['dataset']), described['seed']
+            shutil.copyfile(arguments.database, database_path)
+        else:
+            shape, seed = shape_from_arguments(arguments), arguments.seed
+            engine = create_engine('sqlite:///' + database_path)
+            generate_dataset(engine, shape, seed, announce=print)
+            engine.dispose()
+
+        app = load_application(database_path, os.path.join(scratch_dir, 'uploads'))
+        context = BenchContext(shape, seed)
+        server = None
+        if arguments.mode == 'http':
+            server = start_http_server(app)
+            open_session = lambda: HttpSession('127.0.0.1', server.server_port)
+            concurrency = arguments.concurrency
+        else:
+            open_session = lambda: TestClientSession(app)
+            concurrency = 1
+
+        workers = [BenchWorker(index, shape, open_session) for index in range(concurrency)]
+        prepare_assets(context, workers[0])
+
+        selected = [entry for entry in SCENARIOS if not arguments.only or any(
+            pattern in entry.name for pattern in arguments.only
+        )]
+        results = {}
+        for entry in selected:
+            results[entry.name] = run_scenario(context, workers, entry, arguments.requests, arguments.warmup)
+        if server is not None:
+            server.shutdown()
+
+        print_report(results)
+        missing = uncovered_routes(app)
+        if missing:
+            print('Routes without a benchmark scenario: ' + ', '.join(missing))
+
+        report = {
+            'generated_at': datetime.utcnow().isoformat(),
+            'mode': arguments.mode,
+            'concurrency': concurrency,
+            'requests_per_endpoint': arguments.requests,
+            'seed': seed,
+            'dataset': shape.as_dict(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'endpoints': results,
+            'uncovered_routes': missing
+        }
+        if arguments.save:
+            with open(arguments.save, 'w') as report_file:
+                json.dump(report, report_file, indent=2)
+            print(f'Report saved to {arguments.save}')
+        if arguments.compare:
+            with open(arguments.compare) as baseline_file:
+                regressions = compare_reports(json.load(baseline_file), report, arguments.max_regression)
+            if regressions:
+                sys.exit(f'{len(regressions)} endpoint(s) regressed')
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+def compare_command(arguments):
+    with open(arguments.baseline) as baseline_file, open(arguments.current) as current_file:
+        regressions = compare_reports(json.load(baseline_file), json.load(current_file), arguments.max_regression)
+    if regressions:
+        sys.exit(f'{len(regressions)} endpoint(s) regressed')
+
+
+def add_shape_arguments(parser):
+    parser.add_argument('--seed', type=int, default=7, help='Random seed for the dataset and request mix')
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--enrollments-per-student', type=int, default=3)
+    parser.add_argument('--submissions-per-student', type=int, default=4)
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--game-scores', type=int, default=1000000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EduGamify load and latency benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='Generate a benchmark dataset into a SQLite file')
+    seed_parser.add_argument('--out', required=True, help='SQLite file to create')
+    add_shape_arguments(seed_parser)
+    seed_parser.set_defaults(handler=seed_command)
+
+    run_parser = commands.add_parser('run', help='Benchmark every API route')
+    run_parser.add_argument('--database', help='Dataset made by the seed command (otherwise one is generated)')
+    run_parser.add_argument('--mode', choices=('client', 'http'), default='client',
+                            help='Flask test client in process, or concurrent HTTP against a threaded server')
+    run_parser.add_argument('--concurrency', type=int, default=8, help='Parallel clients in http mode')
+    run_parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint')
+    run_parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+    run_parser.add_argument('--only', action='append', help='Only endpoints whose name contains this text')
+    run_parser.add_argument('--save', help='Write the report to this JSON file')
+    run_parser.add_argument('--compare', help='Compare against a saved report')
+    run_parser.add_argument('--max-regression', type=float, default=20.0, help='Allowed p95 slowdown in percent')
+    add_shape_arguments(run_parser)
+    run_parser.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser('compare', help='Diff two saved reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--max-regression', type=float, default=20.0)
+    compare_parser.set_defaults(handler=compare_command)
+
+    arguments = parser.parse_args()
+    arguments.handler(arguments)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,9 @@ CREATE TABLE IF NOT EXISTS users (
     role ENUM('admin', 'teacher', 'student') NOT NULL,
     profile_picture VARCHAR(255),
     points INT DEFAULT 0,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    access_version INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_users_role_points (role, points)
 );
 
 -- Password reset tokens
@@ -23,7 +25,8 @@ CREATE TABLE IF NOT EXISTS password_reset_tokens (
     expires_at TIMESTAMP NOT NULL,
     used BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_password_reset_tokens_token_used (token, used)
 );
 
 -- Classes/Courses
@@ -33,7 +36,8 @@ CREATE TABLE IF NOT EXISTS courses (
     description TEXT,
     teacher_id INT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (teacher_id) REFERENCES users(user_id) ON DELETE SET NULL
+    FOREIGN KEY (teacher_id) REFERENCES users(user_id) ON DELETE SET NULL,
+    INDEX ix_courses_teacher (teacher_id)
 );
 
 -- Enrollments
@@ -43,7 +47,9 @@ CREATE TABLE IF NOT EXISTS enrollments (
     course_id INT NOT NULL,
     enrollment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-    FOREIGN KEY (course_id) REFERENCES courses(course_id) ON DELETE CASCADE
+    FOREIGN KEY (course_id) REFERENCES courses(course_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_enrollments_user_course (user_id, course_id),
+    INDEX ix_enrollments_course (course_id)
 );
 
 -- Coursework/Notes
@@ -56,7 +62,8 @@ CREATE TABLE IF NOT EXISTS coursework (
     created_by INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (course_id) REFERENCES courses(course_id) ON DELETE CASCADE,
-    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_coursework_course (course_id)
 );
 
 -- Assignments
@@ -70,7 +77,8 @@ CREATE TABLE IF NOT EXISTS assignments (
     created_by INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (course_id) REFERENCES courses(course_id) ON DELETE CASCADE,
-    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE
+    FOREIGN KEY (created_by) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_assignments_course (course_id)
 );
 
 -- Assignment Submissions
@@ -87,7 +95,8 @@ CREATE TABLE IF NOT EXISTS submissions (
     graded_at TIMESTAMP,
     FOREIGN KEY (assignment_id) REFERENCES assignments(assignment_id) ON DELETE CASCADE,
     FOREIGN KEY (student_id) REFERENCES users(user_id) ON DELETE CASCADE,
-    FOREIGN KEY (graded_by) REFERENCES users(user_id) ON DELETE SET NULL
+    FOREIGN KEY (graded_by) REFERENCES users(user_id) ON DELETE SET NULL,
+    UNIQUE KEY uq_submissions_assignment_student (assignment_id, student_id)
 );
 
 -- Badges
@@ -107,18 +116,21 @@ CREATE TABLE IF NOT EXISTS user_badges (
     badge_id INT NOT NULL,
     earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-    FOREIGN KEY (badge_id) REFERENCES badges(badge_id) ON DELETE CASCADE
+    FOREIGN KEY (badge_id) REFERENCES badges(badge_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_user_badges_user_badge (user_id, badge_id)
 );
 
 -- Achievements
 CREATE TABLE IF NOT EXISTS achievements (
     achievement_id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT NOT NULL,
+    milestone_key VARCHAR(80),
     title VARCHAR(200) NOT NULL,
     description TEXT,
     points INT DEFAULT 0,
     achieved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    UNIQUE KEY uq_achievements_user_milestone (user_id, milestone_key)
 );
 
 -- Games
@@ -139,5 +151,152 @@ CREATE TABLE IF NOT EXISTS game_scores (
     score INT NOT NULL,
     played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_game_scores_game_score (game_id, score),
+    INDEX ix_game_scores_played_at (played_at)
+);
+
+-- Plays moved out of game_scores by compaction (see backend/play_history.py)
+CREATE TABLE IF NOT EXISTS game_scores_archive (
+    score_id INT PRIMARY KEY,
+    game_id INT NOT NULL,
+    user_id INT NOT NULL,
+    score INT NOT NULL,
+    played_at TIMESTAMP NULL,
+    FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_game_scores_archive_game_score (game_id, score)
+);
+
+-- Compacted plays per user, game and day
+CREATE TABLE IF NOT EXISTS game_score_rollups (
+    user_id INT NOT NULL,
+    game_id INT NOT NULL,
+    play_day DATE NOT NULL,
+    plays INT NOT NULL DEFAULT 0,
+    score_total BIGINT NOT NULL DEFAULT 0,
+    best_score INT NOT NULL,
+    PRIMARY KEY (user_id, game_id, play_day),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE,
+    INDEX ix_game_score_rollups_day (play_day)
+);
+
+-- Points Ledger (append-only record of every point award)
+CREATE TABLE IF NOT EXISTS points_events (
+    event_id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    delta INT NOT NULL,
+    source_type VARCHAR(30) NOT NULL,
+    source_id INT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_points_events_user_created (user_id, created_at)
+);
+
+-- Points per user for the current day, week and month (see backend/point_buckets.py)
+CREATE TABLE IF NOT EXISTS points_buckets (
+    user_id INT NOT NULL,
+    granularity VARCHAR(5) NOT NULL,
+    period_start DATE NOT NULL,
+    points INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, granularity, period_start),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_points_buckets_period_points (granularity, period_start, points)
+);
+
+-- Per-game top-K high scores (maintained on write, see backend/highscore_board.py)
+CREATE TABLE IF NOT EXISTS game_highscores (
+    score_id INT PRIMARY KEY,
+    game_id INT NOT NULL,
+    user_id INT NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    score INT NOT NULL,
+    played_at TIMESTAMP NULL,
+    FOREIGN KEY (game_id) REFERENCES games(game_id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    INDEX ix_game_highscores_game_score (game_id, score)
+);
+
+-- Content-addressed upload store (see backend/asset_store.py)
+CREATE TABLE IF NOT EXISTS stored_blobs (
+    digest CHAR(64) PRIMARY KEY,
+    byte_size BIGINT NOT NULL,
+    ref_count INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    released_at TIMESTAMP NULL
+);
+
+-- Resumable chunked uploads in progress or awaiting a claim
+CREATE TABLE IF NOT EXISTS chunked_uploads (
+    upload_id CHAR(64) PRIMARY KEY,
+    user_id INT NOT NULL,
+    subfolder VARCHAR(20) NOT NULL,
+    original_name VARCHAR(255) NOT NULL,
+    total_size BIGINT NOT NULL,
+    received_size BIGINT NOT NULL DEFAULT 0,
+    file_url VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Per-user milestone rule counters (see backend/milestone_rules.py)
+CREATE TABLE IF NOT EXISTS milestone_counters (
+    user_id INT NOT NULL,
+    counter_key VARCHAR(80) NOT NULL,
+    period VARCHAR(10) NOT NULL DEFAULT '',
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, counter_key, period),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+);
+
+-- Durable background jobs (see backend/job_queue.py)
+CREATE TABLE IF NOT EXISTS job_queue (
+    job_id INT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    idempotency_key VARCHAR(150) UNIQUE,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP NULL,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP NULL,
+    INDEX ix_job_queue_status_run_after (status, run_after)
+);
+
+-- Sharded platform-wide counters maintained on write (see backend/platform_stats.py)
+CREATE TABLE IF NOT EXISTS platform_counters (
+    counter_key VARCHAR(40) NOT NULL,
+    shard SMALLINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (counter_key, shard)
+);
+
+-- Periodically refreshed platform aggregates (plays per day, points distribution)
+CREATE TABLE IF NOT EXISTS platform_snapshots (
+    snapshot_key VARCHAR(40) PRIMARY KEY,
+    payload TEXT NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL
+);
+
+-- Applied schema migrations (see backend/schema_migrations.py)
+CREATE TABLE IF NOT EXISTS schema_versions (
+    version INT PRIMARY KEY,
+    name VARCHAR(200) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This file already contains everything up to the listed migrations
+INSERT IGNORE INTO schema_versions (version, name) VALUES
+    (1, 'hot path indexes and uniqueness constraints'),
+    (2, 'points ledger and access claim versions'),
+    (3, 'per-game top-K high score table'),
+    (4, 'content-addressed upload store'),
+    (5, 'durable job queue'),
+    (6, 'milestone counters and award keys'),
+    (7, 'windowed point buckets'),
+    (8, 'play history archive and daily roll-ups'),
+    (9, 'platform statistics counters and snapshot'),
+    (10, 'play time index for daily play counts');
\ No newline at end of file
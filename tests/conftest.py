@@ -0,0 +1,25 @@
+import os
+import sys
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='session')
+def web_application(tmp_path_factory):
+    # The app reads its settings from the environment at import time, so the
+    # database is pointed at a scratch SQLite file before the first import.
+    storage_dir = tmp_path_factory.mktemp('storage')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + str(storage_dir / 'test.sqlite')
+    os.environ.setdefault('SECRET_KEY', 'test-secret')
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    os.environ['JOB_WORKERS'] = '0'
+    from app import web_application, storage_layer
+
+    web_application.config['FILE_STORAGE_PATH'] = str(storage_dir)
+    for subfolder in ('profiles', 'coursework', 'submissions', 'blobs', 'partial', 'thumbnails'):
+        os.makedirs(storage_dir / subfolder, exist_ok=True)
+    with web_application.app_context():
+        storage_layer.create_all()
+    return web_application
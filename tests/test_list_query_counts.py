@@ -0,0 +1,124 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SMALL, LARGE = 2, 30
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *positional_args):
+        self.count += 1
+
+
+@pytest.fixture
+def count_queries():
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    yield counter
+    event.remove(Engine, 'before_cursor_execute', counter)
+
+
+@pytest.fixture(scope='module')
+def world(web_application):
+    from models import (storage_layer, PersonEntity, LearningModule, ClassMembership, TaskItem, WorkSubmission,
+                        TrophyDefinition, TrophyOwnership, InteractiveActivity, ActivityHighscore)
+    from credential_pool import hash_credential
+
+    password_hash = hash_credential('secret', 4)
+
+    def person(username, role):
+        entity = PersonEntity(username=username, email=f'{username}@example.com', role=role,
+                              password_hash=password_hash)
+        storage_layer.session.add(entity)
+        return entity
+
+    with web_application.app_context():
+        teacher = person('teacher', 'teacher')
+        students = [person(f'student{number}', 'student') for number in range(LARGE)]
+        storage_layer.session.flush()
+
+        # One course, assignment, player, badge holder and game per size, so
+        # the same endpoint can be read with SMALL and with LARGE rows.
+        world = {}
+        for size in (SMALL, LARGE):
+            course = LearningModule(course_name=f'Course {size}', teacher_id=teacher.user_id)
+            storage_layer.session.add(course)
+            storage_layer.session.flush()
+            task = TaskItem(course_id=course.course_id, title=f'Task {size}', created_by=teacher.user_id)
+            game = InteractiveActivity(name=f'Game {size}', points_per_play=1)
+            storage_layer.session.add_all([task, game])
+            storage_layer.session.flush()
+
+            holder = students[0] if size == SMALL else students[1]
+            for position, student in enumerate(students[:size]):
+                storage_layer.session.add_all([
+                    ClassMembership(user_id=student.user_id, course_id=course.course_id),
+                    WorkSubmission(assignment_id=task.assignment_id, student_id=student.user_id, content='work'),
+                    ActivityHighscore(game_id=game.game_id, user_id=student.user_id, username=student.username,
+                                      score=position, score_id=size * 1000 + position, played_at=datetime.utcnow())
+                ])
+            for number in range(size):
+                badge = TrophyDefinition(name=f'Badge {size}-{number}', points_required=10 ** 6)
+                storage_layer.session.add(badge)
+                storage_layer.session.flush()
+                storage_layer.session.add(TrophyOwnership(user_id=holder.user_id, badge_id=badge.badge_id))
+            # The holder of the large set of badges is also enrolled in many courses.
+            if size == LARGE:
+                for extra in range(LARGE):
+                    extra_course = LearningModule(course_name=f'Extra {extra}', teacher_id=teacher.user_id)
+                    storage_layer.session.add(extra_course)
+                    storage_layer.session.flush()
+                    storage_layer.session.add(ClassMembership(user_id=holder.user_id, course_id=extra_course.course_id))
+
+            world[size] = {'course': course.course_id, 'task': task.assignment_id, 'game': game.game_id,
+                           'holder': holder.username}
+        storage_layer.session.commit()
+    return world
+
+
+def signed_in(web_application, username):
+    client = web_application.test_client()
+    response = client.post('/api/auth/signin', json={'username': username, 'password': 'secret'})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+def queries_for(client, count_queries, path):
+    # The first read warms per-process caches (session claims, catalogs);
+    # the second is the one measured.
+    assert client.get(path).status_code == 200
+    count_queries.count = 0
+    response = client.get(path)
+    assert response.status_code == 200
+    return count_queries.count, response.get_json()
+
+
+ENDPOINTS = [
+    ('roster', lambda ids: f"/api/modules/roster/{ids['course']}", 'students'),
+    ('task responses', lambda ids: f"/api/tasks/{ids['task']}/responses", 'submissions'),
+    ('game records', lambda ids: f"/api/activities/{ids['game']}/records", 'highscores'),
+]
+
+
+@pytest.mark.parametrize('name, path_for, collection', ENDPOINTS, ids=[entry[0] for entry in ENDPOINTS])
+def test_teacher_list_query_count_does_not_grow(web_application, world, count_queries, name, path_for, collection):
+    client = signed_in(web_application, 'teacher')
+    small_queries, small_body = queries_for(client, count_queries, path_for(world[SMALL]))
+    large_queries, large_body = queries_for(client, count_queries, path_for(world[LARGE]))
+
+    assert len(large_body[collection]) > len(small_body[collection])
+    assert large_queries == small_queries
+
+
+@pytest.mark.parametrize('path, collection', [('/api/trophies/mine', 'badges'), ('/api/modules/list', 'courses')])
+def test_student_list_query_count_does_not_grow(web_application, world, count_queries, path, collection):
+    small_queries, small_body = queries_for(signed_in(web_application, world[SMALL]['holder']), count_queries, path)
+    large_queries, large_body = queries_for(signed_in(web_application, world[LARGE]['holder']), count_queries, path)
+
+    assert len(large_body[collection]) > len(small_body[collection])
+    assert large_queries == small_queries